@@ -0,0 +1,53 @@
+"""Add saldos_clientes table
+
+Revision ID: 2757cb6a402f
+Revises: 90f35b3e72f0
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2757cb6a402f'
+down_revision: Union[str, None] = '90f35b3e72f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('saldos_clientes',
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('pendiente_prestamos', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False),
+        sa.Column('pendiente_abonos', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False),
+        sa.Column('cantidad_pendientes', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total_prestamos', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False),
+        sa.Column('total_abonos', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('cliente_id')
+    )
+
+    # Backfill desde los movimientos existentes
+    op.execute("""
+        INSERT INTO saldos_clientes (
+            cliente_id, pendiente_prestamos, pendiente_abonos, cantidad_pendientes,
+            total_prestamos, total_abonos
+        )
+        SELECT
+            cliente_id,
+            COALESCE(SUM(CASE WHEN procesado = false AND tipo = 'PRESTAMO' THEN monto ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN procesado = false AND tipo <> 'PRESTAMO' THEN monto ELSE 0 END), 0),
+            SUM(CASE WHEN procesado = false THEN 1 ELSE 0 END),
+            COALESCE(SUM(CASE WHEN tipo = 'PRESTAMO' THEN monto ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN tipo <> 'PRESTAMO' THEN monto ELSE 0 END), 0)
+        FROM movimientos_pendientes
+        GROUP BY cliente_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('saldos_clientes')
@@ -0,0 +1,44 @@
+"""Add pending movements indexes
+
+Revision ID: 5d1e8a4b9c27
+Revises: 2757cb6a402f
+Create Date: 2026-10-17 13:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1e8a4b9c27'
+down_revision: Union[str, None] = '2757cb6a402f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # El índice parcial exige que procesado nunca sea NULL
+    op.execute("UPDATE movimientos_pendientes SET procesado = false WHERE procesado IS NULL")
+    with op.batch_alter_table('movimientos_pendientes') as batch_op:
+        batch_op.alter_column('procesado',
+            existing_type=sa.Boolean(),
+            nullable=False,
+            server_default=sa.text('false'))
+
+    op.create_index(op.f('ix_movimientos_pendientes_cliente_id'), 'movimientos_pendientes', ['cliente_id'], unique=False)
+    op.create_index('ix_movimientos_pendientes_cliente_created_pendientes', 'movimientos_pendientes',
+        ['cliente_id', 'created_at'], unique=False,
+        postgresql_where=sa.text('procesado = false'),
+        sqlite_where=sa.text('procesado = 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movimientos_pendientes_cliente_created_pendientes', table_name='movimientos_pendientes')
+    op.drop_index(op.f('ix_movimientos_pendientes_cliente_id'), table_name='movimientos_pendientes')
+    with op.batch_alter_table('movimientos_pendientes') as batch_op:
+        batch_op.alter_column('procesado',
+            existing_type=sa.Boolean(),
+            nullable=True,
+            server_default=None)
@@ -0,0 +1,32 @@
+"""Add resumenes_conversacion table
+
+Revision ID: 6c0e5b7d9a21
+Revises: a3d92f61c7e8
+Create Date: 2026-10-17 16:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c0e5b7d9a21'
+down_revision: Union[str, None] = 'a3d92f61c7e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('resumenes_conversacion',
+        sa.Column('conversacion_id', sa.String(length=64), nullable=False),
+        sa.Column('texto', sa.Text(), server_default='', nullable=False),
+        sa.Column('hasta_id', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('conversacion_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('resumenes_conversacion')
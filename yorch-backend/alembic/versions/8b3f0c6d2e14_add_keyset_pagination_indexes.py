@@ -0,0 +1,30 @@
+"""Add keyset pagination indexes
+
+Revision ID: 8b3f0c6d2e14
+Revises: 5d1e8a4b9c27
+Create Date: 2026-10-17 13:45:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b3f0c6d2e14'
+down_revision: Union[str, None] = '5d1e8a4b9c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_clientes_nombre_id', 'clientes', ['nombre', 'id'], unique=False)
+    op.create_index('ix_movimientos_pendientes_created_at_id', 'movimientos_pendientes', ['created_at', 'id'], unique=False)
+    op.create_index('ix_escrituras_created_at_id', 'escrituras', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_escrituras_created_at_id', table_name='escrituras')
+    op.drop_index('ix_movimientos_pendientes_created_at_id', table_name='movimientos_pendientes')
+    op.drop_index('ix_clientes_nombre_id', table_name='clientes')
@@ -0,0 +1,58 @@
+"""Add nombre_normalizado to clientes
+
+Revision ID: 90f35b3e72f0
+Revises: c7237ff56993
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '90f35b3e72f0'
+down_revision: Union[str, None] = 'c7237ff56993'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def normalizar_nombre(nombre: str) -> str:
+    # Copia de app.core.texto.normalizar_nombre: la migración no debe cambiar si la app cambia
+    return " ".join(nombre.lower().split())
+
+
+def upgrade() -> None:
+    op.add_column('clientes', sa.Column('nombre_normalizado', sa.String(length=255), nullable=True))
+
+    # Backfill. Si ya existen duplicados se conserva el cliente más antiguo y a los
+    # demás se les agrega el id, para que el índice único pueda crearse.
+    conn = op.get_bind()
+    clientes = sa.table(
+        'clientes',
+        sa.column('id', sa.Integer),
+        sa.column('nombre', sa.String),
+        sa.column('nombre_normalizado', sa.String),
+    )
+    vistos = set()
+    filas = conn.execute(sa.select(clientes.c.id, clientes.c.nombre).order_by(clientes.c.id)).all()
+    for cliente_id, nombre in filas:
+        normalizado = normalizar_nombre(nombre)
+        if normalizado in vistos:
+            print(f"[MIGRACION] Nombre duplicado '{nombre}' (id {cliente_id}); se marca con su id")
+            normalizado = f"{normalizado} #{cliente_id}"
+        vistos.add(normalizado)
+        conn.execute(
+            clientes.update().where(clientes.c.id == cliente_id).values(nombre_normalizado=normalizado)
+        )
+
+    with op.batch_alter_table('clientes') as batch_op:
+        batch_op.alter_column('nombre_normalizado', existing_type=sa.String(length=255), nullable=False)
+    op.create_index(op.f('ix_clientes_nombre_normalizado'), 'clientes', ['nombre_normalizado'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_clientes_nombre_normalizado'), table_name='clientes')
+    with op.batch_alter_table('clientes') as batch_op:
+        batch_op.drop_column('nombre_normalizado')
@@ -0,0 +1,47 @@
+"""Add trabajos table
+
+Revision ID: 9d4e7a2c5b18
+Revises: f2b8c4d1e6a3
+Create Date: 2026-10-17 18:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e7a2c5b18'
+down_revision: Union[str, None] = 'f2b8c4d1e6a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('trabajos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=50), nullable=False),
+        sa.Column('estado', sa.String(length=20), server_default='pendiente', nullable=False),
+        sa.Column('parametros', sa.JSON(), nullable=False),
+        sa.Column('resultado', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('intentos', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('max_intentos', sa.Integer(), nullable=False),
+        sa.Column('disponible_desde', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('webhook_url', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('iniciado_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('terminado_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_trabajos_id'), 'trabajos', ['id'], unique=False)
+    op.create_index('ix_trabajos_estado_disponible_desde', 'trabajos', ['estado', 'disponible_desde'], unique=False)
+    op.create_index('ix_trabajos_created_at_id', 'trabajos', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_trabajos_created_at_id', table_name='trabajos')
+    op.drop_index('ix_trabajos_estado_disponible_desde', table_name='trabajos')
+    op.drop_index(op.f('ix_trabajos_id'), table_name='trabajos')
+    op.drop_table('trabajos')
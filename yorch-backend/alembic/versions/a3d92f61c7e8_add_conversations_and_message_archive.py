@@ -0,0 +1,50 @@
+"""Add conversations to mensajes and mensajes_archivados table
+
+Revision ID: a3d92f61c7e8
+Revises: e41a7c9f0b53
+Create Date: 2026-10-17 15:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d92f61c7e8'
+down_revision: Union[str, None] = 'e41a7c9f0b53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Los mensajes existentes quedan en la conversación 'general'
+    op.add_column('mensajes', sa.Column('conversacion_id', sa.String(length=64), server_default='general', nullable=False))
+    op.create_index('ix_mensajes_conversacion_id_id', 'mensajes', ['conversacion_id', 'id'], unique=False)
+    # El archivado filtra y cuenta los mensajes antiguos por fecha
+    op.create_index('ix_mensajes_created_at', 'mensajes', ['created_at'], unique=False)
+
+    op.create_table('mensajes_archivados',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversacion_id', sa.String(length=64), nullable=False),
+        sa.Column('desde_id', sa.Integer(), nullable=False),
+        sa.Column('hasta_id', sa.Integer(), nullable=False),
+        sa.Column('desde_fecha', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('hasta_fecha', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('cantidad', sa.Integer(), nullable=False),
+        sa.Column('contenido', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_mensajes_archivados_id'), 'mensajes_archivados', ['id'], unique=False)
+    op.create_index(op.f('ix_mensajes_archivados_conversacion_id'), 'mensajes_archivados', ['conversacion_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_mensajes_archivados_conversacion_id'), table_name='mensajes_archivados')
+    op.drop_index(op.f('ix_mensajes_archivados_id'), table_name='mensajes_archivados')
+    op.drop_table('mensajes_archivados')
+    op.drop_index('ix_mensajes_created_at', table_name='mensajes')
+    op.drop_index('ix_mensajes_conversacion_id_id', table_name='mensajes')
+    op.drop_column('mensajes', 'conversacion_id')
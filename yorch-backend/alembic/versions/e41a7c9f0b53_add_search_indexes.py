@@ -0,0 +1,69 @@
+"""Add search indexes (pg_trgm, unaccent, tsvector)
+
+Revision ID: e41a7c9f0b53
+Revises: 8b3f0c6d2e14
+Create Date: 2026-10-17 14:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41a7c9f0b53'
+down_revision: Union[str, None] = '8b3f0c6d2e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Solo PostgreSQL; en SQLite la búsqueda usa el índice en memoria y LIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+    # unaccent() no es IMMUTABLE y no sirve en índices; este envoltorio sí
+    op.execute("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    """)
+
+    # Configuración de texto completo en español que ignora tildes
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION es_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END
+        $$
+    """)
+
+    op.execute("CREATE INDEX ix_clientes_nombre_trgm ON clientes USING gin (lower(f_unaccent(nombre)) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_clientes_cedula_prefijo ON clientes (cedula text_pattern_ops)")
+    op.execute("CREATE INDEX ix_clientes_telefono_trgm ON clientes USING gin (telefono gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_clientes_notas_tsv ON clientes USING gin (to_tsvector('es_unaccent', coalesce(notas, '')))")
+    op.execute(
+        "CREATE INDEX ix_escrituras_nombre_propietario_trgm ON escrituras "
+        "USING gin (lower(f_unaccent(nombre_propietario)) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("DROP INDEX IF EXISTS ix_escrituras_nombre_propietario_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_notas_tsv")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_telefono_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_cedula_prefijo")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_nombre_trgm")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS es_unaccent")
+    op.execute("DROP FUNCTION IF EXISTS f_unaccent(text)")
@@ -0,0 +1,107 @@
+"""Add escritura_archivos table
+
+Revision ID: f2b8c4d1e6a3
+Revises: 6c0e5b7d9a21
+Create Date: 2026-10-17 17:30:00.000000
+
+"""
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+from alembic import op
+import sqlalchemy as sa
+from PIL import Image, UnidentifiedImageError
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8c4d1e6a3'
+down_revision: Union[str, None] = '6c0e5b7d9a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copias de lo necesario de app/services/archivos_escritura.py y
+# app/routers/escrituras.py: la migración no debe cambiar si la app cambia
+UPLOADS_DIR = Path(__file__).resolve().parents[2] / "uploads" / "escrituras"
+PATRON_NOMBRE_ARCHIVO = re.compile(r"^(?:documento|imagen)_(\d+)\.")
+PATRON_PAGINA_PDF = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+
+
+def describir_archivo(ruta: Path) -> Tuple[int, str, str, Optional[int]]:
+    """Tamaño, sha256, tipo MIME y páginas de un archivo en disco."""
+    datos = ruta.read_bytes()
+    if datos[:5] == b"%PDF-":
+        mime, paginas = "application/pdf", len(PATRON_PAGINA_PDF.findall(datos)) or None
+    else:
+        try:
+            with Image.open(ruta) as imagen:
+                mime = Image.MIME.get(imagen.format) or f"image/{imagen.format.lower()}"
+                paginas = getattr(imagen, "n_frames", 1)
+        except (UnidentifiedImageError, OSError):
+            mime, paginas = mimetypes.guess_type(ruta.name)[0] or "application/octet-stream", None
+    return len(datos), hashlib.sha256(datos).hexdigest(), mime, paginas
+
+
+def orden_de(ruta: Path) -> Tuple[int, str]:
+    coincidencia = PATRON_NOMBRE_ARCHIVO.match(ruta.name)
+    return (int(coincidencia.group(1)) if coincidencia else 1 << 30), ruta.name
+
+
+def upgrade() -> None:
+    op.create_table('escritura_archivos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('escritura_id', sa.Integer(), nullable=False),
+        sa.Column('orden', sa.Integer(), nullable=False),
+        sa.Column('nombre', sa.String(length=255), nullable=False),
+        sa.Column('nombre_original', sa.String(length=255), nullable=True),
+        sa.Column('tamano', sa.BigInteger(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('mime', sa.String(length=100), nullable=False),
+        sa.Column('paginas', sa.Integer(), nullable=True),
+        sa.Column('miniatura', sa.String(length=255), nullable=True),
+        sa.Column('vista_previa', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['escritura_id'], ['escrituras.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('escritura_id', 'orden', name='uq_escritura_archivos_escritura_id_orden')
+    )
+    op.create_index(op.f('ix_escritura_archivos_id'), 'escritura_archivos', ['id'], unique=False)
+
+    # Backfill desde las carpetas en disco: sin filas, GET /escrituras/{id}
+    # devolvería las escrituras existentes sin archivos. Las carpetas que no
+    # estén aquí se registran después con
+    # `python scripts/verificar_escrituras.py --corregir`
+    conn = op.get_bind()
+    escrituras = sa.table('escrituras', sa.column('id', sa.Integer), sa.column('carpeta', sa.String))
+    archivos = sa.table(
+        'escritura_archivos',
+        sa.column('escritura_id', sa.Integer),
+        sa.column('orden', sa.Integer),
+        sa.column('nombre', sa.String),
+        sa.column('tamano', sa.BigInteger),
+        sa.column('sha256', sa.String),
+        sa.column('mime', sa.String),
+        sa.column('paginas', sa.Integer),
+    )
+    for escritura_id, carpeta in conn.execute(sa.select(escrituras.c.id, escrituras.c.carpeta).order_by(escrituras.c.id)):
+        ruta_carpeta = UPLOADS_DIR / carpeta
+        if not ruta_carpeta.is_dir():
+            print(f"[MIGRACION] Escritura {escritura_id}: no existe la carpeta {ruta_carpeta}")
+            continue
+        en_disco = sorted((r for r in ruta_carpeta.iterdir() if r.is_file() and not r.name.startswith(".")), key=orden_de)
+        filas = []
+        for orden, ruta in enumerate(en_disco):
+            tamano, sha256, mime, paginas = describir_archivo(ruta)
+            filas.append(dict(
+                escritura_id=escritura_id, orden=orden, nombre=ruta.name,
+                tamano=tamano, sha256=sha256, mime=mime, paginas=paginas,
+            ))
+        if filas:
+            conn.execute(archivos.insert(), filas)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_escritura_archivos_id'), table_name='escritura_archivos')
+    op.drop_table('escritura_archivos')
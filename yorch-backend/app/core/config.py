@@ -1,8 +1,22 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional, Set, Tuple
 import json
 
 
+def parsear_recorte(texto: str) -> Optional[Tuple[float, float, float, float]]:
+    """Convierte "izquierda,arriba,derecha,abajo" (fracciones 0-1) en una tupla; vacío = sin recorte."""
+    if not texto.strip():
+        return None
+    try:
+        caja = tuple(float(v) for v in texto.split(","))
+    except ValueError:
+        caja = ()
+    if len(caja) != 4 or not (0 <= caja[0] < caja[2] <= 1 and 0 <= caja[1] < caja[3] <= 1):
+        raise ValueError(f"Recorte inválido: {texto!r} (se espera izquierda,arriba,derecha,abajo entre 0 y 1)")
+    return caja
+
+
 class Settings(BaseSettings):
     # App
     APP_NAME: str = "Yorch"
@@ -12,6 +26,12 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 10  # Segundos esperando una conexión libre antes de fallar
+    DB_POOL_RECYCLE: int = 1800  # Segundos; renueva conexiones viejas
+    DB_POOL_PRE_PING: bool = True  # Detecta conexiones muertas (p. ej. tras reiniciar Postgres)
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # Solo PostgreSQL; 0 = sin límite
 
     # CORS
     CORS_ORIGINS: str = '["http://localhost:3000"]'
@@ -22,6 +42,53 @@ class Settings(BaseSettings):
 
     # Gemini AI
     GEMINI_API_KEY: str = ""
+    GEMINI_MODELO: str = "models/gemini-flash-latest"
+    LLM_PROVEEDOR: str = "gemini"  # gemini o falso (modelo local para pruebas/benchmarks)
+    LLM_TIMEOUT_SEGUNDOS: float = 30
+    LLM_MAX_CONCURRENCIA: int = 8
+    LLM_REINTENTOS: int = 2
+    LLM_FALSO_LATENCIA_MS: int = 800
+    LLM_FALSO_MS_POR_MB: int = 0  # Latencia extra del modelo falso por MB enviado (simula la subida)
+    LLM_CACHE_MAX_ENTRADAS: int = 256
+    LLM_CACHE_TTL_SEGUNDOS: int = 600
+
+    # Historial del chat
+    MENSAJES_RETENCION_DIAS: int = 90  # Los mensajes más antiguos se archivan comprimidos
+    LLM_PRESUPUESTO_PROMPT_TOKENS: int = 2000  # Tope (estimado) del prompt completo
+    LLM_MAX_TOKENS_MENSAJE: int = 150  # Cada mensaje del historial se recorta a esto
+    LLM_MAX_TOKENS_RESUMEN: int = 300  # Resumen acumulado de lo que ya no entra
+    LLM_HISTORIAL_MAX_MENSAJES: int = 10
+
+    # Búsqueda de clientes
+    INDICE_CLIENTES_TTL: int = 300  # Segundos antes de recargar el índice en memoria
+
+    # Depuración: máximo de sentencias SQL por petición (0 = sin control).
+    # En desarrollo/pruebas una petición que lo supere responde 500 (detecta N+1)
+    MAX_CONSULTAS_POR_PETICION: int = 0
+
+    # Lectura del nombre en la foto del sobre (Gemini Vision): la foto se reduce antes de enviarla
+    SOBRE_OCR_PREPROCESAR: bool = True  # False = enviar la foto tal como se subió
+    SOBRE_OCR_MAX_LADO: int = 1600  # Píxeles del lado mayor
+    SOBRE_OCR_CALIDAD_JPEG: int = 85
+    SOBRE_OCR_RECORTE: str = ""  # Región de la etiqueta: "izquierda,arriba,derecha,abajo" en fracciones, p. ej. "0,0,1,0.5"
+
+    # Subidas (tamaño máximo por archivo)
+    MAX_SUBIDA_IMAGEN_MB: int = 20
+    MAX_SUBIDA_AUDIO_MB: int = 10
+    MAX_SUBIDA_ESCRITURA_MB: int = 50
+
+    # Carga por lotes (POST /movimientos/lote)
+    MAX_FILAS_LOTE: int = 1000
+
+    # Cola de trabajos en segundo plano (tabla trabajos, workers dentro del proceso)
+    TRABAJOS_WORKERS: int = 2  # 0 = no procesar trabajos en este proceso
+    TRABAJOS_MAX_INTENTOS: int = 3
+    TRABAJOS_TIMEOUT_SEGUNDOS: float = 120
+    TRABAJOS_BACKOFF_SEGUNDOS: float = 5  # Espera antes del primer reintento; se duplica en cada uno
+    TRABAJOS_INTERVALO_SEGUNDOS: float = 1  # Cada cuánto se revisa la tabla si no llegan avisos
+    # Hosts de webhook admitidos aunque resuelvan a la red interna (localhost,
+    # redes privadas), separados por coma. Los demás se rechazan (SSRF)
+    TRABAJOS_WEBHOOK_HOSTS_PERMITIDOS: str = ""
 
     # Cloudinary
     CLOUDINARY_CLOUD_NAME: str = ""
@@ -32,6 +99,21 @@ class Settings(BaseSettings):
     def cors_origins_list(self) -> List[str]:
         return json.loads(self.CORS_ORIGINS)
 
+    @field_validator("SOBRE_OCR_RECORTE")
+    @classmethod
+    def validar_recorte(cls, valor: str) -> str:
+        # Un recorte mal escrito hace fallar el arranque, no cada lectura de sobre
+        parsear_recorte(valor)
+        return valor
+
+    @property
+    def sobre_ocr_recorte(self) -> Optional[Tuple[float, float, float, float]]:
+        return parsear_recorte(self.SOBRE_OCR_RECORTE)
+
+    @property
+    def webhook_hosts_permitidos(self) -> Set[str]:
+        return {host.strip().lower() for host in self.TRABAJOS_WEBHOOK_HOSTS_PERMITIDOS.split(",") if host.strip()}
+
     class Config:
         env_file = ".env"
         case_sensitive = True
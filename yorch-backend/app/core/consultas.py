@@ -0,0 +1,52 @@
+"""
+Contador de sentencias SQL por petición, para detectar N+1.
+
+Con MAX_CONSULTAS_POR_PETICION > 0 (desarrollo y pruebas) cada petición cuenta
+las sentencias que ejecuta y, si supera el límite, responde 500 en lugar del
+resultado normal, así que una regresión N+1 rompe la prueba que la ejerce. En
+producción se deja en 0 y el listener ni se registra.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.total = 0
+        self.sentencias: List[str] = []
+
+    def registrar(self, sentencia: str) -> None:
+        self.total += 1
+        self.sentencias.append(sentencia)
+
+
+# Objeto mutable: las rutas síncronas corren en otro hilo con una copia del
+# contexto, pero comparten la misma instancia del contador
+_contador_actual: ContextVar[Optional[ContadorConsultas]] = ContextVar("contador_consultas", default=None)
+
+
+def _antes_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    contador = _contador_actual.get()
+    if contador is not None:
+        contador.registrar(sentencia)
+
+
+def instalar_contador(engine: Engine) -> None:
+    """Registra el listener en el engine (una sola vez)."""
+    if not event.contains(engine, "before_cursor_execute", _antes_de_ejecutar):
+        event.listen(engine, "before_cursor_execute", _antes_de_ejecutar)
+
+
+@contextmanager
+def contar_consultas() -> Iterator[ContadorConsultas]:
+    """Cuenta las sentencias ejecutadas dentro del bloque (requiere instalar_contador)."""
+    contador = ContadorConsultas()
+    token = _contador_actual.set(contador)
+    try:
+        yield contador
+    finally:
+        _contador_actual.reset(token)
@@ -1,15 +1,108 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# Driver asíncrono para cada motor (las rutas usan el engine asíncrono; el
+# síncrono queda para Alembic, los scripts y los servicios llamados con run_sync)
+DRIVERS_ASYNC = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def url_async(url: str) -> str:
+    """Misma base de datos con el driver asíncrono (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{DRIVERS_ASYNC[backend]}").render_as_string(hide_password=False)
+
+
+def _opciones_engine(url: str, asincrono: bool = False) -> dict:
+    """Parámetros del pool según settings (SQLite usa los valores por defecto)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    # Con asyncpg el pre-ping de SQLAlchemy son tres idas y vueltas por checkout
+    # (BEGIN, ";" y ROLLBACK); ahí se usa _descartar_cerradas en su lugar
+    opciones = {"pool_pre_ping": settings.DB_POOL_PRE_PING and not (asincrono and backend == "postgresql")}
+    if backend == "sqlite":
+        # En memoria (sqlite://) SQLAlchemy usa un pool de una sola conexión
+        # que no admite estos parámetros
+        en_archivo = url.database not in (None, "", ":memory:") and url.query.get("mode") != "memory"
+        if asincrono and en_archivo:
+            # SQLite admite un solo escritor: con varias conexiones, las
+            # transacciones intercaladas en el event loop chocan con "database
+            # is locked". Una única conexión serializa las sesiones.
+            opciones.update(
+                poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+            )
+        return opciones
+
+    opciones.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        if asincrono:
+            opciones["connect_args"] = {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            opciones["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return opciones
+
+
+engine = create_engine(settings.DATABASE_URL, **_opciones_engine(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(
+    url_async(settings.DATABASE_URL),
+    **_opciones_engine(settings.DATABASE_URL, asincrono=True)
+)
+
+
+if settings.DB_POOL_PRE_PING and async_engine.dialect.name == "postgresql":
+    @event.listens_for(async_engine.sync_engine, "checkout")
+    def _descartar_cerradas(dbapi_connection, connection_record, connection_proxy):
+        # asyncpg marca la conexión como cerrada en cuanto el servidor la corta
+        # (p. ej. al reiniciar Postgres), sin consultar la base; el pool la
+        # descarta y entrega otra
+        if dbapi_connection.driver_connection.is_closed():
+            raise DisconnectionError("Conexión cerrada por el servidor")
+
+
+# expire_on_commit=False: en una sesión asíncrona no se puede recargar un
+# atributo vencido de forma implícita
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def estado_pool() -> dict:
+    """Métricas del pool de conexiones de las rutas (engine asíncrono) para /health."""
+    pool = async_engine.sync_engine.pool
+    estado = {"tipo": type(pool).__name__}
+    for metrica in ("size", "checkedin", "checkedout", "overflow"):
+        funcion = getattr(pool, metrica, None)
+        if callable(funcion):
+            estado[metrica] = funcion()
+    if "size" in estado:
+        estado["max_overflow"] = getattr(pool, "_max_overflow", None)
+        estado["disponibles"] = estado["size"] + max(estado["max_overflow"] or 0, 0) - estado["checkedout"]
+    return estado
+
 
 def get_db():
+    # La sesión no toma una conexión del pool hasta la primera consulta, así
+    # que una ruta que falla la autenticación no ocupa conexiones
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    # Igual que get_db: la conexión se toma en la primera consulta
+    async with AsyncSessionLocal() as db:
+        yield db
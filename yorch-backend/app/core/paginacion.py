@@ -0,0 +1,123 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+Cada listado se ordena por una clave única, p. ej. (nombre, id) o
+(created_at, id), y la página siguiente se pide con `WHERE clave > última
+clave vista` en lugar de OFFSET, así que el costo no crece con la profundidad
+y el orden es estable aunque se inserten filas. El cursor es opaco para el
+cliente (JSON en base64) y viaja en la cabecera X-Next-Cursor, para que el
+cuerpo siga siendo la misma lista de siempre.
+
+Con formato=ndjson el listado completo se transmite como una línea JSON por
+fila, leyendo la base por tandas, para exportaciones.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, Select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+
+PAGINA_POR_DEFECTO = 100
+PAGINA_MAXIMA = 500
+TANDA_EXPORTACION = 500
+CABECERA_CURSOR = "X-Next-Cursor"
+
+# Parámetro común de tamaño de página
+LimitePagina = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA)
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    datos = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columnas: Sequence) -> List[Any]:
+    """Devuelve los valores de la clave; 400 si el cursor no corresponde a este listado.
+
+    Un elemento None en `columnas` indica un valor JSON sin conversión.
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if isinstance(getattr(columna, "type", None), DateTime) else v
+            for columna, v in zip(columnas, valores)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _expresion_orden(columna, dialecto: str):
+    # SQLite guarda las fechas como texto y mezcla formatos (con y sin
+    # microsegundos según quién insertó), así que se comparan normalizadas
+    if dialecto == "sqlite" and isinstance(columna.type, DateTime):
+        return func.strftime("%Y-%m-%d %H:%M:%f", columna)
+    return columna
+
+
+def _valor_orden(valor, columna, dialecto: str):
+    if dialecto == "sqlite" and isinstance(columna.type, DateTime) and valor is not None:
+        return valor.strftime("%Y-%m-%d %H:%M:%S.") + f"{valor.microsecond // 1000:03d}"
+    return valor
+
+
+def ordenar(consulta: Select, columnas: Sequence, dialecto: str, descendente: bool = False) -> Select:
+    expresiones = [_expresion_orden(c, dialecto) for c in columnas]
+    return consulta.order_by(*[e.desc() if descendente else e for e in expresiones])
+
+
+async def paginar(
+    db: AsyncSession,
+    consulta: Select,
+    columnas: Sequence,
+    cursor: Optional[str],
+    limite: int,
+    descendente: bool = False,
+) -> Tuple[list, Optional[str]]:
+    """Aplica orden y cursor a la consulta; devuelve (filas, cursor siguiente o None).
+
+    `consulta` es un select() de una sola entidad y `columnas` los atributos
+    del modelo que forman la clave; el último debe ser único (normalmente el id).
+    """
+    dialecto = db.bind.dialect.name
+    if cursor:
+        valores = decodificar_cursor(cursor, columnas)
+        clave = tuple_(*[_expresion_orden(c, dialecto) for c in columnas])
+        limite_clave = tuple_(*[_valor_orden(v, c, dialecto) for v, c in zip(valores, columnas)])
+        consulta = consulta.where(clave < limite_clave if descendente else clave > limite_clave)
+
+    filas = (await db.scalars(ordenar(consulta, columnas, dialecto, descendente).limit(limite + 1))).all()
+    if len(filas) <= limite:
+        return list(filas), None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return list(filas), codificar_cursor([getattr(ultima, c.key) for c in columnas])
+
+
+def exportar_ndjson(
+    consulta: Select,
+    columnas: Sequence,
+    serializar: Callable[[Any], dict],
+    descendente: bool = False,
+) -> StreamingResponse:
+    """Transmite todas las filas como NDJSON, leyendo por tandas.
+
+    La sesión se abre dentro del generador: las dependencias con yield ya se
+    cerraron cuando empieza a transmitirse el cuerpo.
+    """
+    async def generar() -> AsyncIterator[bytes]:
+        async with AsyncSessionLocal() as db:
+            ordenada = ordenar(consulta, columnas, db.bind.dialect.name, descendente)
+            filas = await db.stream_scalars(ordenada.execution_options(yield_per=TANDA_EXPORTACION))
+            async for fila in filas:
+                yield (json.dumps(serializar(fila), default=str, ensure_ascii=False) + "\n").encode("utf-8")
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
@@ -0,0 +1,34 @@
+import re
+import unicodedata
+from decimal import Decimal
+from typing import Optional
+
+
+def quitar_acentos(texto: str) -> str:
+    """Elimina tildes y diéresis (á -> a, ü -> u, ñ -> n)."""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def plegar_nombre(nombre: str) -> str:
+    """Pliega un nombre para comparación difusa: minúsculas, sin tildes ni signos."""
+    nombre = quitar_acentos(nombre.lower())
+    nombre = re.sub(r"[^a-z0-9\s]", " ", nombre)
+    return " ".join(nombre.split())
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """Normaliza el nombre para comparación (minúsculas, sin espacios extra)."""
+    return " ".join(nombre.lower().split())
+
+
+def parse_monto(texto: str) -> Optional[Decimal]:
+    """Convierte texto de monto a Decimal."""
+    texto = texto.lower().replace(",", "").replace(".", "").replace(" ", "")
+    # "millón" antes que "mil", si no "1 millón" queda en 1000
+    texto = texto.replace("millones", "000000").replace("millon", "000000").replace("millón", "000000")
+    texto = texto.replace("mil", "000")
+    numeros = re.findall(r'\d+', texto)
+    if numeros:
+        return Decimal(numeros[0])
+    return None
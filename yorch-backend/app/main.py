@@ -1,15 +1,36 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
+from contextlib import asynccontextmanager
 from pathlib import Path
+import re
+from typing import Literal, Optional
 from app.core.config import settings
-from app.routers import auth_router, chat_router, clientes_router, movimientos_router, sobres_router, escrituras_router
+from app.core.consultas import contar_consultas, instalar_contador
+from app.core.database import async_engine, engine, estado_pool
+from app.services.almacen_sobres import PATRON_BLOB, SOBRES_DIR, ruta_variante
+from app.services.archivos_escritura import obtener_version
+from app.services.trabajos import cola_trabajos
+from app.routers.escrituras import UPLOADS_DIR as ESCRITURAS_DIR
+from app.routers import auth_router, chat_router, clientes_router, movimientos_router, sobres_router, escrituras_router, buscar_router, trabajos_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workers de la cola de trabajos (OCR, transcripción, versiones de escrituras)
+    cola_trabajos.iniciar(settings.TRABAJOS_WORKERS)
+    yield
+    await cola_trabajos.detener()
+    # Cierra las conexiones del engine asíncrono (aiosqlite usa un hilo por conexión)
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
     description="API para gestión de préstamos con agente IA",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -19,8 +40,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Contador de consultas por petición (solo depuración)
+if settings.MAX_CONSULTAS_POR_PETICION > 0:
+    instalar_contador(engine)
+    instalar_contador(async_engine.sync_engine)
+
+    @app.middleware("http")
+    async def limitar_consultas(request: Request, call_next):
+        with contar_consultas() as contador:
+            response = await call_next(request)
+        if contador.total > settings.MAX_CONSULTAS_POR_PETICION:
+            print(f"[DEBUG] {request.method} {request.url.path} ejecutó {contador.total} consultas "
+                  f"(máximo {settings.MAX_CONSULTAS_POR_PETICION})")
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "detail": f"Demasiadas consultas SQL en una petición: {contador.total} "
+                              f"(máximo {settings.MAX_CONSULTAS_POR_PETICION}). ¿N+1?",
+                    "sentencias": contador.sentencias
+                }
+            )
+        response.headers["X-Consultas-SQL"] = str(contador.total)
+        return response
+
+
 # Routers
 app.include_router(auth_router, prefix=settings.API_V1_PREFIX)
 app.include_router(chat_router, prefix=settings.API_V1_PREFIX)
@@ -28,6 +74,8 @@ app.include_router(clientes_router, prefix=settings.API_V1_PREFIX)
 app.include_router(movimientos_router, prefix=settings.API_V1_PREFIX)
 app.include_router(sobres_router, prefix=settings.API_V1_PREFIX)
 app.include_router(escrituras_router, prefix=settings.API_V1_PREFIX)
+app.include_router(buscar_router, prefix=settings.API_V1_PREFIX)
+app.include_router(trabajos_router, prefix=settings.API_V1_PREFIX)
 
 
 @app.get("/")
@@ -37,29 +85,101 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "pool": estado_pool()}
 
 
-# Servir archivos estáticos (imágenes de sobres) con headers de no-cache
+# Servir archivos estáticos (imágenes de sobres)
 uploads_path = Path(__file__).parent.parent / "uploads"
 uploads_path.mkdir(parents=True, exist_ok=True)
 
 
 @app.get("/uploads/sobres/{filename}")
-async def get_sobre_image(filename: str):
-    """Sirve imágenes de sobres con headers de no-cache para evitar problemas de caché."""
-    file_path = uploads_path / "sobres" / filename
+async def get_sobre_image(
+    filename: str,
+    request: Request,
+    variante: Optional[Literal["miniatura", "vista"]] = None
+):
+    """
+    Sirve imágenes de sobres.
+    Las imágenes direccionadas por contenido (<sha256>.<ext>) nunca cambian, así que
+    se sirven con ETag fuerte y caché inmutable; ?variante=miniatura|vista devuelve
+    la versión reducida en WebP. Los archivos con nombre antiguo siguen sin caché.
+    """
+    match = PATRON_BLOB.match(filename)
+    if not match:
+        file_path = uploads_path / "sobres" / filename
+        if not file_path.exists():
+            return {"error": "Archivo no encontrado"}
+        return FileResponse(
+            path=str(file_path),
+            headers={
+                "Cache-Control": "no-cache, no-store, must-revalidate",
+                "Pragma": "no-cache",
+                "Expires": "0"
+            }
+        )
+
+    digest = match.group("hash")
+    file_path = SOBRES_DIR / filename
+    if variante:
+        ruta = ruta_variante(filename, variante)
+        if ruta.exists():
+            file_path = ruta
     if not file_path.exists():
-        return {"error": "Archivo no encontrado"}
-    return FileResponse(
-        path=str(file_path),
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0"
-        }
-    )
-
-
-# Servir otros archivos estáticos (escrituras, etc.)
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    etag = f'"{digest}-{variante}"' if file_path.suffix == ".webp" and variante else f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=str(file_path), headers=headers)
+
+
+# Carpetas y archivos de escrituras (sin rutas ocultas como .vistas ni "..")
+PATRON_NOMBRE_ESCRITURA = re.compile(r"^[\w-][\w.-]*$")
+
+
+@app.get("/uploads/escrituras/{carpeta}/{filename}")
+async def get_escritura_archivo(
+    carpeta: str,
+    filename: str,
+    request: Request,
+    variante: Optional[Literal["miniatura", "vista"]] = None,
+    v: Optional[str] = None
+):
+    """
+    Sirve archivos de escrituras.
+    ?variante=miniatura|vista devuelve una versión reducida en WebP (de un PDF, su
+    primera página escaneada), generada la primera vez que se pide y guardada en
+    disco. Las URLs que devuelve la API llevan ?v=<hash del archivo>, así que su
+    contenido nunca cambia y se sirven con caché inmutable; sin v se revalidan.
+    """
+    if not PATRON_NOMBRE_ESCRITURA.match(carpeta) or not PATRON_NOMBRE_ESCRITURA.match(filename):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    file_path = ESCRITURAS_DIR / carpeta / filename
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    if variante:
+        file_path = await obtener_version(file_path.parent, filename, variante)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="Vista previa no disponible")
+
+    if v:
+        etag = f'"{v}-{variante or "original"}"'
+        cache = "public, max-age=31536000, immutable"
+    else:
+        estado = file_path.stat()
+        etag = f'"{estado.st_mtime_ns:x}-{estado.st_size:x}"'
+        cache = "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=str(file_path), headers=headers)
+
+
+# Servir otros archivos estáticos
 app.mount("/uploads", StaticFiles(directory=str(uploads_path)), name="uploads")
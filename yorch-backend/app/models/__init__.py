@@ -1,4 +1,6 @@
 from app.models.cliente import Cliente
 from app.models.movimiento import MovimientoPendiente
-from app.models.mensaje import Mensaje
-from app.models.escritura import Escritura
+from app.models.mensaje import Mensaje, MensajeArchivado, ResumenConversacion
+from app.models.escritura import Escritura, EscrituraArchivo
+from app.models.saldo import SaldoCliente
+from app.models.trabajo import Trabajo
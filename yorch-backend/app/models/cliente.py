@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from app.core.database import Base
+from app.core.texto import normalizar_nombre
 
 
 class Cliente(Base):
@@ -9,6 +10,7 @@ class Cliente(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     nombre = Column(String(255), nullable=False, index=True)
+    nombre_normalizado = Column(String(255), nullable=False, unique=True, index=True)
     cedula = Column(String(20), unique=True, index=True)
     telefono = Column(String(20))
     direccion = Column(Text)
@@ -18,4 +20,16 @@ class Cliente(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relaciones
-    movimientos = relationship("MovimientoPendiente", back_populates="cliente")
+    # passive_deletes: los movimientos se borran explícitamente antes que el cliente
+    movimientos = relationship("MovimientoPendiente", back_populates="cliente", lazy="raise_on_sql", passive_deletes=True)
+
+    __table_args__ = (
+        # Clave de la paginación por cursor
+        Index("ix_clientes_nombre_id", "nombre", "id"),
+    )
+
+    @validates("nombre")
+    def _sincronizar_nombre_normalizado(self, key, nombre):
+        """Mantiene nombre_normalizado al día en cualquier alta o edición."""
+        self.nombre_normalizado = normalizar_nombre(nombre) if nombre is not None else None
+        return nombre
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String, DateTime, Text, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -13,3 +13,36 @@ class Escritura(Base):
     cantidad_archivos = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Clave de la paginación por cursor
+        Index("ix_escrituras_created_at_id", "created_at", "id"),
+    )
+
+
+class EscrituraArchivo(Base):
+    """Manifiesto de los archivos de una escritura, escrito al guardarlos.
+
+    Las lecturas salen de esta tabla sin tocar el disco;
+    scripts/verificar_escrituras.py la reconcilia con uploads/escrituras/.
+    """
+    __tablename__ = "escritura_archivos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    escritura_id = Column(Integer, ForeignKey("escrituras.id", ondelete="CASCADE"), nullable=False)
+    orden = Column(Integer, nullable=False)  # Posición en la subida (desde 0)
+    nombre = Column(String(255), nullable=False)  # Nombre dentro de la carpeta (documento_N.pdf, imagen_N.jpg)
+    nombre_original = Column(String(255))
+    tamano = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    mime = Column(String(100), nullable=False)
+    paginas = Column(Integer)  # Páginas del PDF o cuadros de la imagen; NULL si no se pudo leer
+    # Rutas (relativas a la carpeta de la escritura) de las versiones reducidas
+    miniatura = Column(String(255))
+    vista_previa = Column(String(255))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Los archivos de una escritura en orden, en una sola consulta por índice
+        UniqueConstraint("escritura_id", "orden", name="uq_escritura_archivos_escritura_id_orden"),
+    )
@@ -1,12 +1,49 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Index, Integer, LargeBinary, String, DateTime, Text
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# Conversación de los mensajes que no indican una (y de los anteriores a las conversaciones)
+CONVERSACION_POR_DEFECTO = "general"
+
 
 class Mensaje(Base):
     __tablename__ = "mensajes"
+    __table_args__ = (
+        # Historial de una conversación por id (prompt y GET /chat/historial)
+        Index("ix_mensajes_conversacion_id_id", "conversacion_id", "id"),
+        # Mensajes a archivar por antigüedad (services/archivo_mensajes.py)
+        Index("ix_mensajes_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    conversacion_id = Column(
+        String(64), nullable=False, default=CONVERSACION_POR_DEFECTO, server_default=CONVERSACION_POR_DEFECTO
+    )
     rol = Column(String(20), nullable=False)  # user o assistant
     contenido = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MensajeArchivado(Base):
+    """Bloque de mensajes antiguos de una conversación, comprimido (JSON por líneas + gzip)."""
+    __tablename__ = "mensajes_archivados"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversacion_id = Column(String(64), nullable=False, index=True)
+    desde_id = Column(Integer, nullable=False)
+    hasta_id = Column(Integer, nullable=False)
+    desde_fecha = Column(DateTime(timezone=True))
+    hasta_fecha = Column(DateTime(timezone=True))
+    cantidad = Column(Integer, nullable=False)
+    contenido = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ResumenConversacion(Base):
+    """Resumen acumulado de los mensajes de una conversación que ya no entran en el prompt."""
+    __tablename__ = "resumenes_conversacion"
+
+    conversacion_id = Column(String(64), primary_key=True)
+    texto = Column(Text, nullable=False, default="", server_default="")
+    hasta_id = Column(Integer, nullable=False, default=0, server_default="0")  # Último mensaje plegado
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -8,13 +8,28 @@ class MovimientoPendiente(Base):
     __tablename__ = "movimientos_pendientes"
 
     id = Column(Integer, primary_key=True, index=True)
-    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False, index=True)
     tipo = Column(String(20), nullable=False)  # PRESTAMO o ABONO
     monto = Column(Numeric(12, 2), nullable=False)
     notas = Column(Text)
-    procesado = Column(Boolean, default=False)
+    procesado = Column(Boolean, nullable=False, default=False, server_default=text("false"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     procesado_at = Column(DateTime(timezone=True))
 
     # Relaciones
-    cliente = relationship("Cliente", back_populates="movimientos")
+    # raise_on_sql: recorrerla fila por fila sería un N+1; usar JOIN en la consulta
+    cliente = relationship("Cliente", back_populates="movimientos", lazy="raise_on_sql")
+
+    __table_args__ = (
+        # Índice parcial: solo contiene los pendientes, así que no crece con el
+        # histórico. Las consultas deben filtrar con `procesado == False`.
+        Index(
+            "ix_movimientos_pendientes_cliente_created_pendientes",
+            "cliente_id",
+            "created_at",
+            postgresql_where=text("procesado = false"),
+            sqlite_where=text("procesado = 0"),
+        ),
+        # Clave de la paginación por cursor del listado general
+        Index("ix_movimientos_pendientes_created_at_id", "created_at", "id"),
+    )
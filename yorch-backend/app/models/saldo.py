@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, DateTime, Numeric, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class SaldoCliente(Base):
+    """Totales por cliente, mantenidos en la misma transacción que los movimientos."""
+    __tablename__ = "saldos_clientes"
+
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), primary_key=True)
+    # Movimientos aún no pasados al sobre
+    pendiente_prestamos = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    pendiente_abonos = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    cantidad_pendientes = Column(Integer, nullable=False, default=0, server_default="0")
+    # Histórico completo (pendientes + procesados)
+    total_prestamos = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    total_abonos = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
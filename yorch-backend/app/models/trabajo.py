@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+# Estados de un trabajo. FALLIDO es la cola de descarte: agotó sus intentos
+# (o falló de forma permanente) y solo vuelve a correr con POST /trabajos/{id}/reintentar
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+FALLIDO = "fallido"
+
+
+class Trabajo(Base):
+    """Trabajo en segundo plano (OCR de sobres, transcripción, versiones de escrituras)."""
+    __tablename__ = "trabajos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)
+    estado = Column(String(20), nullable=False, default=PENDIENTE, server_default=PENDIENTE)
+    parametros = Column(JSON, nullable=False)
+    resultado = Column(JSON)
+    error = Column(Text)
+    intentos = Column(Integer, nullable=False, default=0, server_default="0")
+    max_intentos = Column(Integer, nullable=False)
+    # Pendiente: desde cuándo se puede tomar (backoff entre reintentos).
+    # En proceso: hasta cuándo lo reserva el worker; si vence, otro lo retoma
+    disponible_desde = Column(DateTime(timezone=True), nullable=False)
+    webhook_url = Column(String(500))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    iniciado_at = Column(DateTime(timezone=True))
+    terminado_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Búsqueda del siguiente trabajo disponible
+        Index("ix_trabajos_estado_disponible_desde", "estado", "disponible_desde"),
+        # Clave de la paginación por cursor del listado
+        Index("ix_trabajos_created_at_id", "created_at", "id"),
+    )
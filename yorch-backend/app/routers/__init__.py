@@ -4,3 +4,5 @@ from app.routers.clientes import router as clientes_router
 from app.routers.movimientos import router as movimientos_router
 from app.routers.sobres import router as sobres_router
 from app.routers.escrituras import router as escrituras_router
+from app.routers.buscar import router as buscar_router
+from app.routers.trabajos import router as trabajos_router
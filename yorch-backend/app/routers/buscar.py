@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.core.database import get_async_db
+from app.core.paginacion import CABECERA_CURSOR, codificar_cursor, decodificar_cursor
+from app.core.security import get_current_user
+from app.services.busqueda import buscar
+
+router = APIRouter(prefix="/buscar", tags=["buscar"])
+
+
+@router.get("")
+async def buscar_global(
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=100),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Busca clientes (nombre, cédula, teléfono, notas) y escrituras (propietario).
+    Devuelve los resultados ordenados por puntaje; la página siguiente se pide
+    con el cursor de la cabecera X-Next-Cursor.
+    """
+    desplazamiento = 0
+    if cursor:
+        desplazamiento, = decodificar_cursor(cursor, [None])
+        if not isinstance(desplazamiento, int) or desplazamiento < 0:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    resultados = await db.run_sync(buscar, q, limit + 1, desplazamiento)
+    if len(resultados) > limit:
+        resultados = resultados[:limit]
+        response.headers[CABECERA_CURSOR] = codificar_cursor([desplazamiento + limit])
+    return resultados
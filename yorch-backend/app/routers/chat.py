@@ -1,11 +1,30 @@
-from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+import json
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.core.config import settings
+from app.core.paginacion import CABECERA_CURSOR, LimitePagina, paginar
 from app.core.security import get_current_user
-from app.schemas import ChatMessage, ChatResponse
-from app.services.ai_service import chat_con_agente
-import google.generativeai as genai
+from app.models import Mensaje
+from app.models.mensaje import CONVERSACION_POR_DEFECTO
+from app.schemas import ChatMessage, ChatResponse, MensajeHistorial, WebhookUrl
+from app.services.ai_service import chat_con_agente, chat_con_agente_stream
+from app.services.intenciones import metricas_intenciones
+from app.services.cache_llm import cache_llm
+from app.services.llm import obtener_cliente_llm
+from app.services.prompt import metricas_prompt
+from app.services.subidas import leer_subida
+from app.services.trabajos import (
+    PARAMETRO_ARCHIVO, ErrorPermanente, encolar, guardar_avance, guardar_entrada, manejador,
+    trabajo_encolado, validar_webhook
+)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -13,11 +32,11 @@ router = APIRouter(prefix="/chat", tags=["chat"])
 @router.post("/", response_model=ChatResponse)
 async def enviar_mensaje(
     mensaje: ChatMessage,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Envía un mensaje al agente IA y obtiene una respuesta."""
-    respuesta, imagen_url, cliente_id, accion = await chat_con_agente(db, mensaje.mensaje)
+    respuesta, imagen_url, cliente_id, accion = await chat_con_agente(db, mensaje.mensaje, mensaje.conversacion_id)
 
     return ChatResponse(
         respuesta=respuesta,
@@ -27,57 +46,168 @@ async def enviar_mensaje(
     )
 
 
-@router.post("/voz")
-async def procesar_mensaje_voz(
-    audio: UploadFile = File(...),
-    db: Session = Depends(get_db),
+@router.post("/stream")
+async def enviar_mensaje_stream(
+    mensaje: ChatMessage,
     current_user: dict = Depends(get_current_user)
 ):
-    """Recibe audio, lo transcribe con Gemini y procesa el mensaje."""
-    try:
-        # Leer el audio
-        audio_bytes = await audio.read()
-
-        # Usar Gemini para transcribir el audio
-        model = genai.GenerativeModel('models/gemini-flash-latest')
-
-        # Preparar el audio para Gemini
-        audio_part = {
-            "inline_data": {
-                "mime_type": audio.content_type or "audio/webm",
-                "data": audio_bytes
-            }
+    """
+    Igual que POST /chat/ pero responde con Server-Sent Events.
+    Envía eventos 'token' con el texto a medida que llega y un evento 'final'
+    con respuesta, imagen_url, cliente_id y accion (mismos campos que ChatResponse).
+    """
+    async def eventos():
+        # Sesión propia: la de get_async_db se cierra antes de que empiece el streaming
+        async with AsyncSessionLocal() as db:
+            async for evento in chat_con_agente_stream(db, mensaje.mensaje, mensaje.conversacion_id):
+                tipo = evento.pop("tipo")
+                yield f"event: {tipo}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita que nginx acumule el stream
         }
+    )
 
-        # Transcribir
-        transcription_response = model.generate_content([
-            "Transcribe exactamente lo que dice este audio en español. "
-            "Solo responde con la transcripción, sin explicaciones adicionales.",
-            audio_part
-        ])
 
-        texto_transcrito = transcription_response.text.strip()
+@router.get("/historial", response_model=List[MensajeHistorial])
+async def obtener_historial(
+    response: Response,
+    conversacion_id: str = Query(CONVERSACION_POR_DEFECTO, min_length=1, max_length=64),
+    cursor: Optional[str] = None,
+    limit: int = LimitePagina,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Historial de una conversación, más recientes primero, paginado por cursor (cabecera X-Next-Cursor).
 
-        if not texto_transcrito:
-            return {
-                "success": False,
-                "error": "No se pudo transcribir el audio",
-                "transcripcion": None,
-                "respuesta": None
-            }
+    Solo incluye los mensajes aún no archivados (ver scripts/archivar_mensajes.py).
+    """
+    consulta = select(Mensaje).where(Mensaje.conversacion_id == conversacion_id)
+    mensajes, siguiente = await paginar(db, consulta, (Mensaje.id,), cursor, limit, descendente=True)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return mensajes
 
-        # Procesar el mensaje transcrito con el chat normal
-        respuesta, imagen_url, cliente_id, accion = await chat_con_agente(db, texto_transcrito)
 
-        return {
-            "success": True,
-            "transcripcion": texto_transcrito,
-            "respuesta": respuesta,
-            "imagen_url": imagen_url,
-            "cliente_id": cliente_id,
-            "accion": accion
+@router.get("/metricas")
+def obtener_metricas(current_user: dict = Depends(get_current_user)):
+    """Métricas del agente: mensajes resueltos sin llamar al modelo, aciertos de caché y tokens por prompt."""
+    return {
+        "intenciones": metricas_intenciones.resumen(),
+        "cache_llm": cache_llm.resumen(),
+        "prompt": metricas_prompt.resumen(),
+    }
+
+
+SIN_TRANSCRIPCION = {
+    "success": False,
+    "error": "No se pudo transcribir el audio",
+    "transcripcion": None,
+    "respuesta": None
+}
+
+
+async def transcribir_audio(audio_bytes: bytes, mime_type: str) -> str:
+    """Transcribe el audio con Gemini (cadena vacía si no se entendió nada)."""
+    # Preparar el audio para Gemini
+    audio_part = {
+        "inline_data": {
+            "mime_type": mime_type,
+            "data": audio_bytes
         }
+    }
+
+    transcripcion = await obtener_cliente_llm().generar([
+        "Transcribe exactamente lo que dice este audio en español. "
+        "Solo responde con la transcripción, sin explicaciones adicionales.",
+        audio_part
+    ])
+    return transcripcion.strip()
+
+
+async def responder_transcripcion(db: AsyncSession, texto_transcrito: str, conversacion_id: str) -> dict:
+    """Procesa el mensaje transcrito con el chat normal."""
+    respuesta, imagen_url, cliente_id, accion = await chat_con_agente(db, texto_transcrito, conversacion_id)
+
+    return {
+        "success": True,
+        "transcripcion": texto_transcrito,
+        "respuesta": respuesta,
+        "imagen_url": imagen_url,
+        "cliente_id": cliente_id,
+        "accion": accion
+    }
+
+
+async def procesar_voz(db: AsyncSession, audio_bytes: bytes, mime_type: str, conversacion_id: str) -> dict:
+    """Transcribe el audio con Gemini y procesa el mensaje con el chat normal."""
+    texto_transcrito = await transcribir_audio(audio_bytes, mime_type)
+    if not texto_transcrito:
+        return SIN_TRANSCRIPCION
+    return await responder_transcripcion(db, texto_transcrito, conversacion_id)
+
+
+@manejador("transcribir_voz")
+async def trabajo_voz(parametros: dict) -> dict:
+    # chat_con_agente guarda el turno (mensajes y herramientas) al final:
+    # repetirlo podría registrar dos veces un préstamo o un abono.
+    # La transcripción queda guardada en el trabajo y, una vez empezado el
+    # chat, el trabajo ya no se reintenta
+    if parametros.get("chat_iniciado"):
+        raise ErrorPermanente("El mensaje ya se procesó en un intento anterior; revisa el historial del chat")
+    texto_transcrito = parametros.get("transcripcion")
+    if texto_transcrito is None:
+        ruta = Path(parametros[PARAMETRO_ARCHIVO])
+        if not ruta.exists():
+            raise ErrorPermanente("El audio del trabajo ya no existe")
+        audio_bytes = await run_in_threadpool(ruta.read_bytes)
+        texto_transcrito = await transcribir_audio(audio_bytes, parametros["mime_type"])
+        await guardar_avance(parametros, transcripcion=texto_transcrito)
+    if not texto_transcrito:
+        return SIN_TRANSCRIPCION
+    await guardar_avance(parametros, chat_iniciado=True)
+    async with AsyncSessionLocal() as db:
+        return await responder_transcripcion(db, texto_transcrito, parametros["conversacion_id"])
+
+
+@router.post("/voz")
+async def procesar_mensaje_voz(
+    response: Response,
+    audio: UploadFile = File(...),
+    conversacion_id: str = Form(CONVERSACION_POR_DEFECTO),
+    asincrono: bool = False,
+    webhook_url: Optional[WebhookUrl] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Recibe audio, lo transcribe con Gemini y procesa el mensaje.
+
+    Con ?asincrono=true guarda el audio, encola el trabajo y responde 202 con
+    su id de inmediato; el resultado (mismos campos) queda en GET
+    /trabajos/{id}, en /trabajos/{id}/eventos y, si se indica, en `webhook_url`.
+    """
+    max_bytes = settings.MAX_SUBIDA_AUDIO_MB * 1024 * 1024
+    mime_type = audio.content_type or "audio/webm"
+    if asincrono:
+        webhook_url = await validar_webhook(webhook_url)
+        ruta = await guardar_entrada(audio, max_bytes, "audio")
+        trabajo = await encolar(db, "transcribir_voz", {
+            PARAMETRO_ARCHIVO: ruta, "mime_type": mime_type, "conversacion_id": conversacion_id
+        }, webhook_url)
+        response.status_code = 202
+        return trabajo_encolado(trabajo)
+
+    try:
+        # Leer el audio (con límite de tamaño)
+        audio_bytes = await leer_subida(audio, max_bytes)
+        return await procesar_voz(db, audio_bytes, mime_type, conversacion_id)
 
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -1,99 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from typing import List, Literal, Optional
+from app.core.database import get_async_db
+from app.core.paginacion import CABECERA_CURSOR, LimitePagina, exportar_ndjson, paginar
 from app.core.security import get_current_user
-from app.models import Cliente, MovimientoPendiente
+from app.models import Cliente, MovimientoPendiente, SaldoCliente
 from app.schemas import ClienteCreate, ClienteUpdate, ClienteResponse
-import os
-import shutil
-from pathlib import Path
+from app.services.indice_clientes import indice_clientes
+from app.services.almacen_sobres import guardar_imagen_sobre
 
 router = APIRouter(prefix="/clientes", tags=["clientes"])
 
-# Carpeta para guardar imágenes
-UPLOADS_DIR = Path(__file__).parent.parent.parent / "uploads" / "sobres"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-
 
 @router.get("/", response_model=List[ClienteResponse])
-def listar_clientes(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+async def listar_clientes(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = LimitePagina,
+    formato: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Lista todos los clientes."""
-    clientes = db.query(Cliente).offset(skip).limit(limit).all()
+    """Lista los clientes por nombre, paginados por cursor (cabecera X-Next-Cursor).
+
+    Con formato=ndjson transmite todos los clientes, uno por línea.
+    """
+    clave = (Cliente.nombre, Cliente.id)
+    if formato == "ndjson":
+        return exportar_ndjson(
+            select(Cliente), clave,
+            lambda c: ClienteResponse.model_validate(c).model_dump(mode="json")
+        )
+
+    clientes, siguiente = await paginar(db, select(Cliente), clave, cursor, limit)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
     return clientes
 
 
 @router.get("/{cliente_id}", response_model=ClienteResponse)
-def obtener_cliente(
+async def obtener_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene un cliente por ID."""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await db.get(Cliente, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     return cliente
 
 
 @router.post("/", response_model=ClienteResponse)
-def crear_cliente(
+async def crear_cliente(
     cliente: ClienteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea un nuevo cliente."""
     db_cliente = Cliente(**cliente.model_dump())
     db.add(db_cliente)
-    db.commit()
-    db.refresh(db_cliente)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Ya existe un cliente con ese nombre o cédula")
+    await db.refresh(db_cliente)
+    indice_clientes.actualizar(db_cliente.id, db_cliente.nombre)
     return db_cliente
 
 
 @router.put("/{cliente_id}", response_model=ClienteResponse)
-def actualizar_cliente(
+async def actualizar_cliente(
     cliente_id: int,
     cliente: ClienteUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza un cliente existente."""
-    db_cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    db_cliente = await db.get(Cliente, cliente_id)
     if not db_cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
     for key, value in cliente.model_dump(exclude_unset=True).items():
         setattr(db_cliente, key, value)
 
-    db.commit()
-    db.refresh(db_cliente)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Ya existe un cliente con ese nombre o cédula")
+    await db.refresh(db_cliente)
+    indice_clientes.actualizar(db_cliente.id, db_cliente.nombre)
     return db_cliente
 
 
 @router.delete("/{cliente_id}")
-def eliminar_cliente(
+async def eliminar_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Elimina un cliente y sus movimientos asociados."""
-    db_cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    db_cliente = await db.get(Cliente, cliente_id)
     if not db_cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
     # Eliminar movimientos pendientes asociados al cliente
-    db.query(MovimientoPendiente).filter(
-        MovimientoPendiente.cliente_id == cliente_id
-    ).delete()
+    await db.execute(delete(MovimientoPendiente).where(MovimientoPendiente.cliente_id == cliente_id))
+    await db.execute(delete(SaldoCliente).where(SaldoCliente.cliente_id == cliente_id))
 
-    # Eliminar cliente
-    db.delete(db_cliente)
-    db.commit()
+    # Eliminar cliente (su imagen la borra reconciliar_sobres si nadie más la usa)
+    await db.delete(db_cliente)
+    await db.commit()
+    indice_clientes.eliminar(cliente_id)
     return {"message": "Cliente eliminado"}
 
 
@@ -101,29 +123,24 @@ def eliminar_cliente(
 async def subir_imagen_sobre(
     cliente_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Sube una imagen del sobre de un cliente (almacenamiento local)."""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await db.get(Cliente, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-    # Obtener extensión del archivo
-    ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    filename = f"cliente_{cliente_id}.{ext}"
-    filepath = UPLOADS_DIR / filename
-
     try:
-        # Guardar archivo
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Guardar archivo en el almacén por contenido (con miniaturas)
+        imagen_url = await guardar_imagen_sobre(file)
 
         # Guardar URL relativa en la BD
-        imagen_url = f"/uploads/sobres/{filename}"
         cliente.imagen_sobre_url = imagen_url
-        db.commit()
+        await db.commit()
 
         return {"imagen_url": imagen_url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir imagen: {str(e)}")
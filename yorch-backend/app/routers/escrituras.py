@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.core.database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, UploadFile, File, Form, Response
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile as ArchivoFormulario
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+from app.core.database import get_async_db, AsyncSessionLocal
+from app.core.paginacion import CABECERA_CURSOR, LimitePagina, exportar_ndjson, paginar
+from app.core.config import settings
 from app.core.security import get_current_user
-from app.models import Escritura
+from app.models import Escritura, EscrituraArchivo
+from app.services.almacen_sobres import extension_de
+from app.services.archivos_escritura import MIME_PDF, describir_archivo, url_archivo
+from app.services.subidas import guardar_subida
+from app.services.trabajos import encolar
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
+import asyncio
+import json
 import re
 import shutil
 
@@ -14,6 +26,9 @@ router = APIRouter(prefix="/escrituras", tags=["escrituras"])
 UPLOADS_DIR = Path(__file__).parent.parent.parent / "uploads" / "escrituras"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Archivos de una misma escritura que se escriben a disco a la vez
+CONCURRENCIA_ARCHIVOS_ESCRITURA = 8
+
 
 def limpiar_nombre_carpeta(nombre: str) -> str:
     """Limpia el nombre para usarlo como nombre de carpeta."""
@@ -22,132 +37,306 @@ def limpiar_nombre_carpeta(nombre: str) -> str:
     return nombre.lower()
 
 
-@router.post("")
-async def crear_escritura(
-    nombre_propietario: str = Form(...),
-    notas: Optional[str] = Form(None),
-    archivos: List[UploadFile] = File(...),
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
-):
-    """Crea una escritura con sus archivos (PDF o imágenes)."""
+def nombre_archivo(indice: int, nombre_original: Optional[str]) -> str:
+    """Nombre con el que se guarda el archivo en la posición `indice` (desde 0).
 
-    if not archivos or len(archivos) == 0:
-        raise HTTPException(status_code=400, detail="Debe subir al menos un archivo")
+    Depende solo del orden de subida, no del orden en que terminan las copias.
+    La extensión del cliente se limpia (ver extension_de) para que el nombre
+    siempre pase PATRON_NOMBRE_ESCRITURA al servirlo.
+    """
+    ext = extension_de(nombre_original)
+    if ext == "pdf":
+        return f"documento_{indice + 1}.pdf"
+    return f"imagen_{indice + 1}.{ext}"
 
-    # Crear nombre de carpeta único
-    nombre_carpeta = limpiar_nombre_carpeta(nombre_propietario)
-    carpeta_path = UPLOADS_DIR / nombre_carpeta
 
-    # Si ya existe la carpeta, agregar un sufijo numérico
+def reservar_carpeta(nombre_propietario: str) -> Tuple[str, Path]:
+    """Crea la carpeta de la escritura; si ya existe, agrega un sufijo numérico.
+
+    mkdir sin exist_ok reserva el nombre de forma atómica: dos subidas
+    simultáneas del mismo propietario nunca comparten carpeta.
+    """
+    carpeta_original = limpiar_nombre_carpeta(nombre_propietario)
+    nombre_carpeta = carpeta_original
     contador = 1
-    carpeta_original = nombre_carpeta
-    while carpeta_path.exists():
-        nombre_carpeta = f"{carpeta_original}_{contador}"
+    while True:
         carpeta_path = UPLOADS_DIR / nombre_carpeta
-        contador += 1
+        try:
+            carpeta_path.mkdir(parents=True)
+            return nombre_carpeta, carpeta_path
+        except FileExistsError:
+            nombre_carpeta = f"{carpeta_original}_{contador}"
+            contador += 1
 
-    try:
-        # Crear carpeta
-        carpeta_path.mkdir(parents=True, exist_ok=True)
 
-        # Guardar archivos
-        archivos_guardados = []
-        for i, archivo in enumerate(archivos):
-            # Determinar extensión
-            ext = archivo.filename.split(".")[-1] if "." in archivo.filename else "jpg"
-
-            # Nombrar archivo según tipo
-            if ext.lower() == "pdf":
-                filename = f"documento_{i+1}.pdf"
-            else:
-                filename = f"imagen_{i+1}.{ext}"
+def _validar_archivos(archivos: List[UploadFile]) -> None:
+    if not archivos or len(archivos) == 0:
+        raise HTTPException(status_code=400, detail="Debe subir al menos un archivo")
 
-            filepath = carpeta_path / filename
 
-            # Guardar archivo
-            contents = await archivo.read()
-            with open(filepath, "wb") as buffer:
-                buffer.write(contents)
+async def ingerir_escritura(
+    db: AsyncSession,
+    nombre_propietario: str,
+    notas: Optional[str],
+    archivos: List[UploadFile]
+) -> AsyncIterator[dict]:
+    """Guarda los archivos de una escritura en paralelo (acotado) y crea su registro.
+
+    Cada archivo queda en el manifiesto (escritura_archivos) con su tamaño,
+    hash, tipo MIME y páginas, en la misma transacción que la escritura.
+    Emite un evento 'archivo' por cada archivo guardado, en el orden en que
+    terminan, y al final uno 'final' con la escritura creada. Si algo falla,
+    cancela y espera las copias en curso antes de borrar la carpeta completa,
+    así que nunca queda una escritura a medias.
+    """
+    nombre_carpeta, carpeta_path = await run_in_threadpool(reservar_carpeta, nombre_propietario)
+    nombres = [nombre_archivo(i, archivo.filename) for i, archivo in enumerate(archivos)]
+    max_bytes = settings.MAX_SUBIDA_ESCRITURA_MB * 1024 * 1024
+    semaforo = asyncio.Semaphore(CONCURRENCIA_ARCHIVOS_ESCRITURA)
+
+    async def guardar(indice: int):
+        async with semaforo:
+            # Guardar archivo por bloques, sin cargarlo completo en memoria
+            guardado = await guardar_subida(archivos[indice], carpeta_path / nombres[indice], max_bytes)
+            mime, paginas = await run_in_threadpool(describir_archivo, guardado.ruta)
+        return indice, EscrituraArchivo(
+            orden=indice,
+            nombre=nombres[indice],
+            nombre_original=archivos[indice].filename,
+            tamano=guardado.tamano,
+            sha256=guardado.sha256,
+            mime=mime,
+            paginas=paginas
+        )
 
-            archivos_guardados.append(filename)
+    tareas = [asyncio.create_task(guardar(i)) for i in range(len(archivos))]
+    registros = []
+    try:
+        for completados, tarea in enumerate(asyncio.as_completed(tareas), start=1):
+            indice, registro = await tarea
+            registros.append(registro)
+            yield {
+                "tipo": "archivo",
+                "indice": indice,
+                "archivo": registro.nombre,
+                "nombre_original": registro.nombre_original,
+                "tamano": registro.tamano,
+                "mime": registro.mime,
+                "paginas": registro.paginas,
+                "completados": completados,
+                "total": len(tareas)
+            }
 
         # Crear registro en base de datos
         nueva_escritura = Escritura(
             nombre_propietario=nombre_propietario,
             carpeta=nombre_carpeta,
             notas=notas,
-            cantidad_archivos=len(archivos_guardados)
+            cantidad_archivos=len(nombres)
         )
         db.add(nueva_escritura)
-        db.commit()
-        db.refresh(nueva_escritura)
-
-        return {
-            "success": True,
-            "escritura": {
-                "id": nueva_escritura.id,
-                "nombre_propietario": nueva_escritura.nombre_propietario,
-                "carpeta": nombre_carpeta,
-                "cantidad_archivos": len(archivos_guardados),
-                "archivos": archivos_guardados
-            },
-            "mensaje": f"Escritura de '{nombre_propietario}' guardada con {len(archivos_guardados)} archivo(s)"
-        }
+        await db.flush()
+        for registro in registros:
+            registro.escritura_id = nueva_escritura.id
+        db.add_all(registros)
+        await db.commit()
+        await db.refresh(nueva_escritura)
+
+    except BaseException as e:
+        # Ninguna copia puede seguir escribiendo en la carpeta mientras se borra
+        for t in tareas:
+            t.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        await run_in_threadpool(shutil.rmtree, carpeta_path, True)
+        await db.rollback()
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        raise HTTPException(status_code=500, detail=f"Error al guardar escritura: {str(e)}")
 
+    # Miniaturas y vistas previas fuera de la petición (si falla, se generan al pedirlas)
+    trabajo_id = None
+    try:
+        trabajo = await encolar(db, "versiones_escritura", {"carpeta": str(carpeta_path), "archivos": nombres})
+        trabajo_id = trabajo.id
     except Exception as e:
-        # Limpiar carpeta si hubo error
-        if carpeta_path.exists():
-            shutil.rmtree(carpeta_path)
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error al guardar escritura: {str(e)}")
+        await db.rollback()
+        print(f"[DEBUG] No se pudo encolar las versiones de la escritura {nueva_escritura.id}: {e}")
+
+    yield {
+        "tipo": "final",
+        "success": True,
+        "escritura": {
+            "id": nueva_escritura.id,
+            "nombre_propietario": nueva_escritura.nombre_propietario,
+            "carpeta": nombre_carpeta,
+            "cantidad_archivos": len(nombres),
+            "archivos": nombres
+        },
+        "trabajo_versiones_id": trabajo_id,
+        "mensaje": f"Escritura de '{nombre_propietario}' guardada con {len(nombres)} archivo(s)"
+    }
 
 
-@router.get("")
-def listar_escrituras(
-    db: Session = Depends(get_db),
+@router.post("")
+async def crear_escritura(
+    nombre_propietario: str = Form(...),
+    notas: Optional[str] = Form(None),
+    archivos: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Crea una escritura con sus archivos (PDF o imágenes).
+
+    Los archivos se escriben en paralelo; los nombres (documento_N / imagen_N)
+    siguen el orden de subida.
+    """
+    _validar_archivos(archivos)
+
+    resultado = None
+    async for evento in ingerir_escritura(db, nombre_propietario, notas, archivos):
+        if evento.pop("tipo") == "final":
+            resultado = evento
+    return resultado
+
+
+@router.post("/stream")
+async def crear_escritura_stream(
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
-    """Lista todas las escrituras."""
-    escrituras = db.query(Escritura).order_by(Escritura.created_at.desc()).all()
+    """
+    Igual que POST /escrituras (mismo formulario) pero responde con Server-Sent Events.
+    Envía un evento 'archivo' por cada archivo guardado (indice, archivo,
+    nombre_original, tamano, completados, total), un evento 'final' con la
+    misma respuesta que POST /escrituras, o un evento 'error' (status, detail).
+    """
+    # El formulario se lee a mano: FastAPI cierra los archivos de los
+    # parámetros File(...) al volver la ruta, antes de que empiece el stream
+    formulario = await request.form()
+    nombre_propietario = formulario.get("nombre_propietario")
+    notas = formulario.get("notas") or None
+    archivos = [a for a in formulario.getlist("archivos") if isinstance(a, ArchivoFormulario)]
+    try:
+        if not isinstance(nombre_propietario, str) or not nombre_propietario.strip():
+            raise HTTPException(status_code=400, detail="Debe indicar el nombre del propietario")
+        _validar_archivos(archivos)
+    except HTTPException:
+        await formulario.close()
+        raise
+
+    async def eventos():
+        try:
+            # Sesión propia: la de get_async_db se cierra antes de que empiece el streaming
+            async with AsyncSessionLocal() as db:
+                try:
+                    async for evento in ingerir_escritura(db, nombre_propietario, notas, archivos):
+                        tipo = evento.pop("tipo")
+                        yield f"event: {tipo}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+                except HTTPException as e:
+                    error = {"status": e.status_code, "detail": e.detail}
+                    yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+        finally:
+            await formulario.close()
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita que nginx acumule el stream
+        }
+    )
+
 
+def _escritura_a_dict(e: Escritura) -> dict:
+    return {
+        "id": e.id,
+        "nombre_propietario": e.nombre_propietario,
+        "carpeta": e.carpeta,
+        "notas": e.notas,
+        "cantidad_archivos": e.cantidad_archivos,
+        "created_at": e.created_at.isoformat() if e.created_at else None
+    }
+
+
+@router.get("")
+async def listar_escrituras(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = LimitePagina,
+    formato: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Lista las escrituras, más recientes primero, paginadas por cursor (cabecera X-Next-Cursor).
+
+    Cada escritura trae `portada_url`, la miniatura de su primer archivo (unos
+    KB, se genera la primera vez que se pide). Con formato=ndjson transmite
+    todas las escrituras, una por línea, sin portada.
+    """
+    clave = (Escritura.created_at, Escritura.id)
+    if formato == "ndjson":
+        return exportar_ndjson(select(Escritura), clave, _escritura_a_dict, descendente=True)
+
+    escrituras, siguiente = await paginar(db, select(Escritura), clave, cursor, limit, descendente=True)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+
+    # Primer archivo de todas las escrituras de la página en una sola consulta
+    portadas = {}
+    if escrituras:
+        portadas = {a.escritura_id: a for a in (await db.scalars(
+            select(EscrituraArchivo).where(
+                EscrituraArchivo.escritura_id.in_([e.id for e in escrituras]),
+                EscrituraArchivo.orden == 0
+            )
+        )).all()}
     return [
         {
-            "id": e.id,
-            "nombre_propietario": e.nombre_propietario,
-            "carpeta": e.carpeta,
-            "notas": e.notas,
-            "cantidad_archivos": e.cantidad_archivos,
-            "created_at": e.created_at.isoformat() if e.created_at else None
+            **_escritura_a_dict(e),
+            "portada_url": url_archivo(e.carpeta, portadas[e.id], "miniatura") if e.id in portadas else None
         }
         for e in escrituras
     ]
 
 
+def _archivo_a_dict(carpeta: str, a: EscrituraArchivo) -> dict:
+    return {
+        "nombre": a.nombre,
+        "url": url_archivo(carpeta, a),
+        "miniatura_url": url_archivo(carpeta, a, "miniatura"),
+        "vista_url": url_archivo(carpeta, a, "vista"),
+        "tipo": "pdf" if a.mime == MIME_PDF else "imagen",
+        "mime": a.mime,
+        "tamano": a.tamano,
+        "paginas": a.paginas,
+        "sha256": a.sha256
+    }
+
+
 @router.get("/{escritura_id}")
-def obtener_escritura(
+async def obtener_escritura(
     escritura_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene una escritura con sus archivos."""
-    escritura = db.query(Escritura).filter(Escritura.id == escritura_id).first()
-
-    if not escritura:
+    """Obtiene una escritura con sus archivos.
+
+    Los archivos salen del manifiesto en la misma consulta (sin listar la
+    carpeta en disco), en el orden en que se subieron.
+    """
+    filas = (await db.execute(
+        select(Escritura, EscrituraArchivo)
+        .outerjoin(EscrituraArchivo, EscrituraArchivo.escritura_id == Escritura.id)
+        .where(Escritura.id == escritura_id)
+        .order_by(EscrituraArchivo.orden)
+    )).all()
+
+    if not filas:
         raise HTTPException(status_code=404, detail="Escritura no encontrada")
 
-    # Listar archivos en la carpeta
-    carpeta_path = UPLOADS_DIR / escritura.carpeta
-    archivos = []
-
-    if carpeta_path.exists():
-        for archivo in carpeta_path.iterdir():
-            if archivo.is_file():
-                archivos.append({
-                    "nombre": archivo.name,
-                    "url": f"/uploads/escrituras/{escritura.carpeta}/{archivo.name}",
-                    "tipo": "pdf" if archivo.suffix.lower() == ".pdf" else "imagen"
-                })
+    escritura = filas[0][0]
+    archivos = [_archivo_a_dict(escritura.carpeta, archivo) for _, archivo in filas if archivo is not None]
 
     return {
         "id": escritura.id,
@@ -161,32 +350,35 @@ def obtener_escritura(
 
 
 @router.delete("/{escritura_id}")
-def eliminar_escritura(
+async def eliminar_escritura(
     escritura_id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Elimina una escritura y sus archivos."""
-    escritura = db.query(Escritura).filter(Escritura.id == escritura_id).first()
+    """Elimina una escritura y sus archivos.
+
+    Primero se borran los registros; la carpeta se borra después de responder
+    (si eso falla, scripts/verificar_escrituras.py la reporta como huérfana).
+    """
+    escritura = await db.get(Escritura, escritura_id)
 
     if not escritura:
         raise HTTPException(status_code=404, detail="Escritura no encontrada")
 
     try:
-        # Eliminar carpeta con archivos
-        carpeta_path = UPLOADS_DIR / escritura.carpeta
-        if carpeta_path.exists():
-            shutil.rmtree(carpeta_path)
-
-        # Eliminar registro
-        db.delete(escritura)
-        db.commit()
-
-        return {
-            "success": True,
-            "mensaje": f"Escritura de '{escritura.nombre_propietario}' eliminada"
-        }
-
+        # Eliminar registros (el manifiesto explícitamente: SQLite no aplica ON DELETE CASCADE)
+        await db.execute(delete(EscrituraArchivo).where(EscrituraArchivo.escritura_id == escritura.id))
+        await db.delete(escritura)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al eliminar escritura: {str(e)}")
+
+    # Eliminar carpeta con archivos, fuera del tiempo de respuesta
+    background_tasks.add_task(shutil.rmtree, UPLOADS_DIR / escritura.carpeta, True)
+
+    return {
+        "success": True,
+        "mensaje": f"Escritura de '{escritura.nombre_propietario}' eliminada"
+    }
@@ -1,111 +1,259 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Tuple
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.core.paginacion import CABECERA_CURSOR, LimitePagina, exportar_ndjson, paginar
 from app.core.security import get_current_user
-from app.models import MovimientoPendiente, Cliente
-from app.schemas import MovimientoCreate, MovimientoResponse, MovimientoConCliente
+from app.models import MovimientoPendiente, Cliente, SaldoCliente
+from app.schemas import (
+    MovimientoCreate, MovimientoResponse, MovimientoConCliente, SaldoResponse,
+    ErrorFilaLote, LoteMovimientosResponse
+)
+from app.services.saldos import registrar_movimiento, registrar_movimientos, marcar_procesados
+import csv
+import io
+import json
 
 router = APIRouter(prefix="/movimientos", tags=["movimientos"])
 
 
 @router.get("/pendientes", response_model=List[MovimientoConCliente])
-def listar_pendientes(
-    db: Session = Depends(get_db),
+async def listar_pendientes(
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Lista todos los movimientos pendientes."""
-    movimientos = db.query(MovimientoPendiente).filter(
-        MovimientoPendiente.procesado == False
-    ).all()
+    # El nombre del cliente viene en la misma consulta (JOIN), no uno por fila.
+    # Mismo orden que el índice parcial de pendientes: no hace falta ordenar aparte.
+    # Columnas sueltas y diccionarios: FastAPI valida la respuesta una sola vez,
+    # sin armar objetos ORM ni modelos intermedios por fila
+    filas = (await db.execute(
+        select(
+            MovimientoPendiente.id,
+            MovimientoPendiente.cliente_id,
+            MovimientoPendiente.tipo,
+            MovimientoPendiente.monto,
+            MovimientoPendiente.notas,
+            MovimientoPendiente.procesado,
+            MovimientoPendiente.created_at,
+            MovimientoPendiente.procesado_at,
+            Cliente.nombre.label("cliente_nombre")
+        ).join(
+            Cliente, Cliente.id == MovimientoPendiente.cliente_id
+        ).where(
+            MovimientoPendiente.procesado == False
+        ).order_by(
+            MovimientoPendiente.cliente_id,
+            MovimientoPendiente.created_at
+        )
+    )).mappings()
+
+    return [dict(fila) for fila in filas]
+
+
+@router.get("/saldos", response_model=List[SaldoResponse])
+async def listar_saldos(
+    solo_pendientes: bool = True,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Lista los saldos precalculados por cliente."""
+    consulta = select(SaldoCliente, Cliente.nombre).join(
+        Cliente, Cliente.id == SaldoCliente.cliente_id
+    )
+    if solo_pendientes:
+        consulta = consulta.where(SaldoCliente.cantidad_pendientes > 0)
+    filas = (await db.execute(consulta.order_by(Cliente.nombre))).all()
 
     return [
-        MovimientoConCliente(
-            id=m.id,
-            cliente_id=m.cliente_id,
-            tipo=m.tipo,
-            monto=m.monto,
-            notas=m.notas,
-            procesado=m.procesado,
-            created_at=m.created_at,
-            procesado_at=m.procesado_at,
-            cliente_nombre=m.cliente.nombre
+        SaldoResponse(
+            cliente_id=saldo.cliente_id,
+            cliente_nombre=nombre,
+            pendiente_prestamos=saldo.pendiente_prestamos,
+            pendiente_abonos=saldo.pendiente_abonos,
+            cantidad_pendientes=saldo.cantidad_pendientes,
+            total_prestamos=saldo.total_prestamos,
+            total_abonos=saldo.total_abonos
         )
-        for m in movimientos
+        for saldo, nombre in filas
     ]
 
 
 @router.get("/", response_model=List[MovimientoResponse])
-def listar_movimientos(
-    skip: int = 0,
-    limit: int = 100,
+async def listar_movimientos(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = LimitePagina,
     solo_pendientes: bool = False,
-    db: Session = Depends(get_db),
+    formato: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Lista todos los movimientos."""
-    query = db.query(MovimientoPendiente)
+    """Lista los movimientos, más recientes primero, paginados por cursor (cabecera X-Next-Cursor).
+
+    Con formato=ndjson transmite todos los movimientos, uno por línea.
+    """
+    clave = (MovimientoPendiente.created_at, MovimientoPendiente.id)
+
+    consulta = select(MovimientoPendiente)
     if solo_pendientes:
-        query = query.filter(MovimientoPendiente.procesado == False)
-    movimientos = query.offset(skip).limit(limit).all()
+        consulta = consulta.where(MovimientoPendiente.procesado == False)
+
+    if formato == "ndjson":
+        return exportar_ndjson(
+            consulta, clave,
+            lambda m: MovimientoResponse.model_validate(m).model_dump(mode="json"),
+            descendente=True
+        )
+
+    movimientos, siguiente = await paginar(db, consulta, clave, cursor, limit, descendente=True)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
     return movimientos
 
 
 @router.post("/", response_model=MovimientoResponse)
-def crear_movimiento(
+async def crear_movimiento(
     movimiento: MovimientoCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea un nuevo movimiento."""
     # Verificar que el cliente existe
-    cliente = db.query(Cliente).filter(Cliente.id == movimiento.cliente_id).first()
+    cliente = await db.get(Cliente, movimiento.cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
     db_movimiento = MovimientoPendiente(**movimiento.model_dump())
     db.add(db_movimiento)
-    db.commit()
-    db.refresh(db_movimiento)
+    await db.run_sync(registrar_movimiento, db_movimiento)
+    # Recargar antes del commit, dentro de la misma transacción (después abriría otra)
+    await db.flush()
+    await db.refresh(db_movimiento)
+    await db.commit()
     return db_movimiento
 
 
+def _leer_filas_lote(cuerpo: bytes, content_type: str) -> List[dict]:
+    """Devuelve las filas crudas del lote, desde JSON (lista de objetos) o CSV con encabezado."""
+    if "csv" in content_type:
+        try:
+            texto = cuerpo.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="El CSV debe estar en UTF-8")
+        filas = []
+        for fila in csv.DictReader(io.StringIO(texto)):
+            fila = {(k or "").strip().lower(): (v or "").strip() for k, v in fila.items()}
+            fila["tipo"] = fila.get("tipo", "").upper()
+            fila["notas"] = fila.get("notas") or None
+            filas.append(fila)
+        return filas
+
+    try:
+        filas = json.loads(cuerpo)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="Se esperaba una lista de movimientos")
+    return filas
+
+
+def _validar_filas(filas: List[dict]) -> Tuple[List[Tuple[int, MovimientoCreate]], List[ErrorFilaLote]]:
+    validas, errores = [], []
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            validas.append((numero, MovimientoCreate.model_validate(fila)))
+        except ValidationError as e:
+            detalle = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errores.append(ErrorFilaLote(fila=numero, error=detalle))
+    return validas, errores
+
+
+@router.post("/lote", response_model=LoteMovimientosResponse)
+async def crear_movimientos_lote(
+    request: Request,
+    modo: Literal["todo_o_nada", "por_fila"] = "todo_o_nada",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Crea varios movimientos de una vez (cuadre de sobres al final del día).
+
+    El cuerpo es una lista JSON de movimientos o un CSV (Content-Type text/csv)
+    con encabezado cliente_id,tipo,monto,notas. Los clientes se validan en una
+    sola consulta, los movimientos se insertan en una sola sentencia y los
+    saldos se actualizan en la misma transacción. Las filas se numeran desde 1.
+
+    - todo_o_nada: si alguna fila es inválida no se guarda nada (422 con los errores).
+    - por_fila: se guardan las filas válidas y se devuelven los errores de las demás.
+    """
+    filas = _leer_filas_lote(await request.body(), request.headers.get("content-type", ""))
+    if not filas:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(filas) > settings.MAX_FILAS_LOTE:
+        raise HTTPException(status_code=400, detail=f"El lote supera el máximo de {settings.MAX_FILAS_LOTE} filas")
+
+    validas, errores = _validar_filas(filas)
+
+    # Todos los clientes del lote en una sola consulta
+    ids = {mov.cliente_id for _, mov in validas}
+    existentes = set((await db.scalars(select(Cliente.id).where(Cliente.id.in_(ids)))).all()) if ids else set()
+    for numero, mov in validas:
+        if mov.cliente_id not in existentes:
+            errores.append(ErrorFilaLote(fila=numero, error=f"Cliente {mov.cliente_id} no encontrado"))
+    validas = [(numero, mov) for numero, mov in validas if mov.cliente_id in existentes]
+    errores.sort(key=lambda e: e.fila)
+
+    if errores and modo == "todo_o_nada":
+        raise HTTPException(status_code=422, detail={
+            "mensaje": "El lote tiene filas inválidas; no se guardó ningún movimiento",
+            "errores": [e.model_dump() for e in errores]
+        })
+    if not validas:
+        return LoteMovimientosResponse(creados=[], errores=errores)
+
+    try:
+        creados = (await db.scalars(
+            insert(MovimientoPendiente).returning(MovimientoPendiente),
+            [mov.model_dump() for _, mov in validas]
+        )).all()
+        await db.run_sync(registrar_movimientos, [(m.cliente_id, m.tipo, m.monto) for m in creados])
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al guardar el lote: {str(e)}")
+
+    return LoteMovimientosResponse(creados=creados, errores=errores)
+
+
 @router.put("/{movimiento_id}/procesar")
-def marcar_procesado(
+async def marcar_procesado(
     movimiento_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Marca un movimiento como procesado."""
-    movimiento = db.query(MovimientoPendiente).filter(
-        MovimientoPendiente.id == movimiento_id
-    ).first()
+    movimiento = await db.get(MovimientoPendiente, movimiento_id)
 
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
 
-    movimiento.procesado = True
-    movimiento.procesado_at = datetime.utcnow()
-    db.commit()
+    await db.run_sync(marcar_procesados, MovimientoPendiente.id == movimiento_id)
+    await db.commit()
 
     return {"message": "Movimiento marcado como procesado"}
 
 
 @router.put("/procesar-cliente/{cliente_id}")
-def marcar_procesados_cliente(
+async def marcar_procesados_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Marca todos los movimientos de un cliente como procesados."""
-    count = db.query(MovimientoPendiente).filter(
-        MovimientoPendiente.cliente_id == cliente_id,
-        MovimientoPendiente.procesado == False
-    ).update({
-        "procesado": True,
-        "procesado_at": datetime.utcnow()
-    })
-    db.commit()
+    count = (await db.run_sync(marcar_procesados, MovimientoPendiente.cliente_id == cliente_id))[cliente_id]
+    await db.commit()
 
     return {"message": f"{count} movimientos marcados como procesados"}
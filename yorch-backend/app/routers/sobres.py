@@ -1,33 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from starlette.datastructures import UploadFile as ArchivoFormulario
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from app.core.database import get_async_db
 from app.core.config import settings
 from app.core.security import get_current_user
-from app.models import Cliente, MovimientoPendiente
-from datetime import datetime
+from app.core.texto import normalizar_nombre
+from app.models import Cliente, MovimientoPendiente, SaldoCliente
+from app.schemas import WebhookUrl
+from app.services.indice_clientes import indice_clientes
+from app.services.imagenes import preparar_para_ocr
+from app.services.llm import obtener_cliente_llm
+from app.services.almacen_sobres import extension_de, guardar_imagen_sobre
+from app.services.subidas import leer_subida
+from app.services.saldos import marcar_procesados
+from app.services.trabajos import (
+    PARAMETRO_ARCHIVO, ErrorPermanente, encolar, guardar_entrada, manejador, trabajo_encolado,
+    validar_webhook
+)
 from pathlib import Path
-import shutil
-import re
-import google.generativeai as genai
-
-router = APIRouter(prefix="/sobres", tags=["sobres"])
-
-# Configurar Gemini
-if settings.GEMINI_API_KEY:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-
-# Carpeta para guardar imágenes
-UPLOADS_DIR = Path(__file__).parent.parent.parent / "uploads" / "sobres"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+from typing import Optional
+import asyncio
 
+# Imágenes que se escriben a la vez en un procesamiento por lote
+CONCURRENCIA_IMAGENES_LOTE = 8
 
-def limpiar_nombre_archivo(nombre: str) -> str:
-    """Limpia el nombre para usarlo como nombre de archivo."""
-    # Remover caracteres especiales, mantener letras, números, espacios y guiones
-    nombre = re.sub(r'[^\w\s-]', '', nombre)
-    # Reemplazar espacios por guiones bajos
-    nombre = nombre.strip().replace(' ', '_')
-    return nombre.lower()
+router = APIRouter(prefix="/sobres", tags=["sobres"])
 
 
 def to_title_case(nombre: str) -> str:
@@ -35,33 +36,7 @@ def to_title_case(nombre: str) -> str:
     return ' '.join(word.capitalize() for word in nombre.lower().split())
 
 
-def normalizar_nombre(nombre: str) -> str:
-    """Normaliza el nombre para comparación (minúsculas, sin espacios extra)."""
-    return ' '.join(nombre.lower().split())
-
-
-@router.post("/extraer-nombre")
-async def extraer_nombre_de_sobre(
-    file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
-):
-    """Usa Gemini Vision para extraer el nombre del cliente de la imagen del sobre."""
-    try:
-        # Leer contenido de la imagen
-        contents = await file.read()
-
-        # Crear modelo con visión
-        model = genai.GenerativeModel('models/gemini-flash-latest')
-
-        # Preparar la imagen para Gemini usando inline_data
-        image_part = {
-            "inline_data": {
-                "mime_type": file.content_type or "image/jpeg",
-                "data": contents
-            }
-        }
-
-        prompt = """Analiza esta imagen de un sobre de préstamos.
+PROMPT_EXTRAER_NOMBRE = """Analiza esta imagen de un sobre de préstamos.
         Extrae ÚNICAMENTE el nombre completo del cliente EXACTAMENTE como aparece escrito en el sobre.
 
         IMPORTANTE:
@@ -76,22 +51,84 @@ async def extraer_nombre_de_sobre(
         Ejemplo: Si el sobre dice "Arteaga Romero Jefersson", responde exactamente "Arteaga Romero Jefersson"
         """
 
-        response = model.generate_content([prompt, image_part])
-        nombre_extraido = response.text.strip()
 
-        if nombre_extraido == "NO_ENCONTRADO" or not nombre_extraido:
-            return {
-                "success": False,
-                "nombre": None,
-                "mensaje": "No se pudo extraer el nombre del sobre. Por favor ingresa el nombre manualmente."
-            }
+async def extraer_nombre(contents: bytes, mime_type: str) -> dict:
+    """Lee el nombre del cliente en la imagen del sobre con Gemini Vision."""
+    if settings.SOBRE_OCR_PREPROCESAR:
+        # Foto del celular (4-12 MB) -> JPEG en grises de ~1600 px: menos subida y menos latencia
+        contents, mime_type = await run_in_threadpool(
+            preparar_para_ocr, contents, mime_type,
+            settings.SOBRE_OCR_MAX_LADO, settings.SOBRE_OCR_CALIDAD_JPEG,
+            settings.sobre_ocr_recorte,
+        )
+
+    # Preparar la imagen para Gemini usando inline_data
+    image_part = {
+        "inline_data": {
+            "mime_type": mime_type,
+            "data": contents
+        }
+    }
 
+    respuesta = await obtener_cliente_llm().generar([PROMPT_EXTRAER_NOMBRE, image_part])
+    nombre_extraido = respuesta.strip()
+
+    if nombre_extraido == "NO_ENCONTRADO" or not nombre_extraido:
         return {
-            "success": True,
-            "nombre": nombre_extraido,
-            "mensaje": f"Nombre extraído: {nombre_extraido}"
+            "success": False,
+            "nombre": None,
+            "mensaje": "No se pudo extraer el nombre del sobre. Por favor ingresa el nombre manualmente."
         }
 
+    return {
+        "success": True,
+        "nombre": nombre_extraido,
+        "mensaje": f"Nombre extraído: {nombre_extraido}"
+    }
+
+
+@manejador("extraer_nombre_sobre")
+async def trabajo_extraer_nombre(parametros: dict) -> dict:
+    ruta = Path(parametros[PARAMETRO_ARCHIVO])
+    if not ruta.exists():
+        raise ErrorPermanente("La imagen del trabajo ya no existe")
+    contents = await run_in_threadpool(ruta.read_bytes)
+    return await extraer_nombre(contents, parametros["mime_type"])
+
+
+@router.post("/extraer-nombre")
+async def extraer_nombre_de_sobre(
+    response: Response,
+    file: UploadFile = File(...),
+    asincrono: bool = False,
+    webhook_url: Optional[WebhookUrl] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Usa Gemini Vision para extraer el nombre del cliente de la imagen del sobre.
+
+    Con ?asincrono=true guarda la imagen, encola el trabajo y responde 202 con
+    su id de inmediato; el resultado (mismos campos) queda en GET
+    /trabajos/{id}, en /trabajos/{id}/eventos y, si se indica, en `webhook_url`.
+    """
+    max_bytes = settings.MAX_SUBIDA_IMAGEN_MB * 1024 * 1024
+    mime_type = file.content_type or "image/jpeg"
+    if asincrono:
+        webhook_url = await validar_webhook(webhook_url)
+        ruta = await guardar_entrada(file, max_bytes, extension_de(file.filename))
+        trabajo = await encolar(
+            db, "extraer_nombre_sobre", {PARAMETRO_ARCHIVO: ruta, "mime_type": mime_type}, webhook_url
+        )
+        response.status_code = 202
+        return trabajo_encolado(trabajo)
+
+    try:
+        # Leer contenido de la imagen
+        contents = await leer_subida(file, max_bytes)
+        return await extraer_nombre(contents, mime_type)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al procesar imagen: {str(e)}")
 
@@ -100,7 +137,7 @@ async def extraer_nombre_de_sobre(
 async def crear_cliente_con_sobre(
     nombre: str,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea un cliente y guarda la imagen del sobre."""
@@ -109,39 +146,30 @@ async def crear_cliente_con_sobre(
     nombre_formateado = to_title_case(nombre.strip())
     nombre_normalizado = normalizar_nombre(nombre)
 
-    # Verificar si ya existe un cliente con el mismo nombre (comparación exacta normalizada)
-    clientes = db.query(Cliente).all()
-    for cliente in clientes:
-        if normalizar_nombre(cliente.nombre) == nombre_normalizado:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Ya existe un cliente con ese nombre: {cliente.nombre}"
-            )
+    # Verificar si ya existe un cliente con el mismo nombre (búsqueda por índice único)
+    existente = await db.scalar(select(Cliente).where(Cliente.nombre_normalizado == nombre_normalizado))
+    if existente:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ya existe un cliente con ese nombre: {existente.nombre}"
+        )
 
     try:
+        # Guardar primero la imagen (por bloques, en el almacén por contenido) para
+        # crear el cliente con su URL en un solo commit
+        imagen_url = await guardar_imagen_sobre(file)
+
         # Crear el cliente con nombre formateado
-        nuevo_cliente = Cliente(nombre=nombre_formateado)
+        nuevo_cliente = Cliente(nombre=nombre_formateado, imagen_sobre_url=imagen_url)
         db.add(nuevo_cliente)
-        db.commit()
-        db.refresh(nuevo_cliente)
-
-        # Guardar imagen con el nombre limpio
-        nombre_archivo = limpiar_nombre_archivo(nombre)
-        ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-        filename = f"{nombre_archivo}.{ext}"
-        filepath = UPLOADS_DIR / filename
-
-        # Resetear el archivo para leerlo de nuevo
-        await file.seek(0)
-        contents = await file.read()
-
-        with open(filepath, "wb") as buffer:
-            buffer.write(contents)
-
-        # Actualizar URL de imagen en el cliente
-        imagen_url = f"/uploads/sobres/{filename}"
-        nuevo_cliente.imagen_sobre_url = imagen_url
-        db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Otra subida creó el mismo nombre entre la verificación y el commit
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Ya existe un cliente con ese nombre")
+        await db.refresh(nuevo_cliente)
+        indice_clientes.actualizar(nuevo_cliente.id, nuevo_cliente.nombre)
 
         return {
             "success": True,
@@ -153,8 +181,10 @@ async def crear_cliente_con_sobre(
             "mensaje": f"Cliente '{nombre_formateado}' creado exitosamente"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear cliente: {str(e)}")
 
 
@@ -162,40 +192,28 @@ async def crear_cliente_con_sobre(
 async def actualizar_sobre_cliente(
     cliente_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza la imagen del sobre de un cliente y marca sus movimientos como procesados."""
 
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await db.get(Cliente, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
     try:
-        # Guardar nueva imagen (sobrescribe la anterior)
-        nombre_archivo = limpiar_nombre_archivo(cliente.nombre)
-        ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-        filename = f"{nombre_archivo}.{ext}"
-        filepath = UPLOADS_DIR / filename
-
-        contents = await file.read()
-        with open(filepath, "wb") as buffer:
-            buffer.write(contents)
+        # Guardar nueva imagen (la URL cambia con el contenido)
+        imagen_url = await guardar_imagen_sobre(file)
 
         # Actualizar URL de imagen
-        imagen_url = f"/uploads/sobres/{filename}"
         cliente.imagen_sobre_url = imagen_url
 
         # Marcar todos los movimientos pendientes de este cliente como procesados
-        movimientos_actualizados = db.query(MovimientoPendiente).filter(
-            MovimientoPendiente.cliente_id == cliente_id,
-            MovimientoPendiente.procesado == False
-        ).update({
-            "procesado": True,
-            "procesado_at": datetime.utcnow()
-        })
+        movimientos_actualizados = (await db.run_sync(
+            marcar_procesados, MovimientoPendiente.cliente_id == cliente_id
+        ))[cliente_id]
 
-        db.commit()
+        await db.commit()
 
         return {
             "success": True,
@@ -208,50 +226,152 @@ async def actualizar_sobre_cliente(
             "mensaje": f"Sobre de '{cliente.nombre}' actualizado. {movimientos_actualizados} movimiento(s) marcado(s) como procesado(s)."
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al actualizar sobre: {str(e)}")
 
 
+@router.post("/procesar-lote")
+async def procesar_sobres_lote(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Procesa muchos sobres de una vez: marca sus pendientes y, opcionalmente, cambia sus imágenes.
+
+    Formulario multipart con `cliente_ids` (repetido o separado por comas) y,
+    por cada cliente que lo necesite, un archivo `imagen_<cliente_id>`. Las
+    imágenes se guardan en paralelo y todos los pendientes se marcan con un
+    solo UPDATE y un solo commit. Devuelve la cantidad procesada por cliente.
+    """
+    formulario = await request.form()
+
+    cliente_ids = []
+    try:
+        for valor in formulario.getlist("cliente_ids"):
+            cliente_ids += [int(parte) for parte in str(valor).split(",") if parte.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cliente_ids debe contener solo números")
+    cliente_ids = list(dict.fromkeys(cliente_ids))
+    if not cliente_ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un cliente")
+
+    imagenes = {}
+    for campo, valor in formulario.multi_items():
+        if not campo.startswith("imagen_"):
+            continue
+        if not isinstance(valor, ArchivoFormulario) or not campo[len("imagen_"):].isdigit():
+            raise HTTPException(status_code=400, detail=f"Campo de imagen inválido: {campo}")
+        imagenes[int(campo[len("imagen_"):])] = valor
+    sobrantes = set(imagenes) - set(cliente_ids)
+    if sobrantes:
+        raise HTTPException(status_code=400, detail=f"Imágenes para clientes fuera del lote: {sorted(sobrantes)}")
+
+    # Todos los clientes en una sola consulta
+    clientes = {c.id: c for c in (await db.scalars(select(Cliente).where(Cliente.id.in_(cliente_ids)))).all()}
+    faltantes = [cid for cid in cliente_ids if cid not in clientes]
+    if faltantes:
+        raise HTTPException(status_code=404, detail=f"Clientes no encontrados: {faltantes}")
+
+    # Guardar las imágenes en paralelo (acotado)
+    semaforo = asyncio.Semaphore(CONCURRENCIA_IMAGENES_LOTE)
+
+    async def guardar(archivo):
+        async with semaforo:
+            return await guardar_imagen_sobre(archivo)
+
+    ids_con_imagen = list(imagenes)
+    resultados = await asyncio.gather(
+        *(guardar(imagenes[cid]) for cid in ids_con_imagen), return_exceptions=True
+    )
+    urls = {cid: r for cid, r in zip(ids_con_imagen, resultados) if isinstance(r, str)}
+    error = next((r for r in resultados if isinstance(r, BaseException)), None)
+    if error:
+        if isinstance(error, HTTPException):
+            raise error
+        raise HTTPException(status_code=500, detail=f"Error al guardar imágenes: {str(error)}")
+
+    try:
+        for cid, url in urls.items():
+            clientes[cid].imagen_sobre_url = url
+
+        # Un solo UPDATE para todos los pendientes del lote
+        procesados = await db.run_sync(
+            marcar_procesados, MovimientoPendiente.cliente_id.in_(cliente_ids)
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al procesar sobres: {str(e)}")
+
+    return {
+        "success": True,
+        "clientes": [
+            {
+                "cliente_id": cid,
+                "nombre": clientes[cid].nombre,
+                "imagen_sobre_url": clientes[cid].imagen_sobre_url,
+                "movimientos_procesados": procesados[cid]
+            }
+            for cid in cliente_ids
+        ],
+        "movimientos_procesados": sum(procesados.values()),
+        "mensaje": f"{len(cliente_ids)} sobre(s) procesado(s), {sum(procesados.values())} movimiento(s) marcado(s) como procesado(s)."
+    }
+
+
 @router.get("/pendientes")
-def obtener_clientes_con_pendientes(
-    db: Session = Depends(get_db),
+async def obtener_clientes_con_pendientes(
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene la lista de clientes que tienen movimientos pendientes con detalle."""
-    from sqlalchemy import func, case
     from collections import defaultdict
 
-    # Obtener todos los movimientos pendientes con info del cliente
-    movimientos = db.query(
-        MovimientoPendiente,
-        Cliente.nombre,
-        Cliente.imagen_sobre_url
-    ).join(
-        Cliente,
-        Cliente.id == MovimientoPendiente.cliente_id
-    ).filter(
-        MovimientoPendiente.procesado == False
-    ).order_by(
-        Cliente.nombre,
-        MovimientoPendiente.created_at.desc()
-    ).all()
-
-    # Agrupar por cliente
-    clientes_dict = defaultdict(lambda: {
-        "movimientos": [],
-        "total_prestamos": 0,
-        "total_abonos": 0
-    })
-
-    for mov, nombre, imagen_url in movimientos:
-        cliente_key = mov.cliente_id
-        if "nombre" not in clientes_dict[cliente_key]:
-            clientes_dict[cliente_key]["cliente_id"] = mov.cliente_id
-            clientes_dict[cliente_key]["nombre"] = nombre
-            clientes_dict[cliente_key]["imagen_sobre_url"] = imagen_url
-
-        clientes_dict[cliente_key]["movimientos"].append({
+    # Totales precalculados por cliente (saldos_clientes), ya ordenados por nombre
+    saldos = (await db.execute(
+        select(
+            SaldoCliente.cliente_id,
+            SaldoCliente.cantidad_pendientes,
+            SaldoCliente.pendiente_prestamos,
+            SaldoCliente.pendiente_abonos,
+            Cliente.nombre,
+            Cliente.imagen_sobre_url
+        ).join(
+            Cliente,
+            Cliente.id == SaldoCliente.cliente_id
+        ).where(
+            SaldoCliente.cantidad_pendientes > 0
+        ).order_by(
+            func.lower(Cliente.nombre)
+        )
+    )).all()
+
+    # Detalle de los movimientos pendientes, recorriendo el índice parcial
+    # (cliente_id, created_at) al revés: más recientes primero dentro de cada cliente.
+    # Solo las columnas que se devuelven: armar cientos de objetos ORM cuesta más
+    # que la consulta
+    movimientos = (await db.execute(
+        select(
+            MovimientoPendiente.id,
+            MovimientoPendiente.cliente_id,
+            MovimientoPendiente.tipo,
+            MovimientoPendiente.monto,
+            MovimientoPendiente.notas,
+            MovimientoPendiente.created_at
+        ).where(
+            MovimientoPendiente.procesado == False
+        ).order_by(
+            MovimientoPendiente.cliente_id.desc(),
+            MovimientoPendiente.created_at.desc()
+        )
+    )).all()
+
+    movimientos_por_cliente = defaultdict(list)
+    for mov in movimientos:
+        movimientos_por_cliente[mov.cliente_id].append({
             "id": mov.id,
             "tipo": mov.tipo,
             "monto": float(mov.monto),
@@ -259,24 +379,17 @@ def obtener_clientes_con_pendientes(
             "fecha": mov.created_at.isoformat() if mov.created_at else None
         })
 
-        if mov.tipo == "PRESTAMO":
-            clientes_dict[cliente_key]["total_prestamos"] += float(mov.monto)
-        else:
-            clientes_dict[cliente_key]["total_abonos"] += float(mov.monto)
-
-    # Convertir a lista
-    resultado = []
-    for cliente_id, data in clientes_dict.items():
-        resultado.append({
-            "cliente_id": data["cliente_id"],
-            "nombre": data["nombre"],
-            "imagen_sobre_url": data["imagen_sobre_url"],
-            "cantidad_pendientes": len(data["movimientos"]),
-            "total_prestamos": data["total_prestamos"],
-            "total_abonos": data["total_abonos"],
-            "movimientos": data["movimientos"]
-        })
-
-    # Ordenar por nombre
-    resultado.sort(key=lambda x: x["nombre"].lower())
-    return resultado
+    # Los montos se calculan con Decimal y solo se convierten a float al responder.
+    # Todo ya es JSON nativo: JSONResponse evita recorrerlo otra vez con jsonable_encoder
+    return JSONResponse([
+        {
+            "cliente_id": saldo.cliente_id,
+            "nombre": saldo.nombre,
+            "imagen_sobre_url": saldo.imagen_sobre_url,
+            "cantidad_pendientes": saldo.cantidad_pendientes,
+            "total_prestamos": float(saldo.pendiente_prestamos),
+            "total_abonos": float(saldo.pendiente_abonos),
+            "movimientos": movimientos_por_cliente[saldo.cliente_id]
+        }
+        for saldo in saldos
+    ])
@@ -0,0 +1,133 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from app.core.database import get_async_db, AsyncSessionLocal
+from app.core.config import settings
+from app.core.paginacion import CABECERA_CURSOR, LimitePagina, paginar
+from app.core.security import get_current_user
+from app.models import Trabajo
+from app.models.trabajo import COMPLETADO, EN_PROCESO, FALLIDO
+from app.schemas import TrabajoResponse
+from app.services.trabajos import PARAMETRO_ARCHIVO, cola_trabajos, reintentar, trabajo_a_dict
+from pathlib import Path
+import json
+
+router = APIRouter(prefix="/trabajos", tags=["trabajos"])
+
+
+async def _obtener(db: AsyncSession, trabajo_id: int) -> Trabajo:
+    trabajo = await db.get(Trabajo, trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+@router.get("", response_model=List[TrabajoResponse])
+async def listar_trabajos(
+    response: Response,
+    estado: Optional[Literal["pendiente", "en_proceso", "completado", "fallido"]] = None,
+    tipo: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = LimitePagina,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Lista los trabajos, más recientes primero, paginados por cursor (cabecera X-Next-Cursor).
+
+    Con estado=fallido muestra la cola de descarte.
+    """
+    consulta = select(Trabajo)
+    if estado:
+        consulta = consulta.where(Trabajo.estado == estado)
+    if tipo:
+        consulta = consulta.where(Trabajo.tipo == tipo)
+    trabajos, siguiente = await paginar(db, consulta, (Trabajo.created_at, Trabajo.id), cursor, limit, descendente=True)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return trabajos
+
+
+@router.get("/{trabajo_id}", response_model=TrabajoResponse)
+async def obtener_trabajo(
+    trabajo_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Estado de un trabajo; cuando está completado, `resultado` trae la respuesta de la ruta original."""
+    return await _obtener(db, trabajo_id)
+
+
+@router.get("/{trabajo_id}/eventos")
+async def eventos_trabajo(
+    trabajo_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events con el avance de un trabajo.
+    Envía un evento 'estado' cada vez que cambia (pendiente, en_proceso, reintento)
+    y un evento 'final' con el trabajo completo al quedar completado o fallido.
+    """
+    await _obtener(db, trabajo_id)
+
+    async def eventos():
+        ultimo = None
+        while True:
+            # Sesión propia por lectura: la de get_async_db se cierra antes del streaming
+            async with AsyncSessionLocal() as sesion:
+                trabajo = await sesion.get(Trabajo, trabajo_id)
+            if trabajo is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Trabajo eliminado'})}\n\n"
+                return
+            datos = trabajo_a_dict(trabajo)
+            if trabajo.estado in (COMPLETADO, FALLIDO):
+                yield f"event: final\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+                return
+            if (trabajo.estado, trabajo.intentos) != ultimo:
+                ultimo = (trabajo.estado, trabajo.intentos)
+                yield f"event: estado\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+            # Aviso inmediato si el worker está en este proceso; si no, se vuelve a leer la tabla
+            await cola_trabajos.esperar_cambio(trabajo_id, settings.TRABAJOS_INTERVALO_SEGUNDOS)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita que nginx acumule el stream
+        }
+    )
+
+
+@router.post("/{trabajo_id}/reintentar", response_model=TrabajoResponse)
+async def reintentar_trabajo(
+    trabajo_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Devuelve a la cola un trabajo de la cola de descarte (fallido), con los intentos en cero."""
+    trabajo = await _obtener(db, trabajo_id)
+    if trabajo.estado != FALLIDO:
+        raise HTTPException(status_code=409, detail=f"Solo se reintentan trabajos fallidos (estado: {trabajo.estado})")
+    return await reintentar(db, trabajo)
+
+
+@router.delete("/{trabajo_id}")
+async def eliminar_trabajo(
+    trabajo_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Elimina un trabajo que no esté en curso, junto con su archivo de entrada."""
+    trabajo = await _obtener(db, trabajo_id)
+    if trabajo.estado == EN_PROCESO:
+        raise HTTPException(status_code=409, detail="El trabajo está en curso")
+    archivo = trabajo.parametros.get(PARAMETRO_ARCHIVO)
+    await db.delete(trabajo)
+    await db.commit()
+    if archivo:
+        await run_in_threadpool(Path(archivo).unlink, True)
+    return {"success": True, "mensaje": f"Trabajo {trabajo_id} eliminado"}
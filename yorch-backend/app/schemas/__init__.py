@@ -1,3 +1,4 @@
 from app.schemas.cliente import ClienteBase, ClienteCreate, ClienteUpdate, ClienteResponse
-from app.schemas.movimiento import MovimientoBase, MovimientoCreate, MovimientoResponse, MovimientoConCliente
+from app.schemas.movimiento import MovimientoBase, MovimientoCreate, MovimientoResponse, MovimientoConCliente, SaldoResponse, ErrorFilaLote, LoteMovimientosResponse
 from app.schemas.chat import ChatMessage, ChatResponse, MensajeHistorial
+from app.schemas.trabajo import TrabajoResponse, WebhookUrl
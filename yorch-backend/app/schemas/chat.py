@@ -1,10 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from app.models.mensaje import CONVERSACION_POR_DEFECTO
 
 
 class ChatMessage(BaseModel):
     mensaje: str
+    conversacion_id: str = Field(CONVERSACION_POR_DEFECTO, min_length=1, max_length=64)
 
 
 class ChatResponse(BaseModel):
@@ -16,6 +18,7 @@ class ChatResponse(BaseModel):
 
 class MensajeHistorial(BaseModel):
     id: int
+    conversacion_id: str
     rol: str
     contenido: str
     created_at: datetime
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import datetime
 from decimal import Decimal
 
@@ -27,3 +27,23 @@ class MovimientoResponse(MovimientoBase):
 
 class MovimientoConCliente(MovimientoResponse):
     cliente_nombre: str
+
+
+class SaldoResponse(BaseModel):
+    cliente_id: int
+    cliente_nombre: str
+    pendiente_prestamos: Decimal
+    pendiente_abonos: Decimal
+    cantidad_pendientes: int
+    total_prestamos: Decimal
+    total_abonos: Decimal
+
+
+class ErrorFilaLote(BaseModel):
+    fila: int
+    error: str
+
+
+class LoteMovimientosResponse(BaseModel):
+    creados: List[MovimientoResponse]
+    errores: List[ErrorFilaLote]
@@ -0,0 +1,25 @@
+from pydantic import AnyHttpUrl, BaseModel, UrlConstraints
+from typing import Annotated, Any, Optional
+from datetime import datetime
+
+# Largo de la columna trabajos.webhook_url
+MAX_LARGO_WEBHOOK = 500
+
+# URL http(s) a la que se avisa que terminó un trabajo (la red interna se rechaza en services/trabajos.py)
+WebhookUrl = Annotated[AnyHttpUrl, UrlConstraints(max_length=MAX_LARGO_WEBHOOK)]
+
+
+class TrabajoResponse(BaseModel):
+    id: int
+    tipo: str
+    estado: str  # pendiente, en_proceso, completado, fallido
+    intentos: int
+    max_intentos: int
+    resultado: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    iniciado_at: Optional[datetime] = None
+    terminado_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
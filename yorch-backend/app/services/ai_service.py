@@ -1,222 +1,280 @@
-import google.generativeai as genai
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Mensaje, ResumenConversacion
+from app.models.mensaje import CONVERSACION_POR_DEFECTO
+from app.services.intenciones import detectar_intencion
+from app.services.cache_llm import cache_llm, clave_cache
+from app.services.herramientas import (
+    COMANDOS, HERRAMIENTAS, RespuestaAgente, combinar, ejecutar_herramientas, interpretar_partes,
+    interpretar_respuesta, partes_de
+)
+from app.services.prompt import construir_prompt, metricas_prompt, plegar_en_resumen
 from app.core.config import settings
-from app.models import Cliente, MovimientoPendiente, Mensaje
-from typing import Optional, Tuple
-import re
-from decimal import Decimal
+from app.services.llm import obtener_cliente_llm
+from typing import AsyncIterator, Optional, Tuple
 
-# Configurar Gemini
-if settings.GEMINI_API_KEY:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# Mensajes por consulta al plegar en el resumen los que quedaron fuera de la ventana
+TANDA_RESUMEN = 200
 
-SYSTEM_PROMPT = """Eres un asistente para gestionar préstamos de un prestamista. Tu trabajo es:
+SYSTEM_PROMPT = """Eres un asistente para gestionar préstamos de un prestamista. Tienes estas herramientas:
 
-1. BUSCAR CLIENTES: Cuando el usuario pida ver un sobre o información de un cliente, debes identificar el nombre.
-   Responde con: [BUSCAR_CLIENTE: nombre del cliente]
+1. buscar_cliente: cuando el usuario pida ver un sobre o información de un cliente.
+2. registrar_prestamo: cuando el usuario diga que le hizo un préstamo a un cliente (nombre y monto).
+3. registrar_abono: cuando el usuario diga que un cliente abonó o pagó (nombre y monto).
+4. listar_pendientes: cuando el usuario pregunte qué tiene pendiente.
+5. marcar_procesado: cuando el usuario diga que ya actualizó el sobre de un cliente.
 
-2. REGISTRAR PRÉSTAMOS: Cuando el usuario diga que hizo un préstamo, extrae el nombre y monto.
-   Responde con: [REGISTRAR_PRESTAMO: nombre del cliente | monto]
-
-3. REGISTRAR ABONOS: Cuando el usuario diga que un cliente abonó/pagó, extrae el nombre y monto.
-   Responde con: [REGISTRAR_ABONO: nombre del cliente | monto]
-
-4. LISTAR PENDIENTES: Cuando el usuario pregunte qué tiene pendiente.
-   Responde con: [LISTAR_PENDIENTES]
-
-5. MARCAR PROCESADO: Cuando el usuario diga que ya actualizó un sobre.
-   Responde con: [MARCAR_PROCESADO: nombre del cliente]
-
-Siempre responde de forma natural y amigable, pero incluye los comandos entre corchetes cuando detectes una acción.
+Siempre responde de forma natural y amigable, con una frase corta, y llama a la herramienta cuando
+detectes una acción. Si el mensaje pide varias acciones, llama a varias herramientas en la misma respuesta.
+Los montos van en pesos y sin separadores: "500 mil" es 500000, "2 millones" es 2000000.
 
 Ejemplos:
-- "muéstrame el sobre de Juan Pérez" → "Buscando el sobre de Juan Pérez... [BUSCAR_CLIENTE: Juan Pérez]"
-- "le presté 500 mil a María" → "Entendido, registro el préstamo de $500,000 a María. [REGISTRAR_PRESTAMO: María | 500000]"
-- "qué tengo pendiente" → "Déjame revisar tus movimientos pendientes. [LISTAR_PENDIENTES]"
+- "muéstrame el sobre de Juan Pérez" → "Buscando el sobre de Juan Pérez..." + buscar_cliente(nombre="Juan Pérez")
+- "le presté 500 mil a María" → "Entendido, registro el préstamo de $500,000 a María." + registrar_prestamo(nombre="María", monto=500000)
+- "qué tengo pendiente" → "Déjame revisar tus movimientos pendientes." + listar_pendientes()
 """
 
 
-def parse_monto(texto: str) -> Optional[Decimal]:
-    """Convierte texto de monto a Decimal."""
-    texto = texto.lower().replace(",", "").replace(".", "").replace(" ", "")
-    texto = texto.replace("mil", "000").replace("millon", "000000").replace("millón", "000000")
-    numeros = re.findall(r'\d+', texto)
-    if numeros:
-        return Decimal(numeros[0])
-    return None
-
-
-def buscar_cliente_por_nombre(db: Session, nombre: str) -> Optional[Cliente]:
-    """Busca un cliente por nombre (búsqueda parcial)."""
-    # Buscar coincidencia parcial con cualquier parte del nombre
-    cliente = db.query(Cliente).filter(
-        Cliente.nombre.ilike(f"%{nombre}%")
-    ).first()
-
-    # Si no encuentra, intentar buscar cada palabra del nombre por separado
-    if not cliente and " " in nombre:
-        palabras = nombre.split()
-        for palabra in palabras:
-            if len(palabra) > 2:  # Ignorar palabras muy cortas
-                cliente = db.query(Cliente).filter(
-                    Cliente.nombre.ilike(f"%{palabra}%")
-                ).first()
-                if cliente:
-                    break
-
-    print(f"[DEBUG] Buscando cliente: '{nombre}' -> {'Encontrado: ' + cliente.nombre if cliente else 'No encontrado'}")
-    return cliente
-
-
-def procesar_comando(db: Session, respuesta_ia: str) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
-    """Procesa los comandos de la IA y ejecuta las acciones."""
-    imagen_url = None
-    cliente_id = None
-    accion = None
-    mensaje_final = respuesta_ia
-
-    # Buscar cliente
-    match = re.search(r'\[BUSCAR_CLIENTE:\s*([^\]]+)\]', respuesta_ia)
-    if match:
-        nombre = match.group(1).strip()
-        cliente = buscar_cliente_por_nombre(db, nombre)
-        accion = "buscar_cliente"
-        if cliente:
-            imagen_url = cliente.imagen_sobre_url
-            cliente_id = cliente.id
-            mensaje_final = re.sub(r'\[BUSCAR_CLIENTE:[^\]]+\]',
-                f"Encontré a {cliente.nombre}.", respuesta_ia)
-        else:
-            mensaje_final = re.sub(r'\[BUSCAR_CLIENTE:[^\]]+\]',
-                f"No encontré ningún cliente con el nombre '{nombre}'.", respuesta_ia)
-
-    # Registrar préstamo
-    match = re.search(r'\[REGISTRAR_PRESTAMO:\s*([^|]+)\|\s*([^\]]+)\]', respuesta_ia)
-    if match:
-        nombre = match.group(1).strip()
-        monto_texto = match.group(2).strip()
-        monto = parse_monto(monto_texto)
-        cliente = buscar_cliente_por_nombre(db, nombre)
-        accion = "registrar_prestamo"
-
-        if cliente and monto:
-            movimiento = MovimientoPendiente(
-                cliente_id=cliente.id,
-                tipo="PRESTAMO",
-                monto=monto
-            )
-            db.add(movimiento)
-            db.commit()
-            cliente_id = cliente.id
-            mensaje_final = re.sub(r'\[REGISTRAR_PRESTAMO:[^\]]+\]',
-                f"Registrado préstamo de ${monto:,.0f} a {cliente.nombre}.", respuesta_ia)
-        else:
-            mensaje_final = re.sub(r'\[REGISTRAR_PRESTAMO:[^\]]+\]',
-                f"No pude registrar el préstamo. Verifica el nombre del cliente.", respuesta_ia)
-
-    # Registrar abono
-    match = re.search(r'\[REGISTRAR_ABONO:\s*([^|]+)\|\s*([^\]]+)\]', respuesta_ia)
-    if match:
-        nombre = match.group(1).strip()
-        monto_texto = match.group(2).strip()
-        monto = parse_monto(monto_texto)
-        cliente = buscar_cliente_por_nombre(db, nombre)
-        accion = "registrar_abono"
-
-        if cliente and monto:
-            movimiento = MovimientoPendiente(
-                cliente_id=cliente.id,
-                tipo="ABONO",
-                monto=monto
-            )
-            db.add(movimiento)
-            db.commit()
-            cliente_id = cliente.id
-            mensaje_final = re.sub(r'\[REGISTRAR_ABONO:[^\]]+\]',
-                f"Registrado abono de ${monto:,.0f} de {cliente.nombre}.", respuesta_ia)
-        else:
-            mensaje_final = re.sub(r'\[REGISTRAR_ABONO:[^\]]+\]',
-                f"No pude registrar el abono. Verifica el nombre del cliente.", respuesta_ia)
-
-    # Listar pendientes
-    if '[LISTAR_PENDIENTES]' in respuesta_ia:
-        accion = "listar_pendientes"
-        pendientes = db.query(MovimientoPendiente).filter(
-            MovimientoPendiente.procesado == False
-        ).all()
-
-        if pendientes:
-            lista = "\n".join([
-                f"- {p.cliente.nombre}: {p.tipo} ${p.monto:,.0f}"
-                for p in pendientes
-            ])
-            mensaje_final = re.sub(r'\[LISTAR_PENDIENTES\]',
-                f"Tienes {len(pendientes)} movimientos pendientes:\n{lista}", respuesta_ia)
-        else:
-            mensaje_final = re.sub(r'\[LISTAR_PENDIENTES\]',
-                "No tienes movimientos pendientes.", respuesta_ia)
-
-    # Marcar procesado
-    match = re.search(r'\[MARCAR_PROCESADO:\s*([^\]]+)\]', respuesta_ia)
-    if match:
-        nombre = match.group(1).strip()
-        cliente = buscar_cliente_por_nombre(db, nombre)
-        accion = "marcar_procesado"
-
-        if cliente:
-            from datetime import datetime
-            db.query(MovimientoPendiente).filter(
-                MovimientoPendiente.cliente_id == cliente.id,
-                MovimientoPendiente.procesado == False
-            ).update({
-                "procesado": True,
-                "procesado_at": datetime.utcnow()
-            })
-            db.commit()
-            cliente_id = cliente.id
-            mensaje_final = re.sub(r'\[MARCAR_PROCESADO:[^\]]+\]',
-                f"Marcados como procesados los movimientos de {cliente.nombre}.", respuesta_ia)
-        else:
-            mensaje_final = re.sub(r'\[MARCAR_PROCESADO:[^\]]+\]',
-                f"No encontré al cliente '{nombre}'.", respuesta_ia)
-
-    return mensaje_final, imagen_url, cliente_id, accion
-
-
-async def chat_con_agente(db: Session, mensaje_usuario: str) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
-    """Procesa un mensaje del usuario con el agente IA."""
-
-    # Guardar mensaje del usuario
-    msg_usuario = Mensaje(rol="user", contenido=mensaje_usuario)
-    db.add(msg_usuario)
-    db.commit()
-
-    # Obtener historial reciente
-    historial = db.query(Mensaje).order_by(Mensaje.id.desc()).limit(10).all()
-    historial.reverse()
-
-    # Construir conversación para Gemini
-    mensajes_historial = "\n".join([
-        f"{'Usuario' if m.rol == 'user' else 'Asistente'}: {m.contenido}"
-        for m in historial[:-1]  # Excluir el mensaje actual
-    ])
-
-    prompt_completo = f"{SYSTEM_PROMPT}\n\nHistorial reciente:\n{mensajes_historial}\n\nUsuario: {mensaje_usuario}\n\nAsistente:"
-
+async def plegar_anteriores(
+    db: AsyncSession,
+    resumen: Optional[ResumenConversacion],
+    conversacion_id: str,
+    desde_id: int,
+    hasta_id: int,
+) -> Optional[ResumenConversacion]:
+    """Pliega en el resumen, por tandas, los mensajes con id entre desde_id y hasta_id (exclusivo)."""
+    while True:
+        tanda = list((await db.scalars(
+            select(Mensaje)
+            .where(Mensaje.conversacion_id == conversacion_id, Mensaje.id > desde_id, Mensaje.id < hasta_id)
+            .order_by(Mensaje.id)
+            .limit(TANDA_RESUMEN)
+        )).all())
+        if not tanda:
+            return resumen
+        if resumen is None:
+            resumen = ResumenConversacion(conversacion_id=conversacion_id, texto="", hasta_id=0)
+            db.add(resumen)
+        resumen.texto = plegar_en_resumen(resumen.texto, tanda, settings.LLM_MAX_TOKENS_RESUMEN)
+        resumen.hasta_id = desde_id = tanda[-1].id
+
+
+async def preparar_prompt(db: AsyncSession, mensaje_usuario: str, conversacion_id: str) -> Tuple[str, str]:
+    """Arma el prompt con el historial reciente de la conversación.
+
+    El historial se ajusta al presupuesto de tokens (ver services/prompt.py) y
+    los mensajes que ya no entran se pliegan en el resumen de la conversación.
+    Devuelve el prompt y la clave de caché para este mensaje en su contexto.
+    """
+    if not db.in_transaction():
+        # Solo lecturas y, a lo sumo, guardar el resumen (una sentencia): en
+        # autocommit se ahorran el BEGIN y el COMMIT, dos idas y vueltas a la base
+        # por mensaje. En READ COMMITTED cada consulta ya ve su propia foto.
+        await db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    # Mensajes aún no resumidos, más recientes primero (índice (conversacion_id, id)),
+    # con el resumen al lado en la misma consulta (LEFT JOIN).
+    # El mensaje actual todavía no está guardado (se guarda con la respuesta).
+    # Se lee el doble de la ventana para plegar en el resumen los que van saliendo
+    # de ella, también los de turnos resueltos sin llamar al modelo
+    ventana = max(settings.LLM_HISTORIAL_MAX_MENSAJES * 2, 1)
+    filas = (await db.execute(
+        select(Mensaje, ResumenConversacion)
+        .outerjoin(ResumenConversacion, ResumenConversacion.conversacion_id == Mensaje.conversacion_id)
+        .where(
+            Mensaje.conversacion_id == conversacion_id,
+            Mensaje.id > func.coalesce(ResumenConversacion.hasta_id, 0),
+        )
+        .order_by(Mensaje.id.desc())
+        .limit(ventana)
+    )).all()
+    # Sin mensajes pendientes (conversación nueva) el resumen, si existe, se busca aparte
+    resumen = filas[0][1] if filas else await db.get(ResumenConversacion, conversacion_id)
+    desde_id = resumen.hasta_id if resumen else 0
+    historial = [mensaje for mensaje, _ in reversed(filas)]
+    if len(historial) == ventana:
+        # Tras muchos turnos resueltos sin el modelo puede haber más mensajes sin
+        # resumir que los leídos: los anteriores se pliegan antes de armar el prompt
+        resumen = await plegar_anteriores(db, resumen, conversacion_id, desde_id, historial[0].id)
+
+    texto_resumen = resumen.texto if resumen else ""
+    prompt = construir_prompt(
+        SYSTEM_PROMPT,
+        texto_resumen,
+        historial,
+        mensaje_usuario,
+        presupuesto_tokens=settings.LLM_PRESUPUESTO_PROMPT_TOKENS,
+        max_tokens_mensaje=settings.LLM_MAX_TOKENS_MENSAJE,
+        max_mensajes=settings.LLM_HISTORIAL_MAX_MENSAJES,
+    )
+    metricas_prompt.registrar(prompt)
+    print(f"[DEBUG] Prompt: {prompt.tokens} tokens (sistema {prompt.tokens_sistema}, "
+          f"resumen {prompt.tokens_resumen}, historial {prompt.tokens_historial} "
+          f"en {len(prompt.incluidos)} mensajes)")
+
+    if prompt.excluidos:
+        if resumen is None:
+            resumen = ResumenConversacion(conversacion_id=conversacion_id, texto="", hasta_id=0)
+            db.add(resumen)
+        resumen.texto = plegar_en_resumen(resumen.texto, prompt.excluidos, settings.LLM_MAX_TOKENS_RESUMEN)
+        resumen.hasta_id = prompt.excluidos[-1].id
+
+    # La clave cubre el contexto que ve el modelo (resumen antes de plegar e historial
+    # incluido): la misma frase en otra conversación o tras otra respuesta no acierta
+    clave = clave_cache(
+        SYSTEM_PROMPT, conversacion_id, texto_resumen,
+        [(m.rol, m.contenido) for m in prompt.incluidos], mensaje_usuario,
+    )
+
+    # Cerrar la transacción (guarda el resumen) para no retener la conexión durante la llamada al modelo
     try:
-        model = genai.GenerativeModel('models/gemini-flash-latest')
-        response = model.generate_content(prompt_completo)
-        respuesta_ia = response.text
-    except Exception as e:
-        respuesta_ia = f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}"
-
-    # Procesar comandos en la respuesta
-    mensaje_final, imagen_url, cliente_id, accion = procesar_comando(db, respuesta_ia)
+        await db.commit()
+    except IntegrityError:
+        # Otro turno de la misma conversación creó el resumen a la vez; se pliega en el próximo
+        await db.rollback()
+    return prompt.texto, clave
+
+
+async def finalizar_respuesta(
+    db: AsyncSession, mensaje_usuario: str, respuesta: RespuestaAgente, conversacion_id: str
+) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
+    """Ejecuta las herramientas de la respuesta del modelo y guarda el turno en el historial.
+
+    El mensaje del usuario, las llamadas y la respuesta del asistente van en una
+    sola transacción: cada transacción cuesta varias idas y vueltas a la base.
+    """
+    if not respuesta.tiene_efectos and not db.in_transaction():
+        # Un turno sin efectos (buscar, listar) solo lee y guarda los dos mensajes,
+        # que salen en un único INSERT: no hace falta abrir una transacción
+        await db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    db.add(Mensaje(conversacion_id=conversacion_id, rol="user", contenido=mensaje_usuario))
+    mensaje_final, imagen_url, cliente_id, accion = await ejecutar_herramientas(db, respuesta)
 
     # Guardar respuesta del asistente
-    msg_asistente = Mensaje(rol="assistant", contenido=mensaje_final)
+    msg_asistente = Mensaje(conversacion_id=conversacion_id, rol="assistant", contenido=mensaje_final)
     db.add(msg_asistente)
-    db.commit()
+    await db.commit()
 
     return mensaje_final, imagen_url, cliente_id, accion
+
+
+async def chat_con_agente(
+    db: AsyncSession, mensaje_usuario: str, conversacion_id: str = CONVERSACION_POR_DEFECTO
+) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
+    """Procesa un mensaje del usuario con el agente IA."""
+    # Frases frecuentes se resuelven localmente, sin llamar al modelo
+    intencion = await detectar_intencion(db, mensaje_usuario)
+    if intencion:
+        return await finalizar_respuesta(db, mensaje_usuario, intencion.respuesta, conversacion_id)
+
+    prompt_completo, clave = await preparar_prompt(db, mensaje_usuario, conversacion_id)
+
+    respuesta = cache_llm.obtener(clave)
+    if respuesta is None:
+        try:
+            respuesta = interpretar_respuesta(
+                await obtener_cliente_llm().generar_respuesta(prompt_completo, tools=HERRAMIENTAS)
+            )
+            cache_llm.guardar(clave, respuesta)
+        except Exception as e:
+            respuesta = RespuestaAgente(f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}")
+
+    return await finalizar_respuesta(db, mensaje_usuario, respuesta, conversacion_id)
+
+
+class FiltroComandos:
+    """Oculta los comandos [ENTRE_CORCHETES] del texto que se va enviando al usuario.
+
+    Con function calling el modelo no debería escribirlos, pero se siguen
+    aceptando como respaldo. Pueden llegar partidos entre fragmentos, así que
+    desde un '[' se retiene el texto mientras pueda ser uno de COMANDOS y se
+    descarta al cerrarse con ']'. Cualquier otro corchete (o un comando sin
+    cerrar antes del salto de línea) se muestra tal cual.
+    """
+
+    def __init__(self):
+        self._retenido = ""
+
+    def _es_comando(self, texto: str) -> bool:
+        """Si el texto retenido (sin el '[') todavía puede ser un comando."""
+        for comando in COMANDOS:
+            if comando.startswith(texto):
+                return True
+            if texto.startswith(comando):
+                resto = texto[len(comando):]
+                return "\n" not in resto and (not resto or resto.lstrip()[:1] in ("", ":", "]"))
+        return False
+
+    def filtrar(self, fragmento: str) -> str:
+        visible = []
+        for caracter in fragmento:
+            if not self._retenido:
+                if caracter == "[":
+                    self._retenido = caracter
+                else:
+                    visible.append(caracter)
+            elif caracter == "]" and self._es_comando(self._retenido[1:] + caracter):
+                self._retenido = ""
+            elif self._es_comando(self._retenido[1:] + caracter):
+                self._retenido += caracter
+            else:
+                # No era un comando: se suelta lo retenido y el carácter se vuelve a evaluar
+                visible.append(self._retenido)
+                self._retenido = ""
+                visible.append(self.filtrar(caracter))
+        return "".join(visible)
+
+    def cerrar(self) -> str:
+        """Texto retenido al terminar la respuesta (un comando que no llegó a cerrarse)."""
+        retenido, self._retenido = self._retenido, ""
+        return retenido
+
+
+async def chat_con_agente_stream(
+    db: AsyncSession, mensaje_usuario: str, conversacion_id: str = CONVERSACION_POR_DEFECTO
+) -> AsyncIterator[dict]:
+    """Versión en streaming de chat_con_agente.
+
+    Emite eventos {"tipo": "token", "texto": ...} a medida que llega la respuesta
+    del modelo y, al final, {"tipo": "final", ...} con la respuesta ya procesada
+    y los mismos campos que ChatResponse.
+    """
+    filtro = FiltroComandos()
+    intencion = await detectar_intencion(db, mensaje_usuario)
+    if intencion:
+        respuesta = intencion.respuesta
+        yield {"tipo": "token", "texto": respuesta.texto}
+    else:
+        prompt_completo, clave = await preparar_prompt(db, mensaje_usuario, conversacion_id)
+        respuesta = cache_llm.obtener(clave)
+        if respuesta is not None:
+            yield {"tipo": "token", "texto": respuesta.texto}
+        else:
+            textos, llamadas = [], []
+            try:
+                async for fragmento in obtener_cliente_llm().generar_stream(prompt_completo, tools=HERRAMIENTAS):
+                    texto, llamadas_fragmento = interpretar_partes(partes_de(fragmento))
+                    llamadas += llamadas_fragmento
+                    textos.append(texto)
+                    visible = filtro.filtrar(texto)
+                    if visible:
+                        yield {"tipo": "token", "texto": visible}
+                visible = filtro.cerrar()
+                if visible:
+                    yield {"tipo": "token", "texto": visible}
+                respuesta = combinar("".join(textos), llamadas)
+                cache_llm.guardar(clave, respuesta)
+            except Exception as e:
+                respuesta = RespuestaAgente(f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}")
+
+    mensaje_final, imagen_url, cliente_id, accion = await finalizar_respuesta(
+        db, mensaje_usuario, respuesta, conversacion_id
+    )
+    yield {
+        "tipo": "final",
+        "respuesta": mensaje_final,
+        "imagen_url": imagen_url,
+        "cliente_id": cliente_id,
+        "accion": accion,
+    }
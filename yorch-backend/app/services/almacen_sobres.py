@@ -0,0 +1,147 @@
+"""
+Almacén direccionado por contenido para las imágenes de sobres.
+
+Cada imagen se guarda como uploads/sobres/<sha256>.<ext>, así que dos subidas
+idénticas comparten archivo y la URL cambia cada vez que cambia la imagen. Al
+guardar se generan también una miniatura y una vista previa en WebP, propias
+de cada archivo (<sha256>_<ext>_miniatura.webp, <sha256>_<ext>_vista.webp).
+Como el contenido de una URL nunca cambia, se puede servir con ETag fuerte y
+caché inmutable.
+
+Las peticiones nunca borran imágenes: una subida de la misma imagen puede estar
+a punto de referenciarla (y en otro worker). Las que ya no usa ningún cliente
+las borra reconciliar_sobres (scripts/reconciliar_sobres.py), pasado un plazo
+de gracia desde la última vez que se guardaron.
+"""
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Cliente
+from app.services.imagenes import generar_miniatura
+from app.services.subidas import guardar_subida
+
+SOBRES_DIR = Path(__file__).parent.parent.parent / "uploads" / "sobres"
+SOBRES_DIR.mkdir(parents=True, exist_ok=True)
+
+# Lado mayor en píxeles de cada variante
+VARIANTES = {"miniatura": 256, "vista": 1024}
+
+PATRON_BLOB = re.compile(r"^(?P<hash>[0-9a-f]{64})\.(?P<ext>[a-z0-9]{1,5})$")
+# Variantes (también las del formato anterior, <sha256>_<variante>.webp)
+PATRON_VARIANTE = re.compile(rf"^[0-9a-f]{{64}}(?:_[a-z0-9]{{1,5}})?_(?:{'|'.join(VARIANTES)})\.webp$")
+
+# Un archivo sin clientes se borra solo si lleva este tiempo sin guardarse: cubre
+# las subidas que todavía no hicieron commit de la URL
+GRACIA_SEGUNDOS = 3600
+
+
+def extension_de(nombre_archivo: Optional[str]) -> str:
+    """Extensión en minúsculas del archivo subido (jpg por defecto)."""
+    if nombre_archivo and "." in nombre_archivo:
+        ext = nombre_archivo.rsplit(".", 1)[-1].lower()
+        if re.fullmatch(r"[a-z0-9]{1,5}", ext):
+            return ext
+    return "jpg"
+
+
+def ruta_variante(filename: str, variante: str) -> Path:
+    """Variante de un archivo <sha256>.<ext>; <hash>.jpg y <hash>.jpeg tienen cada uno la suya."""
+    digest, ext = filename.rsplit(".", 1)
+    return SOBRES_DIR / f"{digest}_{ext}_{variante}.webp"
+
+
+def generar_variantes(origen, filename: str) -> None:
+    """Genera miniatura y vista previa; si la imagen no se puede leer, se omiten."""
+    for variante, max_lado in VARIANTES.items():
+        try:
+            generar_miniatura(origen, ruta_variante(filename, variante), max_lado)
+        except Exception as e:
+            print(f"[DEBUG] No se pudo generar la variante '{variante}' de {filename}: {e}")
+            return
+
+
+async def guardar_imagen_sobre(archivo: UploadFile) -> str:
+    """Guarda la imagen subida (si no existía ya) y devuelve su URL relativa.
+
+    El archivo se copia por bloques a un temporal; el nombre definitivo se
+    conoce al terminar, cuando ya se calculó el hash.
+    """
+    ext = extension_de(archivo.filename)
+    temporal = SOBRES_DIR / f".subida_{uuid.uuid4().hex}.{ext}"
+    guardado = await guardar_subida(archivo, temporal, settings.MAX_SUBIDA_IMAGEN_MB * 1024 * 1024)
+
+    filename = f"{guardado.sha256}.{ext}"
+    filepath = SOBRES_DIR / filename
+    try:
+        # Misma imagen ya almacenada: se descarta la copia. Tocar el archivo
+        # renueva su plazo de gracia hasta que el cliente lo referencie
+        await run_in_threadpool(os.utime, filepath)
+        await run_in_threadpool(temporal.unlink, True)
+    except FileNotFoundError:
+        await run_in_threadpool(os.replace, temporal, filepath)
+        await run_in_threadpool(generar_variantes, filepath, filename)
+
+    return f"/uploads/sobres/{filename}"
+
+
+def _borrar_sin_uso(filename: str, limite: float) -> bool:
+    """Borra un archivo sin clientes, salvo que una subida lo haya guardado recién."""
+    ruta = SOBRES_DIR / filename
+    apartado = SOBRES_DIR / f".borrando_{filename}"
+    try:
+        # Renombrar es atómico: una subida que llegue ahora no lo encuentra y lo escribe de nuevo
+        os.replace(ruta, apartado)
+    except FileNotFoundError:
+        return False
+    if apartado.stat().st_mtime >= limite:
+        # Lo reutilizó una subida entre la revisión y el renombrado
+        os.replace(apartado, ruta)
+        return False
+    apartado.unlink()
+    return True
+
+
+def reconciliar_sobres(db: Session, gracia_segundos: int = GRACIA_SEGUNDOS, corregir: bool = False) -> Dict[str, List[str]]:
+    """Compara uploads/sobres con las imágenes que referencian los clientes.
+
+    Devuelve las imágenes sin clientes guardadas hace más de `gracia_segundos`,
+    las variantes sin imagen y las imágenes en uso a las que les falta alguna
+    variante (p. ej. las del formato de nombre anterior). Con corregir=True
+    borra las dos primeras y genera las faltantes. Los archivos con nombre
+    antiguo (no direccionados por contenido) no se tocan.
+    """
+    en_uso = {
+        url.rsplit("/", 1)[-1]
+        for url in db.scalars(select(Cliente.imagen_sobre_url).where(Cliente.imagen_sobre_url.isnot(None)))
+    }
+    limite = time.time() - gracia_segundos
+    archivos = {ruta.name: ruta.stat().st_mtime for ruta in SOBRES_DIR.iterdir() if ruta.is_file()}
+
+    blobs = {nombre for nombre in archivos if PATRON_BLOB.match(nombre)}
+    sin_uso = sorted(nombre for nombre in blobs - en_uso if archivos[nombre] < limite)
+    vigentes = blobs - set(sin_uso)
+    variantes = {ruta_variante(nombre, v).name for nombre in vigentes for v in VARIANTES}
+    variantes_sin_imagen = sorted(n for n in archivos if PATRON_VARIANTE.match(n) and n not in variantes)
+    sin_variantes = sorted(
+        nombre for nombre in vigentes & en_uso
+        if any(ruta_variante(nombre, v).name not in archivos for v in VARIANTES)
+    )
+
+    if corregir:
+        sin_uso = [nombre for nombre in sin_uso if _borrar_sin_uso(nombre, limite)]
+        for nombre in variantes_sin_imagen:
+            (SOBRES_DIR / nombre).unlink(missing_ok=True)
+        for nombre in sin_variantes:
+            generar_variantes(SOBRES_DIR / nombre, nombre)
+
+    return {"sin_uso": sin_uso, "variantes_sin_imagen": variantes_sin_imagen, "sin_variantes": sin_variantes}
@@ -0,0 +1,92 @@
+"""
+Retención del historial del chat.
+
+Los mensajes con más de MENSAJES_RETENCION_DIAS se mueven a
+mensajes_archivados en bloques por conversación: cada bloque guarda sus
+mensajes como JSON por líneas comprimido con gzip. Así la tabla mensajes y su
+índice (conversacion_id, id) se mantienen pequeños aunque el servicio corra
+durante años. Lo ejecuta scripts/archivar_mensajes.py (cron).
+"""
+import gzip
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.models import Mensaje, MensajeArchivado
+
+TAMANO_BLOQUE = 500
+
+
+def _comprimir(mensajes: List[Mensaje]) -> bytes:
+    lineas = (
+        json.dumps({
+            "id": m.id,
+            "rol": m.rol,
+            "contenido": m.contenido,
+            "created_at": m.created_at.isoformat() if m.created_at else None,
+        }, ensure_ascii=False)
+        for m in mensajes
+    )
+    return gzip.compress("\n".join(lineas).encode("utf-8"))
+
+
+def leer_bloque(bloque: MensajeArchivado) -> List[dict]:
+    """Mensajes de un bloque archivado, en orden."""
+    return [json.loads(linea) for linea in gzip.decompress(bloque.contenido).decode("utf-8").splitlines()]
+
+
+def contar_archivables(db: Session, antes_de: datetime) -> int:
+    return db.scalar(select(func.count(Mensaje.id)).where(Mensaje.created_at < antes_de))
+
+
+def archivar_mensajes(db: Session, antes_de: datetime, tamano_bloque: int = TAMANO_BLOQUE) -> Dict[str, int]:
+    """Archiva los mensajes anteriores a `antes_de`; devuelve la cantidad por conversación.
+
+    Trabaja por tandas de `tamano_bloque` mensajes y hace commit de cada una
+    (inserta los bloques y borra los originales en la misma transacción), para
+    no retener una transacción larga sobre la tabla. Cada tanda sigue desde la
+    última (keyset sobre el índice (conversacion_id, id)) en vez de volver a
+    recorrer desde el principio los mensajes recientes que no se archivan.
+    """
+    archivados: Dict[str, int] = defaultdict(int)
+    ultimo = None
+    while True:
+        consulta = select(Mensaje).where(Mensaje.created_at < antes_de)
+        if ultimo:
+            consulta = consulta.where(tuple_(Mensaje.conversacion_id, Mensaje.id) > ultimo)
+        tanda = db.scalars(
+            consulta.order_by(Mensaje.conversacion_id, Mensaje.id).limit(tamano_bloque)
+        ).all()
+        if not tanda:
+            break
+        ultimo = (tanda[-1].conversacion_id, tanda[-1].id)
+
+        por_conversacion: Dict[str, List[Mensaje]] = defaultdict(list)
+        for m in tanda:
+            por_conversacion[m.conversacion_id].append(m)
+
+        for conversacion_id, mensajes in por_conversacion.items():
+            db.add(MensajeArchivado(
+                conversacion_id=conversacion_id,
+                desde_id=mensajes[0].id,
+                hasta_id=mensajes[-1].id,
+                desde_fecha=mensajes[0].created_at,
+                hasta_fecha=mensajes[-1].created_at,
+                cantidad=len(mensajes),
+                contenido=_comprimir(mensajes),
+            ))
+            archivados[conversacion_id] += len(mensajes)
+
+        db.execute(
+            delete(Mensaje)
+            .where(Mensaje.id.in_([m.id for m in tanda]))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        db.expunge_all()
+
+    return dict(archivados)
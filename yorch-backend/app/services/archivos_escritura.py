@@ -0,0 +1,307 @@
+"""
+Manifiesto de los archivos de las escrituras (tabla escritura_archivos).
+
+Al guardar una escritura se registra por archivo su tamaño, hash, tipo MIME y
+cantidad de páginas, así que las lecturas no listan la carpeta ni adivinan el
+tipo por la extensión. verificar_escrituras reconcilia la tabla con lo que hay
+en disco (para correr fuera de línea con scripts/verificar_escrituras.py).
+
+Las versiones reducidas (miniatura y vista previa en WebP) se generan la
+primera vez que se piden, se guardan en <carpeta>/.vistas/ y quedan anotadas
+en el manifiesto (o antes, con el trabajo "versiones_escritura" que se encola
+al subir la escritura). De un PDF se usa la primera página escaneada.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import mmap
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal
+from app.models import Escritura, EscrituraArchivo
+from app.services.imagenes import generar_miniatura
+from app.services.subidas import TAMANO_BLOQUE
+from app.services.trabajos import manejador
+
+MIME_PDF = "application/pdf"
+
+# Objetos de página de un PDF (/Type /Page, no /Pages)
+PATRON_PAGINA_PDF = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+# Respaldo para PDF con flujos de objetos comprimidos: /Count del árbol de páginas
+PATRON_CONTEO_PDF = re.compile(rb"/Count\s+(\d+)")
+# Nombres que asigna la subida (documento_N.pdf, imagen_N.jpg)
+PATRON_NOMBRE_ARCHIVO = re.compile(r"^(?:documento|imagen)_(\d+)\.")
+# Inicio del contenido de un stream de PDF
+PATRON_INICIO_STREAM = re.compile(rb"stream\r?\n")
+
+# Versiones reducidas: lado mayor en píxeles y columna del manifiesto donde se anotan
+VERSIONES = {"miniatura": (256, "miniatura"), "vista": (1024, "vista_previa")}
+CARPETA_VERSIONES = ".vistas"
+
+
+def contar_paginas_pdf(ruta: Path) -> Optional[int]:
+    with open(ruta, "rb") as archivo:
+        try:
+            datos = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Archivo vacío
+            return None
+        with datos:
+            paginas = sum(1 for _ in PATRON_PAGINA_PDF.finditer(datos))
+            if paginas:
+                return paginas
+            conteos = [int(n) for n in PATRON_CONTEO_PDF.findall(datos)]
+    return max(conteos) if conteos else None
+
+
+def describir_archivo(ruta: Path) -> Tuple[str, Optional[int]]:
+    """Tipo MIME (por contenido, no por extensión) y cantidad de páginas de un archivo."""
+    with open(ruta, "rb") as archivo:
+        cabecera = archivo.read(5)
+    if cabecera == b"%PDF-":
+        return MIME_PDF, contar_paginas_pdf(ruta)
+    try:
+        with Image.open(ruta) as imagen:
+            mime = Image.MIME.get(imagen.format) or f"image/{imagen.format.lower()}"
+            return mime, getattr(imagen, "n_frames", 1)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return mimetypes.guess_type(ruta.name)[0] or "application/octet-stream", None
+
+
+def hash_archivo(ruta: Path) -> Tuple[int, str]:
+    """Tamaño y sha256 de un archivo en disco."""
+    hasher = hashlib.sha256()
+    tamano = 0
+    with open(ruta, "rb") as archivo:
+        while bloque := archivo.read(TAMANO_BLOQUE):
+            hasher.update(bloque)
+            tamano += len(bloque)
+    return tamano, hasher.hexdigest()
+
+
+def primera_imagen_pdf(ruta: Path) -> Optional[bytes]:
+    """Primera imagen JPEG incrustada en un PDF, o None si no tiene.
+
+    Sin un rasterizador no se puede dibujar una página de texto vectorial,
+    pero un escaneo (casi todas las escrituras) guarda cada página como un
+    JPEG (DCTDecode) que se puede usar tal cual; la primera suele ser la
+    primera página.
+    """
+    with open(ruta, "rb") as archivo:
+        try:
+            datos = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Archivo vacío
+            return None
+        with datos:
+            for inicio in PATRON_INICIO_STREAM.finditer(datos):
+                if datos[inicio.end():inicio.end() + 3] != b"\xff\xd8\xff":
+                    continue
+                fin = datos.find(b"endstream", inicio.end())
+                if fin != -1:
+                    return datos[inicio.end():fin]
+    return None
+
+
+def ruta_version(carpeta: Path, nombre: str, variante: str) -> Path:
+    return carpeta / CARPETA_VERSIONES / f"{nombre}.{variante}.webp"
+
+
+def url_archivo(carpeta: str, registro: EscrituraArchivo, variante: Optional[str] = None) -> str:
+    """URL del archivo (o de su versión reducida) con el hash como versión, para caché inmutable."""
+    url = f"/uploads/escrituras/{carpeta}/{registro.nombre}?v={registro.sha256[:16]}"
+    return f"{url}&variante={variante}" if variante else url
+
+
+def generar_version(carpeta: Path, nombre: str, variante: str) -> Tuple[Optional[Path], bool]:
+    """Genera la versión reducida si falta o es más vieja que el archivo.
+
+    Devuelve (ruta, recién generada); ruta es None si el archivo no tiene una
+    imagen que mostrar (PDF sin páginas escaneadas, archivo dañado).
+    """
+    origen = carpeta / nombre
+    destino = ruta_version(carpeta, nombre, variante)
+    if destino.exists() and destino.stat().st_mtime_ns >= origen.stat().st_mtime_ns:
+        return destino, False
+
+    with open(origen, "rb") as archivo:
+        es_pdf = archivo.read(5) == b"%PDF-"
+    fuente = primera_imagen_pdf(origen) if es_pdf else origen
+    if fuente is None:
+        return None, False
+    destino.parent.mkdir(exist_ok=True)
+    try:
+        generar_miniatura(fuente, destino, VERSIONES[variante][0])
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        print(f"[DEBUG] No se pudo generar la versión '{variante}' de {origen}: {e}")
+        return None, False
+    return destino, True
+
+
+async def _anotar_version(carpeta: Path, nombre: str, variante: str, ruta: Path) -> None:
+    columna = VERSIONES[variante][1]
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(EscrituraArchivo)
+                .where(
+                    EscrituraArchivo.nombre == nombre,
+                    EscrituraArchivo.escritura_id.in_(select(Escritura.id).where(Escritura.carpeta == carpeta.name))
+                )
+                .values({columna: ruta.relative_to(carpeta).as_posix()})
+            )
+            await db.commit()
+    except Exception as e:
+        # Solo es una anotación: la versión ya está en disco
+        print(f"[DEBUG] No se pudo anotar la versión '{variante}' de {carpeta.name}/{nombre}: {e}")
+
+
+async def _generar_y_anotar(carpeta: Path, nombre: str, variante: str) -> Optional[Path]:
+    ruta, nueva = await run_in_threadpool(generar_version, carpeta, nombre, variante)
+    if nueva:
+        await _anotar_version(carpeta, nombre, variante, ruta)
+    return ruta
+
+
+# Generaciones en curso: varias peticiones simultáneas de la misma versión esperan la misma
+_en_curso: Dict[Path, asyncio.Future] = {}
+
+
+async def obtener_version(carpeta: Path, nombre: str, variante: str) -> Optional[Path]:
+    """Ruta de la versión reducida, generándola fuera del event loop si hace falta."""
+    destino = ruta_version(carpeta, nombre, variante)
+    tarea = _en_curso.get(destino)
+    if tarea is None:
+        tarea = asyncio.ensure_future(_generar_y_anotar(carpeta, nombre, variante))
+        _en_curso[destino] = tarea
+        tarea.add_done_callback(lambda _: _en_curso.pop(destino, None))
+    # shield: si un cliente se desconecta, la generación sigue para los demás
+    return await asyncio.shield(tarea)
+
+
+@manejador("versiones_escritura")
+async def trabajo_versiones(parametros: dict) -> dict:
+    """Genera por adelantado las versiones reducidas de los archivos de una escritura."""
+    carpeta = Path(parametros["carpeta"])
+    generadas = sin_vista = 0
+    for nombre in parametros["archivos"]:
+        if not (carpeta / nombre).is_file():
+            continue  # Escritura eliminada mientras tanto
+        for variante in VERSIONES:
+            if await obtener_version(carpeta, nombre, variante):
+                generadas += 1
+            else:
+                sin_vista += 1
+    return {"generadas": generadas, "sin_vista": sin_vista}
+
+
+def _orden_libre(nombre: str, ocupados: set) -> int:
+    coincidencia = PATRON_NOMBRE_ARCHIVO.match(nombre)
+    if coincidencia and int(coincidencia.group(1)) - 1 not in ocupados:
+        return int(coincidencia.group(1)) - 1
+    return max(ocupados, default=-1) + 1
+
+
+def verificar_escrituras(
+    db: Session, carpeta_base: Path, corregir: bool = False, verificar_hash: bool = False
+) -> List[dict]:
+    """Compara escritura_archivos (y cantidad_archivos) con las carpetas en disco.
+
+    Devuelve un dict por problema: escritura_id, carpeta, problema, archivo y
+    detalle. Con `corregir` registra los archivos que faltan en la tabla,
+    borra las filas de archivos que ya no existen, actualiza tamaño/hash de
+    los que cambiaron, quita las versiones reducidas perdidas y borra los
+    temporales de subidas cortadas; el commit queda a cargo del llamador. Las
+    carpetas sin escritura solo se reportan. Sin `verificar_hash` los
+    archivos se comparan por tamaño.
+    """
+    escrituras = db.scalars(select(Escritura).order_by(Escritura.id)).all()
+    manifiesto = defaultdict(dict)
+    for registro in db.scalars(select(EscrituraArchivo)):
+        manifiesto[registro.escritura_id][registro.nombre] = registro
+
+    problemas = []
+
+    def reportar(escritura, problema, archivo=None, detalle=None):
+        problemas.append({
+            "escritura_id": escritura.id if escritura else None,
+            "carpeta": escritura.carpeta if escritura else archivo,
+            "problema": problema,
+            "archivo": archivo if escritura else None,
+            "detalle": detalle,
+        })
+
+    for escritura in escrituras:
+        carpeta = carpeta_base / escritura.carpeta
+        if not carpeta.is_dir():
+            reportar(escritura, "carpeta_faltante")
+        en_disco = {r.name: r for r in carpeta.iterdir() if r.is_file()} if carpeta.is_dir() else {}
+        registrados = manifiesto.get(escritura.id, {})
+        ocupados = {registro.orden for registro in registrados.values()}
+        vigentes = len(registrados)
+
+        for nombre in sorted(n for n in en_disco if n.startswith(".")):
+            reportar(escritura, "temporal", nombre)
+            if corregir:
+                en_disco[nombre].unlink(missing_ok=True)
+
+        for nombre, registro in sorted(registrados.items()):
+            ruta = en_disco.get(nombre)
+            if ruta is None:
+                reportar(escritura, "falta_en_disco", nombre)
+                if corregir:
+                    db.delete(registro)
+                    vigentes -= 1
+                continue
+
+            if verificar_hash:
+                tamano, sha256 = hash_archivo(ruta)
+            else:
+                tamano, sha256 = ruta.stat().st_size, registro.sha256
+            if (tamano, sha256) != (registro.tamano, registro.sha256):
+                reportar(escritura, "contenido_distinto", nombre, f"tamaño {registro.tamano} -> {tamano}")
+                if corregir:
+                    registro.tamano, registro.sha256 = hash_archivo(ruta)
+                    registro.mime, registro.paginas = describir_archivo(ruta)
+                    registro.miniatura = registro.vista_previa = None
+
+            for columna in ("miniatura", "vista_previa"):
+                version = getattr(registro, columna)
+                if version and not (carpeta / version).is_file():
+                    reportar(escritura, f"{columna}_faltante", nombre, version)
+                    if corregir:
+                        setattr(registro, columna, None)
+
+        for nombre in sorted(n for n in en_disco if n not in registrados and not n.startswith(".")):
+            reportar(escritura, "sin_registrar", nombre)
+            if corregir:
+                ruta = en_disco[nombre]
+                tamano, sha256 = hash_archivo(ruta)
+                mime, paginas = describir_archivo(ruta)
+                orden = _orden_libre(nombre, ocupados)
+                ocupados.add(orden)
+                db.add(EscrituraArchivo(
+                    escritura_id=escritura.id, orden=orden, nombre=nombre,
+                    tamano=tamano, sha256=sha256, mime=mime, paginas=paginas
+                ))
+                vigentes += 1
+
+        esperados = vigentes if corregir else len(registrados)
+        if escritura.cantidad_archivos != esperados:
+            reportar(escritura, "cantidad_archivos", detalle=f"{escritura.cantidad_archivos} -> {esperados}")
+            if corregir:
+                escritura.cantidad_archivos = esperados
+
+    carpetas = {escritura.carpeta for escritura in escrituras}
+    if carpeta_base.is_dir():
+        for carpeta in sorted(carpeta_base.iterdir()):
+            if carpeta.is_dir() and carpeta.name not in carpetas:
+                reportar(None, "carpeta_huerfana", carpeta.name)
+
+    return problemas
@@ -0,0 +1,124 @@
+"""
+Búsqueda de clientes y escrituras para GET /buscar.
+
+En PostgreSQL usa los índices de la migración de búsqueda: trigramas (pg_trgm)
+sobre los nombres sin tildes para tolerar errores y búsquedas parciales,
+prefijo sobre cédula y teléfono, y texto completo en español (tsvector con
+unaccent) sobre las notas. El puntaje combina esas señales y los resultados
+de clientes y escrituras salen en una sola lista ordenada.
+
+En SQLite (desarrollo y scripts) se usa el índice de trigramas en memoria
+para los nombres de clientes y LIKE sobre el texto plegado para el resto.
+"""
+import re
+from typing import List
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.orm import Session
+
+from app.core.texto import plegar_nombre
+from app.models import Cliente, Escritura
+from app.services.indice_clientes import indice_clientes
+
+# Profundidad máxima de resultados que se puntúan en el respaldo SQLite
+MAX_RESULTADOS_SQLITE = 200
+
+CONSULTA_POSTGRES = text("""
+    SELECT 'cliente' AS tipo, c.id, c.nombre AS titulo, c.cedula, c.telefono,
+        GREATEST(
+            word_similarity(:q, lower(f_unaccent(c.nombre))),
+            CASE WHEN lower(f_unaccent(c.nombre)) LIKE :prefijo THEN 1.0 ELSE 0 END,
+            CASE WHEN :digitos <> '' AND (c.cedula LIKE :digitos_prefijo
+                OR c.telefono LIKE :digitos_contiene) THEN 0.9 ELSE 0 END,
+            ts_rank(to_tsvector('es_unaccent', coalesce(c.notas, '')),
+                plainto_tsquery('es_unaccent', :q)) * 0.5
+        ) AS puntaje
+    FROM clientes c
+    WHERE :q <% lower(f_unaccent(c.nombre))
+        OR lower(f_unaccent(c.nombre)) LIKE :contiene
+        OR (:digitos <> '' AND (c.cedula LIKE :digitos_prefijo OR c.telefono LIKE :digitos_contiene))
+        OR to_tsvector('es_unaccent', coalesce(c.notas, '')) @@ plainto_tsquery('es_unaccent', :q)
+    UNION ALL
+    SELECT 'escritura' AS tipo, e.id, e.nombre_propietario AS titulo, NULL AS cedula, NULL AS telefono,
+        GREATEST(
+            word_similarity(:q, lower(f_unaccent(e.nombre_propietario))),
+            CASE WHEN lower(f_unaccent(e.nombre_propietario)) LIKE :prefijo THEN 1.0 ELSE 0 END
+        ) AS puntaje
+    FROM escrituras e
+    WHERE :q <% lower(f_unaccent(e.nombre_propietario))
+        OR lower(f_unaccent(e.nombre_propietario)) LIKE :contiene
+    ORDER BY puntaje DESC, tipo, id
+    LIMIT :limite OFFSET :desplazamiento
+""")
+
+
+def _resultado(tipo: str, id: int, titulo: str, cedula, telefono, puntaje: float) -> dict:
+    return {
+        "tipo": tipo,
+        "id": id,
+        "titulo": titulo,
+        "cedula": cedula,
+        "telefono": telefono,
+        "puntaje": round(float(puntaje), 4),
+    }
+
+
+def _buscar_postgres(db: Session, q: str, digitos: str, limite: int, desplazamiento: int) -> List[dict]:
+    filas = db.execute(CONSULTA_POSTGRES, {
+        "q": q,
+        "prefijo": f"{q}%",
+        "contiene": f"%{q}%",
+        "digitos": digitos,
+        "digitos_prefijo": f"{digitos}%",
+        "digitos_contiene": f"%{digitos}%",
+        "limite": limite,
+        "desplazamiento": desplazamiento,
+    }).all()
+    return [_resultado(*fila) for fila in filas]
+
+
+def _buscar_sqlite(db: Session, q: str, digitos: str, limite: int, desplazamiento: int) -> List[dict]:
+    # plegar() en SQL: minúsculas y sin tildes, igual que en Python
+    conexion = db.connection().connection.dbapi_connection
+    conexion.create_function("plegar", 1, lambda t: plegar_nombre(t) if t else t, deterministic=True)
+
+    indice_clientes.asegurar_cargado(db)
+    similitudes = dict(indice_clientes.buscar(q, limite=MAX_RESULTADOS_SQLITE))
+    patron = f"%{q}%"
+
+    filtros = [Cliente.id.in_(list(similitudes)), func.plegar(Cliente.notas).like(patron)]
+    if digitos:
+        filtros += [Cliente.cedula.like(f"{digitos}%"), Cliente.telefono.like(f"%{digitos}%")]
+    clientes = db.query(Cliente).filter(or_(*filtros)).limit(MAX_RESULTADOS_SQLITE).all()
+
+    resultados = []
+    for c in clientes:
+        puntaje = similitudes.get(c.id, 0.0)
+        if plegar_nombre(c.nombre).startswith(q):
+            puntaje = 1.0
+        if digitos and ((c.cedula or "").startswith(digitos) or digitos in (c.telefono or "")):
+            puntaje = max(puntaje, 0.9)
+        if q in plegar_nombre(c.notas or ""):
+            puntaje = max(puntaje, 0.3)
+        resultados.append(_resultado("cliente", c.id, c.nombre, c.cedula, c.telefono, puntaje))
+
+    escrituras = db.query(Escritura).filter(
+        func.plegar(Escritura.nombre_propietario).like(patron)
+    ).limit(MAX_RESULTADOS_SQLITE).all()
+    for e in escrituras:
+        puntaje = 1.0 if plegar_nombre(e.nombre_propietario).startswith(q) else 0.6
+        resultados.append(_resultado("escritura", e.id, e.nombre_propietario, None, None, puntaje))
+
+    resultados.sort(key=lambda r: (-r["puntaje"], r["tipo"], r["id"]))
+    return resultados[desplazamiento:desplazamiento + limite]
+
+
+def buscar(db: Session, consulta: str, limite: int, desplazamiento: int = 0) -> List[dict]:
+    """Busca clientes y escrituras; devuelve resultados ordenados por puntaje (0-1)."""
+    q = plegar_nombre(consulta)
+    digitos = re.sub(r"\D", "", consulta)
+    if not q and not digitos:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _buscar_postgres(db, q, digitos, limite, desplazamiento)
+    return _buscar_sqlite(db, q, digitos, limite, desplazamiento)
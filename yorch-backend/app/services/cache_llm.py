@@ -0,0 +1,82 @@
+"""
+Caché en memoria de respuestas del modelo (LRU con TTL).
+
+Solo se guarda la respuesta del modelo (texto + llamadas a herramientas);
+ejecutar_herramientas se sigue ejecutando en cada acierto contra los datos
+actuales, así que un listar_pendientes cacheado siempre muestra los pendientes
+del momento. Las respuestas con herramientas que modifican datos nunca se guardan.
+La clave incluye la conversación y todo el contexto del prompt, así que solo
+acierta cuando el modelo vería exactamente lo mismo.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.texto import plegar_nombre
+from app.services.herramientas import RespuestaAgente
+
+
+def clave_cache(
+    prompt_sistema: str, conversacion_id: str, resumen: str, historial: Sequence[Tuple[str, str]], mensaje: str
+) -> str:
+    """Hash de todo lo que ve el modelo: prompt de sistema, conversación, resumen,
+    historial incluido en el prompt (rol, contenido; usuario y asistente) y el
+    mensaje normalizado. Un mensaje igual en otro contexto es otra entrada."""
+    partes = [settings.GEMINI_MODELO, prompt_sistema, conversacion_id, resumen]
+    partes.extend(f"{rol}\x1e{contenido}" for rol, contenido in historial)
+    partes.append(plegar_nombre(mensaje))
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+
+class CacheLLM:
+    """Diccionario LRU con vencimiento por entrada y contadores de aciertos."""
+
+    def __init__(self, max_entradas: int = 256, ttl_segundos: int = 600):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.omitidos = 0  # Respuestas no guardadas por tener efectos secundarios
+
+    def obtener(self, clave: str) -> Optional[RespuestaAgente]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            if entrada:
+                del self._entradas[clave]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave: str, respuesta: RespuestaAgente) -> None:
+        if respuesta.tiene_efectos:
+            self.omitidos += 1
+            return
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl_segundos, respuesta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def resumen(self) -> dict:
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "omitidos_por_efectos": self.omitidos,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+        }
+
+
+cache_llm = CacheLLM(
+    max_entradas=settings.LLM_CACHE_MAX_ENTRADAS,
+    ttl_segundos=settings.LLM_CACHE_TTL_SEGUNDOS,
+)
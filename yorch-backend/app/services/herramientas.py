@@ -0,0 +1,299 @@
+"""
+Herramientas del agente (function calling de Gemini).
+
+El modelo ya no escribe comandos entre corchetes que luego se buscan con una
+expresión regular por comando: recibe las herramientas declaradas en
+HERRAMIENTAS y responde con llamadas estructuradas (nombre + argumentos).
+Todas las llamadas de un turno se ejecutan juntas en una sola transacción, y
+los nombres de clientes que mencionan se resuelven de una vez (índice en
+memoria + una sola consulta), aunque varias llamadas nombren al mismo cliente.
+
+Los comandos entre corchetes se siguen aceptando como respaldo (si el modelo
+los escribe en el texto), leídos en una sola pasada.
+"""
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.texto import parse_monto, plegar_nombre
+from app.models import Cliente, MovimientoPendiente
+from app.services.indice_clientes import indice_clientes
+from app.services.saldos import marcar_procesados, registrar_movimientos
+
+# Candidatos del índice que se consideran por nombre
+CANDIDATOS_POR_NOMBRE = 3
+
+_NOMBRE = {"nombre": {"type": "string", "description": "Nombre del cliente tal como lo dijo el usuario"}}
+_MONTO = {"monto": {"type": "number", "description": "Monto en pesos, sin separadores (500 mil = 500000)"}}
+
+HERRAMIENTAS = [{"function_declarations": [
+    {
+        "name": "buscar_cliente",
+        "description": "Muestra el sobre (imagen) y los datos de un cliente.",
+        "parameters": {"type": "object", "properties": _NOMBRE, "required": ["nombre"]},
+    },
+    {
+        "name": "registrar_prestamo",
+        "description": "Registra un préstamo que el usuario le hizo a un cliente.",
+        "parameters": {"type": "object", "properties": {**_NOMBRE, **_MONTO}, "required": ["nombre", "monto"]},
+    },
+    {
+        "name": "registrar_abono",
+        "description": "Registra un abono o pago que un cliente le hizo al usuario.",
+        "parameters": {"type": "object", "properties": {**_NOMBRE, **_MONTO}, "required": ["nombre", "monto"]},
+    },
+    {
+        "name": "listar_pendientes",
+        "description": "Lista los movimientos que aún no se pasaron a los sobres.",
+    },
+    {
+        "name": "marcar_procesado",
+        "description": "Marca como procesados los movimientos de un cliente cuando el usuario ya actualizó su sobre.",
+        "parameters": {"type": "object", "properties": _NOMBRE, "required": ["nombre"]},
+    },
+]}]
+
+# Herramientas que modifican datos: su respuesta no debe repetirse desde caché
+HERRAMIENTAS_CON_EFECTOS = ("registrar_prestamo", "registrar_abono", "marcar_procesado")
+
+# Respaldo: comandos entre corchetes en el texto, p. ej. [REGISTRAR_ABONO: Ana | 50000]
+COMANDOS = ("BUSCAR_CLIENTE", "REGISTRAR_PRESTAMO", "REGISTRAR_ABONO", "LISTAR_PENDIENTES", "MARCAR_PROCESADO")
+PATRON_COMANDO = re.compile(
+    rf"\[({'|'.join(COMANDOS)})"
+    r"(?:\s*:\s*([^\]|]*?)\s*(?:\|\s*([^\]]*?)\s*)?)?\]"
+)
+
+
+@dataclass
+class LlamadaHerramienta:
+    nombre: str
+    argumentos: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class RespuestaAgente:
+    """Respuesta del modelo normalizada: texto visible y llamadas a herramientas."""
+    texto: str
+    llamadas: List[LlamadaHerramienta] = field(default_factory=list)
+
+    @property
+    def tiene_efectos(self) -> bool:
+        return any(ll.nombre in HERRAMIENTAS_CON_EFECTOS for ll in self.llamadas)
+
+
+def interpretar_texto(texto: str) -> RespuestaAgente:
+    """Extrae los comandos entre corchetes del texto en una sola pasada."""
+    llamadas = []
+    for comando, nombre, monto in PATRON_COMANDO.findall(texto):
+        argumentos = {}
+        if nombre:
+            argumentos["nombre"] = nombre
+        if monto:
+            argumentos["monto"] = monto
+        llamadas.append(LlamadaHerramienta(comando.lower(), argumentos))
+    return RespuestaAgente(PATRON_COMANDO.sub("", texto).strip(), llamadas)
+
+
+def partes_de(respuesta: Any) -> list:
+    candidatos = getattr(respuesta, "candidates", None) or []
+    if not candidatos or not candidatos[0].content:
+        return []
+    return list(candidatos[0].content.parts)
+
+
+def interpretar_partes(partes: Iterable[Any]) -> Tuple[str, List[LlamadaHerramienta]]:
+    """Texto y llamadas de las partes de una respuesta (o de un fragmento del stream)."""
+    textos, llamadas = [], []
+    for parte in partes:
+        llamada = getattr(parte, "function_call", None)
+        if llamada is not None and llamada.name:
+            llamadas.append(LlamadaHerramienta(llamada.name, dict(llamada.args or {})))
+        elif getattr(parte, "text", ""):
+            textos.append(parte.text)
+    return "".join(textos), llamadas
+
+
+def interpretar_respuesta(respuesta: Any) -> RespuestaAgente:
+    """Normaliza una respuesta del modelo (llamadas nativas y, de respaldo, corchetes)."""
+    texto, llamadas = interpretar_partes(partes_de(respuesta))
+    return combinar(texto, llamadas)
+
+
+def combinar(texto: str, llamadas: List[LlamadaHerramienta]) -> RespuestaAgente:
+    respaldo = interpretar_texto(texto)
+    return RespuestaAgente(respaldo.texto, llamadas + respaldo.llamadas)
+
+
+def _monto(valor: Any) -> Optional[Decimal]:
+    if isinstance(valor, (int, float, Decimal)):
+        try:
+            monto = Decimal(str(valor))
+        except InvalidOperation:
+            return None
+        return monto if monto > 0 else None
+    return parse_monto(str(valor)) if valor is not None else None
+
+
+@dataclass
+class ClienteResuelto:
+    """Resultado de buscar un nombre: el cliente si lo identifica sin ambigüedad
+    y, en todo caso, los candidatos de mejor a peor."""
+    cliente: Optional[Cliente] = None
+    candidatos: List[Cliente] = field(default_factory=list)
+
+
+async def _resolver_clientes(db: AsyncSession, llamadas: List[LlamadaHerramienta]) -> Dict[str, ClienteResuelto]:
+    """Resuelve todos los nombres de las llamadas con una sola consulta; clave: nombre plegado."""
+    nombres = {plegar_nombre(str(ll.argumentos["nombre"])) for ll in llamadas if ll.argumentos.get("nombre")}
+    if not nombres:
+        return {}
+
+    await db.run_sync(indice_clientes.asegurar_cargado)
+    identificados = {n: indice_clientes.identificar(n, limite=CANDIDATOS_POR_NOMBRE) for n in nombres}
+    ids = {cid for _, candidatos in identificados.values() for cid in candidatos}
+    # Los que ya están en la sesión (p. ej. resueltos por la intención local) no se consultan
+    encontrados = {cid: c for cid in ids if (c := db.identity_map.get(db.identity_key(Cliente, cid))) is not None}
+    faltan = ids - encontrados.keys()
+    if faltan:
+        encontrados.update((c.id, c) for c in (await db.scalars(select(Cliente).where(Cliente.id.in_(faltan)))).all())
+    # Eliminados por otro worker: sacarlos del índice
+    for cid in ids - encontrados.keys():
+        indice_clientes.eliminar(cid)
+
+    resueltos = {}
+    for nombre, (cliente_id, candidatos) in identificados.items():
+        resuelto = ClienteResuelto(
+            cliente=encontrados.get(cliente_id),
+            candidatos=[encontrados[cid] for cid in candidatos if cid in encontrados],
+        )
+        resueltos[nombre] = resuelto
+        estado = f"Encontrado: {resuelto.cliente.nombre}" if resuelto.cliente else (
+            f"Ambiguo: {[c.nombre for c in resuelto.candidatos]}" if resuelto.candidatos else "No encontrado"
+        )
+        print(f"[DEBUG] Buscando cliente: '{nombre}' -> {estado}")
+    return resueltos
+
+
+def _sin_cliente(nombre: str, resuelto: Optional[ClienteResuelto]) -> str:
+    """Por qué no se identificó al cliente: no existe o el nombre es ambiguo."""
+    if resuelto and resuelto.candidatos:
+        opciones = ", ".join(c.nombre for c in resuelto.candidatos)
+        return f"'{nombre}' no identifica a un solo cliente (puede ser: {opciones}). Dime el nombre completo."
+    return f"No encontré ningún cliente con el nombre '{nombre}'."
+
+
+async def _listar_pendientes(db: AsyncSession) -> str:
+    pendientes = (await db.execute(
+        select(
+            Cliente.nombre,
+            MovimientoPendiente.tipo,
+            MovimientoPendiente.monto
+        ).join(
+            Cliente, Cliente.id == MovimientoPendiente.cliente_id
+        ).where(
+            MovimientoPendiente.procesado == False
+        ).order_by(
+            MovimientoPendiente.cliente_id,
+            MovimientoPendiente.created_at
+        )
+    )).all()
+
+    if not pendientes:
+        return "No tienes movimientos pendientes."
+    lista = "\n".join(f"- {nombre}: {tipo} ${monto:,.0f}" for nombre, tipo, monto in pendientes)
+    return f"Tienes {len(pendientes)} movimientos pendientes:\n{lista}"
+
+
+async def ejecutar_herramientas(
+    db: AsyncSession, respuesta: RespuestaAgente
+) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
+    """Ejecuta las llamadas de la respuesta en la transacción de `db`.
+
+    El commit queda a cargo del llamador, que guarda la respuesta en la misma
+    transacción; si una llamada falla se deshace todo. Devuelve (mensaje_final,
+    imagen_url, cliente_id, accion): el texto del modelo seguido del resultado de
+    cada llamada, en orden.
+    """
+    imagen_url = None
+    cliente_id = None
+    accion = None
+    resultados = []
+    nuevos: List[MovimientoPendiente] = []
+
+    async def guardar_nuevos(visibles: bool = True):
+        # Los movimientos de este turno deben verse en un listar/marcar posterior
+        if nuevos:
+            db.add_all(nuevos)
+            await db.run_sync(registrar_movimientos, [(m.cliente_id, m.tipo, m.monto) for m in nuevos])
+            if visibles:
+                await db.flush()
+            nuevos.clear()
+
+    try:
+        clientes = await _resolver_clientes(db, respuesta.llamadas)
+
+        for llamada in respuesta.llamadas:
+            nombre = str(llamada.argumentos.get("nombre", "")).strip()
+            resuelto = clientes.get(plegar_nombre(nombre)) if nombre else None
+            # Solo las herramientas que escriben exigen un cliente inequívoco
+            cliente = resuelto.cliente if resuelto else None
+            accion = llamada.nombre
+
+            if llamada.nombre == "buscar_cliente":
+                encontrado = cliente or (resuelto.candidatos[0] if resuelto and resuelto.candidatos else None)
+                if encontrado:
+                    imagen_url = encontrado.imagen_sobre_url
+                    cliente_id = encontrado.id
+                    resultados.append(f"Encontré a {encontrado.nombre}.")
+                else:
+                    resultados.append(_sin_cliente(nombre, resuelto))
+
+            elif llamada.nombre in ("registrar_prestamo", "registrar_abono"):
+                es_prestamo = llamada.nombre == "registrar_prestamo"
+                tipo = "el préstamo" if es_prestamo else "el abono"
+                monto = _monto(llamada.argumentos.get("monto"))
+                if cliente and monto:
+                    nuevos.append(MovimientoPendiente(
+                        cliente_id=cliente.id,
+                        tipo="PRESTAMO" if es_prestamo else "ABONO",
+                        monto=monto
+                    ))
+                    cliente_id = cliente.id
+                    resultados.append(
+                        f"Registrado préstamo de ${monto:,.0f} a {cliente.nombre}." if es_prestamo
+                        else f"Registrado abono de ${monto:,.0f} de {cliente.nombre}."
+                    )
+                elif not cliente:
+                    resultados.append(f"No registré {tipo}. {_sin_cliente(nombre, resuelto)}")
+                else:
+                    resultados.append(f"No pude registrar {tipo}. Verifica el monto.")
+
+            elif llamada.nombre == "listar_pendientes":
+                await guardar_nuevos()
+                resultados.append(await _listar_pendientes(db))
+
+            elif llamada.nombre == "marcar_procesado":
+                if cliente:
+                    await guardar_nuevos()
+                    await db.run_sync(marcar_procesados, MovimientoPendiente.cliente_id == cliente.id)
+                    cliente_id = cliente.id
+                    resultados.append(f"Marcados como procesados los movimientos de {cliente.nombre}.")
+                else:
+                    resultados.append(_sin_cliente(nombre, resuelto))
+
+            else:
+                print(f"[DEBUG] Herramienta desconocida: {llamada.nombre}")
+                accion = None
+
+        # Sin flush: el commit del llamador los inserta junto con los mensajes
+        await guardar_nuevos(visibles=False)
+    except Exception:
+        await db.rollback()
+        raise
+
+    mensaje_final = " ".join(p for p in [respuesta.texto.strip(), *resultados] if p)
+    return mensaje_final, imagen_url, cliente_id, accion
@@ -0,0 +1,73 @@
+"""Utilidades de procesamiento de imágenes (Pillow)."""
+import io
+import os
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+CALIDAD_WEBP = 80
+
+
+def generar_miniatura(origen: Union[bytes, Path], destino: Path, max_lado: int) -> Path:
+    """Reduce una imagen a max_lado píxeles (lado mayor) y la guarda como WebP.
+
+    Respeta la orientación EXIF de las fotos del celular. La escritura es
+    atómica: se guarda en un temporal y luego se renombra.
+    """
+    fuente = io.BytesIO(origen) if isinstance(origen, bytes) else origen
+    with Image.open(fuente) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ("RGB", "L"):
+            imagen = imagen.convert("RGB")
+        imagen.thumbnail((max_lado, max_lado))
+        temporal = destino.with_name(f".{destino.name}.tmp")
+        imagen.save(temporal, format="WEBP", quality=CALIDAD_WEBP)
+    os.replace(temporal, destino)
+    return destino
+
+
+def preparar_para_ocr(
+    contenido: bytes,
+    mime_type: str,
+    max_lado: int,
+    calidad: int,
+    recorte: Optional[Tuple[float, float, float, float]] = None,
+) -> Tuple[bytes, str]:
+    """Reduce una foto antes de enviarla al modelo de visión.
+
+    Corrige la orientación EXIF, recorta opcionalmente a la región de la
+    etiqueta (fracciones del ancho/alto ya orientado), baja el lado mayor a
+    max_lado y la codifica como JPEG en escala de grises. Para leer texto
+    escrito no hace falta color ni los 12 MP de la cámara, y el tamaño del
+    envío pesa tanto en la subida como en la latencia del modelo.
+
+    Si Pillow no puede abrir la imagen (p. ej. HEIC sin plugin) se devuelve
+    el original sin cambios. Devuelve (bytes, mime_type).
+    """
+    try:
+        with Image.open(io.BytesIO(contenido)) as imagen:
+            if imagen.format == "JPEG":
+                # Decodificar ya reducido (escalado DCT del JPEG) en vez de los 12 MP
+                # completos. draft elige la escala que deja la imagen >= al tamaño
+                # pedido en ambos ejes; con recorte se pide proporcionalmente más.
+                ancho, alto = imagen.size
+                escala = max_lado / max(ancho, alto)
+                if recorte:
+                    escala /= min(recorte[2] - recorte[0], recorte[3] - recorte[1])
+                imagen.draft("L", (round(ancho * escala), round(alto * escala)))
+            imagen = ImageOps.exif_transpose(imagen)
+            if recorte:
+                ancho, alto = imagen.size
+                imagen = imagen.crop((
+                    round(recorte[0] * ancho), round(recorte[1] * alto),
+                    round(recorte[2] * ancho), round(recorte[3] * alto),
+                ))
+            imagen = imagen.convert("L")
+            imagen.thumbnail((max_lado, max_lado))
+            salida = io.BytesIO()
+            imagen.save(salida, format="JPEG", quality=calidad, optimize=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        print(f"[DEBUG] No se pudo preprocesar la imagen ({e}); se envía la original")
+        return contenido, mime_type
+    return salida.getvalue(), "image/jpeg"
@@ -0,0 +1,173 @@
+"""
+Índice en memoria de nombres de clientes para búsqueda difusa.
+
+Mantiene, por proceso, los nombres plegados (minúsculas, sin tildes) de todos
+los clientes y un índice invertido de trigramas. Una búsqueda genera candidatos
+con las listas de trigramas y los ordena por similitud palabra a palabra, así
+que el orden de las palabras y los errores de ortografía no impiden encontrar
+al cliente ("Jeferson Arteaga" -> "Arteaga Romero Jefersson").
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.texto import plegar_nombre
+from app.models import Cliente
+
+# Similitud mínima de cada palabra buscada con alguna del nombre: "Juan Perez"
+# no debe traer a "Juan Gomez" solo porque coincide el nombre de pila
+UMBRAL_PALABRA = 0.5
+# Similitud mínima para aceptar un candidato
+UMBRAL_SIMILITUD = 0.6
+# Para identificar a un único cliente (ver identificar): similitud mínima del
+# mejor candidato y ventaja mínima sobre el segundo
+SIMILITUD_IDENTIFICAR = 0.85
+VENTAJA_IDENTIFICAR = 0.1
+# Cuántos candidatos (por trigramas compartidos) se puntúan en detalle
+MAX_CANDIDATOS = 50
+
+
+def trigramas(palabra: str) -> FrozenSet[str]:
+    """Trigramas de una palabra con relleno, al estilo de pg_trgm."""
+    relleno = f"  {palabra} "
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+def similitud_palabras(consulta: str, tri_consulta: FrozenSet[str], palabra: str, tri_palabra: FrozenSet[str]) -> float:
+    """Coeficiente de Dice entre trigramas; un prefijo exacto cuenta como casi igual."""
+    if consulta == palabra:
+        return 1.0
+    comunes = len(tri_consulta & tri_palabra)
+    similitud = 2 * comunes / (len(tri_consulta) + len(tri_palabra))
+    if len(consulta) >= 3 and palabra.startswith(consulta):
+        similitud = max(similitud, 0.85)
+    return similitud
+
+
+class IndiceClientes:
+    """Índice invertido de trigramas sobre los nombres de clientes."""
+
+    def __init__(self, ttl_segundos: int = 300):
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        self._palabras: Dict[int, List[Tuple[str, FrozenSet[str]]]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._cargado_en: Optional[float] = None
+
+    def cargar(self, db: Session) -> None:
+        """Reconstruye el índice completo desde la tabla clientes."""
+        filas = db.query(Cliente.id, Cliente.nombre).all()
+        with self._lock:
+            self._palabras = {}
+            self._postings = defaultdict(set)
+            for cliente_id, nombre in filas:
+                self._agregar(cliente_id, nombre)
+            self._cargado_en = time.monotonic()
+        print(f"[DEBUG] Índice de clientes cargado: {len(filas)} clientes")
+
+    def asegurar_cargado(self, db: Session) -> None:
+        """Carga el índice si está vacío o si venció su TTL.
+
+        El TTL cubre los cambios hechos por otros workers, que no pasan por
+        las actualizaciones incrementales de este proceso.
+        """
+        cargado_en = self._cargado_en
+        if cargado_en is None or time.monotonic() - cargado_en > self.ttl_segundos:
+            self.cargar(db)
+
+    def _agregar(self, cliente_id: int, nombre: str) -> None:
+        palabras = [(p, trigramas(p)) for p in plegar_nombre(nombre).split()]
+        self._palabras[cliente_id] = palabras
+        for _, tri in palabras:
+            for t in tri:
+                self._postings[t].add(cliente_id)
+
+    def _eliminar(self, cliente_id: int) -> None:
+        palabras = self._palabras.pop(cliente_id, None)
+        if not palabras:
+            return
+        for _, tri in palabras:
+            for t in tri:
+                ids = self._postings.get(t)
+                if ids is not None:
+                    ids.discard(cliente_id)
+                    if not ids:
+                        del self._postings[t]
+
+    def actualizar(self, cliente_id: int, nombre: str) -> None:
+        """Agrega o reemplaza el nombre de un cliente en el índice."""
+        if self._cargado_en is None:
+            return  # Se indexará completo en la primera búsqueda
+        with self._lock:
+            self._eliminar(cliente_id)
+            self._agregar(cliente_id, nombre)
+
+    def eliminar(self, cliente_id: int) -> None:
+        """Quita un cliente del índice."""
+        with self._lock:
+            self._eliminar(cliente_id)
+
+    def buscar(self, nombre: str, limite: int = 5) -> List[Tuple[int, float]]:
+        """Devuelve [(cliente_id, similitud)] ordenados de mejor a peor."""
+        consulta = [(p, trigramas(p)) for p in plegar_nombre(nombre).split() if len(p) > 1]
+        if not consulta:
+            return []
+
+        with self._lock:
+            # Candidatos: clientes que comparten más trigramas con la consulta
+            conteo: Dict[int, int] = defaultdict(int)
+            for _, tri in consulta:
+                for t in tri:
+                    for cliente_id in self._postings.get(t, ()):
+                        conteo[cliente_id] += 1
+            candidatos = sorted(conteo, key=conteo.get, reverse=True)[:MAX_CANDIDATOS]
+            palabras_candidatos = {c: self._palabras[c] for c in candidatos}
+
+        peso_total = sum(len(p) for p, _ in consulta)
+        resultados = []
+        for cliente_id, palabras in palabras_candidatos.items():
+            # Qué tan cubierta queda cada palabra buscada por alguna del nombre
+            similitudes = [max(similitud_palabras(p, tri, np, ntri) for np, ntri in palabras) for p, tri in consulta]
+            if min(similitudes) < UMBRAL_PALABRA:
+                continue
+            cobertura = sum(len(p) * sim for (p, _), sim in zip(consulta, similitudes)) / peso_total
+            # Desempate leve a favor de nombres sin palabras de sobra
+            extra = min(len(consulta) / len(palabras), 1.0)
+            puntaje = 0.9 * cobertura + 0.1 * extra
+            if cobertura >= UMBRAL_SIMILITUD:
+                resultados.append((cliente_id, round(puntaje, 4)))
+
+        resultados.sort(key=lambda r: r[1], reverse=True)
+        return resultados[:limite]
+
+    def identificar(self, nombre: str, limite: int = 3) -> Tuple[Optional[int], List[int]]:
+        """Resuelve un nombre a un solo cliente, sin quedarse con el primero a ciegas.
+
+        Devuelve (cliente_id, candidatos). cliente_id es None si ningún cliente
+        coincide o si el mejor no supera SIMILITUD_IDENTIFICAR con una ventaja
+        de VENTAJA_IDENTIFICAR sobre el segundo; candidatos sirve entonces para
+        preguntar a cuál se refiere. Un nombre idéntico al buscado siempre gana.
+        """
+        resultados = self.buscar(nombre, limite=limite)
+        candidatos = [cliente_id for cliente_id, _ in resultados]
+        if not resultados:
+            return None, []
+
+        buscado = plegar_nombre(nombre).split()
+        with self._lock:
+            exactos = [c for c in candidatos if [p for p, _ in self._palabras.get(c, ())] == buscado]
+        if len(exactos) == 1:
+            return exactos[0], candidatos
+
+        mejor = resultados[0][1]
+        segundo = resultados[1][1] if len(resultados) > 1 else 0.0
+        if mejor >= SIMILITUD_IDENTIFICAR and mejor - segundo >= VENTAJA_IDENTIFICAR:
+            return candidatos[0], candidatos
+        return None, candidatos
+
+
+indice_clientes = IndiceClientes(ttl_segundos=settings.INDICE_CLIENTES_TTL)
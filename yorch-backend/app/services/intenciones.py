@@ -0,0 +1,118 @@
+"""
+Detección local de intenciones frecuentes, sin pasar por el modelo.
+
+La mayoría de los mensajes del chat son unas pocas frases ("le presté 500 mil a
+X", "X abonó 200 mil", "qué tengo pendiente", "muéstrame el sobre de X"). Esta
+gramática las reconoce y produce la misma respuesta (texto + llamada a
+herramienta) que daría Gemini, para que ejecutar_herramientas la ejecute igual. Solo se resuelve
+localmente si el monto es claro y el nombre coincide sin ambigüedad con un
+cliente; en cualquier otro caso se devuelve None y el mensaje va al modelo.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.texto import parse_monto, quitar_acentos
+from app.models import Cliente
+from app.services.herramientas import LlamadaHerramienta, RespuestaAgente
+from app.services.indice_clientes import indice_clientes
+
+# Montos sin decimales: "500", "500.000", "$200,000", "500 mil", "2 millones"
+MONTO = r"(?P<monto>\$?\s*(?:\d{1,3}(?:[.,]\d{3})+|\d+)(?:\s*(?:mil|millon(?:es)?))?)(?:\s*pesos)?"
+NOMBRE = r"(?P<nombre>[a-z][a-z\s]{1,80}?)"
+FIN = r"\s*[.!?]*$"
+
+GRAMATICA = [
+    ("registrar_prestamo", re.compile(rf"^(?:yo\s+)?(?:le\s+)?(?:preste|prestamos|di\s+prestado)\s+{MONTO}\s+(?:a|para)\s+{NOMBRE}{FIN}")),
+    ("registrar_prestamo", re.compile(rf"^(?:registra(?:r)?\s+)?(?:un\s+)?prestamo\s+de\s+{MONTO}\s+(?:a|para)\s+{NOMBRE}{FIN}")),
+    ("registrar_abono", re.compile(rf"^{NOMBRE}\s+(?:me\s+)?(?:abono|pago)\s+{MONTO}{FIN}")),
+    ("registrar_abono", re.compile(rf"^(?:registra(?:r)?\s+)?(?:un\s+)?abono\s+de\s+{MONTO}\s+(?:de|a|para)\s+{NOMBRE}{FIN}")),
+    ("listar_pendientes", re.compile(rf"^(?:que|q)\s+(?:tengo|hay)\s+pendientes?{FIN}")),
+    ("listar_pendientes", re.compile(rf"^(?:muestrame|mostrar|ver|dame)\s+(?:los\s+|mis\s+)?pendientes{FIN}")),
+    ("buscar_cliente", re.compile(rf"^(?:muestrame|mostrar|ensename|ver|busca(?:r)?|abre)\s+(?:el\s+)?sobre\s+de\s+{NOMBRE}{FIN}")),
+    ("marcar_procesado", re.compile(rf"^ya\s+actualice\s+(?:el\s+)?sobre\s+de\s+{NOMBRE}{FIN}")),
+]
+
+
+@dataclass
+class Intencion:
+    accion: str
+    respuesta: RespuestaAgente  # Como la devolvería el modelo
+
+
+class MetricasIntenciones:
+    """Contadores de cuántos mensajes se resolvieron sin llamar al modelo."""
+
+    def __init__(self):
+        self.mensajes = 0
+        self.por_accion = Counter()
+
+    def registrar(self, intencion: Optional[Intencion]) -> None:
+        self.mensajes += 1
+        if intencion:
+            self.por_accion[intencion.accion] += 1
+
+    def resumen(self) -> dict:
+        resueltos = sum(self.por_accion.values())
+        return {
+            "mensajes": self.mensajes,
+            "resueltos_localmente": resueltos,
+            "enviados_al_llm": self.mensajes - resueltos,
+            "tasa_aciertos": round(resueltos / self.mensajes, 4) if self.mensajes else 0.0,
+            "por_accion": dict(self.por_accion),
+        }
+
+
+metricas_intenciones = MetricasIntenciones()
+
+
+async def _resolver_cliente(db: AsyncSession, nombre: str) -> Optional[Cliente]:
+    """Devuelve el cliente solo si el nombre lo identifica sin ambigüedad."""
+    await db.run_sync(indice_clientes.asegurar_cargado)
+    cliente_id, _ = indice_clientes.identificar(nombre, limite=2)
+    if cliente_id is None:
+        return None
+    return await db.get(Cliente, cliente_id)
+
+
+async def _construir(db: AsyncSession, accion: str, datos: dict) -> Optional[Intencion]:
+    if accion == "listar_pendientes":
+        return Intencion(accion, RespuestaAgente(
+            "Déjame revisar tus movimientos pendientes.", [LlamadaHerramienta(accion)]
+        ))
+
+    cliente = await _resolver_cliente(db, datos["nombre"])
+    if not cliente:
+        return None
+
+    argumentos = {"nombre": cliente.nombre}
+    if accion == "buscar_cliente":
+        texto = f"Buscando el sobre de {cliente.nombre}..."
+    elif accion == "marcar_procesado":
+        texto = "Perfecto."
+    else:
+        monto = parse_monto(datos["monto"])
+        if not monto:
+            return None
+        argumentos["monto"] = monto
+        texto = "Entendido."
+    return Intencion(accion, RespuestaAgente(texto, [LlamadaHerramienta(accion, argumentos)]))
+
+
+async def detectar_intencion(db: AsyncSession, mensaje: str) -> Optional[Intencion]:
+    """Intenta resolver el mensaje con la gramática local; None si hay que usar el modelo."""
+    texto = " ".join(quitar_acentos(mensaje.lower()).split())
+    texto = texto.lstrip("¿¡")
+
+    intencion = None
+    for accion, patron in GRAMATICA:
+        match = patron.match(texto)
+        if match:
+            intencion = await _construir(db, accion, match.groupdict())
+            break
+
+    metricas_intenciones.registrar(intencion)
+    return intencion
@@ -0,0 +1,191 @@
+"""
+Cliente asíncrono compartido para el modelo de lenguaje (Gemini).
+
+Todas las llamadas al modelo (chat, transcripción de voz y lectura de sobres)
+pasan por aquí para no bloquear el event loop de uvicorn. El cliente limita la
+concurrencia, aplica un timeout por llamada y reintenta con backoff exponencial
+los errores transitorios. Con LLM_PROVEEDOR="falso" se usa un modelo local que
+simula la latencia de Gemini, útil para pruebas y benchmarks sin red.
+"""
+import asyncio
+import random
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Sequence, Tuple
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from app.core.config import settings
+
+# Errores que vale la pena reintentar (cuota, caídas y timeouts)
+ERRORES_REINTENTABLES = (
+    asyncio.TimeoutError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class RespuestaFalsa:
+    """Imita la parte de GenerateContentResponse que usamos (.text y .candidates[0].content.parts)."""
+
+    def __init__(self, text: str, llamadas: Sequence[Tuple[str, dict]] = ()):
+        self.text = text
+        partes = [SimpleNamespace(text=text, function_call=None)] if text else []
+        partes += [
+            SimpleNamespace(text="", function_call=SimpleNamespace(name=nombre, args=argumentos))
+            for nombre, argumentos in llamadas
+        ]
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=partes))]
+
+
+class ModeloFalso:
+    """Modelo local que reemplaza a Gemini en pruebas y benchmarks."""
+
+    def __init__(self, latencia_ms: int = 800, variacion_ms: int = 200, ms_por_mb: int = 0):
+        self.latencia_ms = latencia_ms
+        self.variacion_ms = variacion_ms
+        # Gemini tarda más cuanto más pesa lo que se le envía (subida + procesamiento)
+        self.ms_por_mb = ms_por_mb
+
+    @staticmethod
+    def bytes_enviados(contenido: Any) -> int:
+        """Bytes de los archivos (inline_data) incluidos en el contenido."""
+        partes = contenido if isinstance(contenido, list) else [contenido]
+        return sum(
+            len(parte["inline_data"].get("data") or b"")
+            for parte in partes if isinstance(parte, dict) and "inline_data" in parte
+        )
+
+    def _responder(self, contenido: Any, tools: Any = None) -> Tuple[str, list]:
+        partes = contenido if isinstance(contenido, list) else [contenido]
+        for parte in partes:
+            if isinstance(parte, dict) and "inline_data" in parte:
+                mime = parte["inline_data"].get("mime_type", "")
+                if mime.startswith("image/"):
+                    return "Arteaga Romero Jefersson", []
+                if mime.startswith("audio/"):
+                    return "qué tengo pendiente", []
+        if tools:
+            return "Déjame revisar tus movimientos pendientes.", [("listar_pendientes", {})]
+        return "Déjame revisar tus movimientos pendientes. [LISTAR_PENDIENTES]", []
+
+    async def generate_content_async(self, contenido: Any, stream: bool = False, tools: Any = None, **kwargs):
+        latencia = self.latencia_ms + random.uniform(-self.variacion_ms, self.variacion_ms)
+        latencia += self.ms_por_mb * self.bytes_enviados(contenido) / (1024 * 1024)
+        texto, llamadas = self._responder(contenido, tools)
+        if stream:
+            # Primer fragmento a ~1/4 de la latencia y el resto repartido, como un stream real
+            await asyncio.sleep(max(latencia, 0) / 4000)
+            return RespuestaFalsaStream(texto, max(latencia, 0) * 3 / 4000, llamadas)
+        await asyncio.sleep(max(latencia, 0) / 1000)
+        return RespuestaFalsa(texto, llamadas)
+
+
+class RespuestaFalsaStream:
+    """Imita la iteración asíncrona de una respuesta de Gemini con stream=True."""
+
+    def __init__(self, texto: str, duracion_segundos: float, llamadas: Sequence[Tuple[str, dict]] = ()):
+        self.llamadas = llamadas
+        palabras = texto.split(" ")
+        self.fragmentos = [p + " " for p in palabras[:-1]] + palabras[-1:]
+        self.pausa = duracion_segundos / max(len(self.fragmentos), 1)
+
+    async def __aiter__(self):
+        for fragmento in self.fragmentos:
+            yield RespuestaFalsa(fragmento)
+            await asyncio.sleep(self.pausa)
+        if self.llamadas:
+            # Gemini entrega las llamadas a herramientas en su propio fragmento
+            yield RespuestaFalsa("", self.llamadas)
+
+
+class ClienteLLM:
+    """Envoltura asíncrona con límite de concurrencia, timeout y reintentos."""
+
+    def __init__(
+        self,
+        modelo: Any,
+        timeout_segundos: float = 30,
+        max_concurrencia: int = 8,
+        reintentos: int = 2,
+        backoff_segundos: float = 0.5,
+    ):
+        self.modelo = modelo
+        self.timeout_segundos = timeout_segundos
+        self.reintentos = reintentos
+        self.backoff_segundos = backoff_segundos
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+
+    async def generar(self, contenido: Any) -> str:
+        """Envía el contenido al modelo y devuelve el texto de la respuesta."""
+        return (await self.generar_respuesta(contenido)).text
+
+    async def generar_respuesta(self, contenido: Any, **opciones) -> Any:
+        """Como generar, pero devuelve la respuesta completa (partes de texto y
+        llamadas a herramientas). `opciones` se pasan al modelo, p. ej. tools."""
+        for intento in range(self.reintentos + 1):
+            try:
+                async with self._semaforo:
+                    respuesta = await asyncio.wait_for(
+                        self.modelo.generate_content_async(contenido, **opciones),
+                        timeout=self.timeout_segundos,
+                    )
+                return respuesta
+            except ERRORES_REINTENTABLES as e:
+                if intento == self.reintentos:
+                    raise
+                # Backoff exponencial con jitter, fuera del semáforo
+                espera = self.backoff_segundos * (2 ** intento) * random.uniform(0.5, 1.5)
+                print(f"[DEBUG] LLM error transitorio ({type(e).__name__}), reintento {intento + 1} en {espera:.2f}s")
+                await asyncio.sleep(espera)
+
+    async def generar_stream(self, contenido: Any, **opciones) -> AsyncIterator[Any]:
+        """Envía el contenido al modelo y va entregando los fragmentos de la
+        respuesta a medida que llegan (con sus partes de texto y llamadas).
+
+        Solo se reintenta si el error ocurre antes del primer fragmento; después
+        ya se entregó texto al cliente y reintentar lo duplicaría.
+        """
+        for intento in range(self.reintentos + 1):
+            entregado = False
+            try:
+                async with self._semaforo:
+                    respuesta = await asyncio.wait_for(
+                        self.modelo.generate_content_async(contenido, stream=True, **opciones),
+                        timeout=self.timeout_segundos,
+                    )
+                    iterador = respuesta.__aiter__()
+                    while True:
+                        try:
+                            fragmento = await asyncio.wait_for(iterador.__anext__(), timeout=self.timeout_segundos)
+                        except StopAsyncIteration:
+                            return
+                        entregado = True
+                        yield fragmento
+            except ERRORES_REINTENTABLES as e:
+                if entregado or intento == self.reintentos:
+                    raise
+                espera = self.backoff_segundos * (2 ** intento) * random.uniform(0.5, 1.5)
+                print(f"[DEBUG] LLM error transitorio ({type(e).__name__}), reintento {intento + 1} en {espera:.2f}s")
+                await asyncio.sleep(espera)
+
+
+@lru_cache
+def obtener_cliente_llm() -> ClienteLLM:
+    """Devuelve el cliente LLM del proceso (se construye una sola vez)."""
+    if settings.LLM_PROVEEDOR == "falso":
+        modelo = ModeloFalso(latencia_ms=settings.LLM_FALSO_LATENCIA_MS, ms_por_mb=settings.LLM_FALSO_MS_POR_MB)
+    else:
+        if settings.GEMINI_API_KEY:
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+        modelo = genai.GenerativeModel(settings.GEMINI_MODELO)
+
+    return ClienteLLM(
+        modelo,
+        timeout_segundos=settings.LLM_TIMEOUT_SEGUNDOS,
+        max_concurrencia=settings.LLM_MAX_CONCURRENCIA,
+        reintentos=settings.LLM_REINTENTOS,
+    )
@@ -0,0 +1,153 @@
+"""
+Armado del prompt del chat con presupuesto de tokens.
+
+El prompt es: instrucciones de sistema + resumen de la conversación anterior +
+historial reciente + mensaje actual. Cada mensaje del historial se recorta a
+LLM_MAX_TOKENS_MENSAJE (los listados de LISTAR_PENDIENTES que el agente dejó
+en el historial pueden tener cientos de líneas) y el historial se llena desde
+el mensaje más reciente hasta agotar LLM_PRESUPUESTO_PROMPT_TOKENS. Lo que ya
+no entra se pliega en un resumen acumulado por conversación
+(resumenes_conversacion), así que el tamaño del prompt queda acotado sin
+importar lo largas que hayan sido las respuestas anteriores.
+
+Los tokens se estiman localmente (~4 caracteres por token): contar con la API
+de Gemini costaría una llamada de red extra por turno.
+"""
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from app.models import Mensaje
+
+CARACTERES_POR_TOKEN = 4
+# Largo de cada línea del resumen (por mensaje plegado)
+MAX_CARACTERES_LINEA_RESUMEN = 120
+
+
+def estimar_tokens(texto: Optional[str]) -> int:
+    return math.ceil(len(texto or "") / CARACTERES_POR_TOKEN)
+
+
+def compactar(texto: str, max_tokens: int) -> str:
+    """Recorta un texto largo a `max_tokens`, conservando las primeras líneas completas.
+
+    En un listado la primera línea ("Tienes 37 movimientos pendientes:") y los
+    primeros elementos bastan como contexto para el modelo.
+    """
+    if estimar_tokens(texto) <= max_tokens:
+        return texto
+    max_caracteres = max_tokens * CARACTERES_POR_TOKEN
+    lineas = texto.splitlines()
+    conservadas, usados = [], 0
+    for linea in lineas:
+        if usados + len(linea) + 1 > max_caracteres - 40:  # Reserva para la marca de omisión
+            break
+        conservadas.append(linea)
+        usados += len(linea) + 1
+    if not conservadas:
+        return texto[:max_caracteres - 3].rstrip() + "..."
+    return "\n".join(conservadas) + f"\n[... {len(lineas) - len(conservadas)} líneas omitidas]"
+
+
+def _linea_resumen(mensaje: Mensaje) -> str:
+    rol = "Usuario" if mensaje.rol == "user" else "Asistente"
+    texto = " ".join(mensaje.contenido.split())
+    if len(texto) > MAX_CARACTERES_LINEA_RESUMEN:
+        texto = texto[:MAX_CARACTERES_LINEA_RESUMEN - 3].rstrip() + "..."
+    return f"- {rol}: {texto}"
+
+
+def plegar_en_resumen(resumen: str, mensajes: Sequence[Mensaje], max_tokens: int) -> str:
+    """Agrega una línea por mensaje al resumen y descarta las más antiguas si no cabe."""
+    lineas = [l for l in (resumen or "").splitlines() if l] + [_linea_resumen(m) for m in mensajes]
+    while lineas and estimar_tokens("\n".join(lineas)) > max_tokens:
+        lineas.pop(0)
+    return "\n".join(lineas)
+
+
+@dataclass
+class PromptConstruido:
+    texto: str
+    tokens: int
+    tokens_sistema: int
+    tokens_resumen: int
+    tokens_historial: int
+    incluidos: List[Mensaje] = field(default_factory=list)  # En orden cronológico
+    excluidos: List[Mensaje] = field(default_factory=list)  # Más antiguos, para plegar en el resumen
+
+
+def construir_prompt(
+    sistema: str,
+    resumen: str,
+    historial: Sequence[Mensaje],
+    mensaje_usuario: str,
+    presupuesto_tokens: int,
+    max_tokens_mensaje: int,
+    max_mensajes: int,
+) -> PromptConstruido:
+    """Arma el prompt con los mensajes más recientes de `historial` (cronológico) que quepan."""
+    fijo = f"{sistema}\n\nResumen de la conversación anterior:\n{resumen}\n\n" if resumen else f"{sistema}\n\n"
+    cola = f"\n\nUsuario: {mensaje_usuario}\n\nAsistente:"
+    disponible = presupuesto_tokens - estimar_tokens(fijo) - estimar_tokens(cola)
+
+    lineas: List[str] = []
+    incluidos: List[Mensaje] = []
+    for mensaje in reversed(historial):
+        rol = "Usuario" if mensaje.rol == "user" else "Asistente"
+        linea = f"{rol}: {compactar(mensaje.contenido, max_tokens_mensaje)}"
+        costo = estimar_tokens(linea) + 1
+        if len(incluidos) >= max_mensajes or costo > disponible:
+            break
+        disponible -= costo
+        lineas.append(linea)
+        incluidos.append(mensaje)
+    lineas.reverse()
+    incluidos.reverse()
+    excluidos = list(historial[:len(historial) - len(incluidos)])
+
+    texto = f"{fijo}Historial reciente:\n" + "\n".join(lineas) + cola
+    return PromptConstruido(
+        texto=texto,
+        tokens=estimar_tokens(texto),
+        tokens_sistema=estimar_tokens(sistema),
+        tokens_resumen=estimar_tokens(resumen),
+        tokens_historial=sum(estimar_tokens(l) + 1 for l in lineas),
+        incluidos=incluidos,
+        excluidos=excluidos,
+    )
+
+
+class MetricasPrompt:
+    """Tokens de los prompts enviados al modelo (estimados)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.tokens_total = 0
+        self.tokens_maximo = 0
+        self.ultimo: Optional[dict] = None
+
+    def registrar(self, prompt: PromptConstruido) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.tokens_total += prompt.tokens
+            self.tokens_maximo = max(self.tokens_maximo, prompt.tokens)
+            self.ultimo = {
+                "tokens": prompt.tokens,
+                "sistema": prompt.tokens_sistema,
+                "resumen": prompt.tokens_resumen,
+                "historial": prompt.tokens_historial,
+                "mensajes_historial": len(prompt.incluidos),
+            }
+
+    def resumen(self) -> dict:
+        return {
+            "prompts": self.prompts,
+            "tokens_promedio": round(self.tokens_total / self.prompts, 1) if self.prompts else 0.0,
+            "tokens_maximo": self.tokens_maximo,
+            "ultimo": self.ultimo,
+        }
+
+
+metricas_prompt = MetricasPrompt()
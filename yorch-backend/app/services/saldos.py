@@ -0,0 +1,143 @@
+"""
+Saldos por cliente materializados en la tabla saldos_clientes.
+
+Toda alta de movimiento y todo paso a "procesado" debe pasar por aquí, dentro
+de la misma transacción que modifica movimientos_pendientes, para que los
+totales nunca se desfasen. Ninguna función hace commit: eso queda a cargo del
+llamador. reconciliar_saldos compara la tabla contra los movimientos crudos.
+Las rutas, que usan AsyncSession, las llaman con `await db.run_sync(...)`.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import MovimientoPendiente, SaldoCliente
+
+CERO = Decimal("0")
+COLUMNAS = ("pendiente_prestamos", "pendiente_abonos", "cantidad_pendientes", "total_prestamos", "total_abonos")
+
+
+def _aplicar_deltas(db: Session, cliente_id: int, deltas: Dict[str, object]) -> None:
+    """Suma los deltas al saldo del cliente (UPDATE atómico; crea la fila si falta)."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    valores = {k: getattr(SaldoCliente, k) + v for k, v in deltas.items()}
+    resultado = db.execute(
+        update(SaldoCliente).where(SaldoCliente.cliente_id == cliente_id).values(**valores)
+    )
+    if resultado.rowcount:
+        return
+    try:
+        # Primera vez para este cliente; el savepoint cubre la carrera con otra transacción
+        with db.begin_nested():
+            db.add(SaldoCliente(cliente_id=cliente_id, **{k: deltas.get(k, 0) for k in COLUMNAS}))
+    except IntegrityError:
+        db.execute(update(SaldoCliente).where(SaldoCliente.cliente_id == cliente_id).values(**valores))
+
+
+def registrar_movimientos(db: Session, movimientos: Iterable[Tuple[int, str, Decimal]]) -> None:
+    """Suma movimientos nuevos (cliente_id, tipo, monto) a los saldos."""
+    por_cliente: Dict[int, Dict[str, object]] = defaultdict(lambda: defaultdict(int))
+    for cliente_id, tipo, monto in movimientos:
+        deltas = por_cliente[cliente_id]
+        monto = Decimal(monto)
+        if tipo == "PRESTAMO":
+            deltas["pendiente_prestamos"] += monto
+            deltas["total_prestamos"] += monto
+        else:
+            deltas["pendiente_abonos"] += monto
+            deltas["total_abonos"] += monto
+        deltas["cantidad_pendientes"] += 1
+    for cliente_id in sorted(por_cliente):  # Orden fijo para evitar deadlocks entre transacciones
+        _aplicar_deltas(db, cliente_id, por_cliente[cliente_id])
+
+
+def registrar_movimiento(db: Session, movimiento: MovimientoPendiente) -> None:
+    """Suma un movimiento recién creado a los saldos de su cliente."""
+    registrar_movimientos(db, [(movimiento.cliente_id, movimiento.tipo, movimiento.monto)])
+
+
+def marcar_procesados(db: Session, *condiciones) -> Counter:
+    """Marca como procesados los movimientos pendientes que cumplan las condiciones.
+
+    Usa UPDATE ... RETURNING, así que los saldos se descuentan exactamente con
+    las filas que este UPDATE cambió. Devuelve la cantidad procesada por cliente.
+    Los MovimientoPendiente ya cargados en la sesión no se sincronizan.
+    """
+    filas = db.execute(
+        update(MovimientoPendiente)
+        .where(MovimientoPendiente.procesado == False, *condiciones)
+        .values(procesado=True, procesado_at=datetime.utcnow())
+        .returning(MovimientoPendiente.cliente_id, MovimientoPendiente.tipo, MovimientoPendiente.monto)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    por_cliente: Dict[int, Dict[str, object]] = defaultdict(lambda: defaultdict(int))
+    conteo = Counter()
+    for cliente_id, tipo, monto in filas:
+        deltas = por_cliente[cliente_id]
+        if tipo == "PRESTAMO":
+            deltas["pendiente_prestamos"] -= Decimal(monto)
+        else:
+            deltas["pendiente_abonos"] -= Decimal(monto)
+        deltas["cantidad_pendientes"] -= 1
+        conteo[cliente_id] += 1
+    for cliente_id in sorted(por_cliente):
+        _aplicar_deltas(db, cliente_id, por_cliente[cliente_id])
+    return conteo
+
+
+def calcular_saldos(db: Session) -> Dict[int, Dict[str, object]]:
+    """Recalcula los saldos desde movimientos_pendientes (una sola consulta agregada)."""
+    es_prestamo = MovimientoPendiente.tipo == "PRESTAMO"
+    pendiente = MovimientoPendiente.procesado == False
+    filas = db.query(
+        MovimientoPendiente.cliente_id,
+        func.coalesce(func.sum(case((pendiente & es_prestamo, MovimientoPendiente.monto), else_=0)), 0),
+        func.coalesce(func.sum(case((pendiente & ~es_prestamo, MovimientoPendiente.monto), else_=0)), 0),
+        func.sum(case((pendiente, 1), else_=0)),
+        func.coalesce(func.sum(case((es_prestamo, MovimientoPendiente.monto), else_=0)), 0),
+        func.coalesce(func.sum(case((~es_prestamo, MovimientoPendiente.monto), else_=0)), 0),
+    ).group_by(MovimientoPendiente.cliente_id).all()
+    return {
+        fila[0]: {
+            "pendiente_prestamos": Decimal(fila[1]),
+            "pendiente_abonos": Decimal(fila[2]),
+            "cantidad_pendientes": int(fila[3] or 0),
+            "total_prestamos": Decimal(fila[4]),
+            "total_abonos": Decimal(fila[5]),
+        }
+        for fila in filas
+    }
+
+
+def reconciliar_saldos(db: Session, corregir: bool = False) -> List[dict]:
+    """Compara saldos_clientes contra los movimientos crudos y devuelve las diferencias.
+
+    Con corregir=True reescribe las filas que no coinciden (sin hacer commit).
+    """
+    esperados = calcular_saldos(db)
+    actuales = {s.cliente_id: s for s in db.query(SaldoCliente).all()}
+
+    diferencias = []
+    for cliente_id in sorted(set(esperados) | set(actuales)):
+        esperado = esperados.get(cliente_id, {k: CERO if k != "cantidad_pendientes" else 0 for k in COLUMNAS})
+        saldo = actuales.get(cliente_id)
+        actual = {k: getattr(saldo, k) if saldo else (CERO if k != "cantidad_pendientes" else 0) for k in COLUMNAS}
+        distintos = {k: {"esperado": esperado[k], "actual": actual[k]} for k in COLUMNAS if esperado[k] != actual[k]}
+        if not distintos:
+            continue
+        diferencias.append({"cliente_id": cliente_id, "diferencias": distintos})
+        if corregir:
+            if saldo is None:
+                db.add(SaldoCliente(cliente_id=cliente_id, **esperado))
+            else:
+                for k, v in esperado.items():
+                    setattr(saldo, k, v)
+    return diferencias
@@ -0,0 +1,83 @@
+"""
+Recepción de archivos subidos sin cargarlos completos en memoria.
+
+Los archivos se copian por bloques a un temporal en la carpeta de destino,
+con las escrituras fuera del event loop, y al terminar se renombran de forma
+atómica. El límite de tamaño se aplica antes de empezar (si el cliente envió
+el tamaño) y durante la copia, así que una subida gigante se corta apenas lo
+supera.
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+TAMANO_BLOQUE = 1024 * 1024  # 1 MB
+
+
+@dataclass
+class ArchivoGuardado:
+    ruta: Path
+    tamano: int
+    sha256: str
+
+
+def _error_tamano(archivo: UploadFile, max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"El archivo '{archivo.filename}' supera el máximo de {max_bytes // (1024 * 1024)} MB"
+    )
+
+
+def _verificar_tamano_declarado(archivo: UploadFile, max_bytes: int) -> None:
+    if archivo.size is not None and archivo.size > max_bytes:
+        raise _error_tamano(archivo, max_bytes)
+
+
+async def guardar_subida(archivo: UploadFile, destino: Path, max_bytes: int) -> ArchivoGuardado:
+    """Copia el archivo subido a `destino` por bloques y devuelve tamaño y hash."""
+    _verificar_tamano_declarado(archivo, max_bytes)
+
+    temporal = destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+    hasher = hashlib.sha256()
+    tamano = 0
+    buffer = await run_in_threadpool(open, temporal, "wb")
+    try:
+        while True:
+            bloque = await archivo.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            tamano += len(bloque)
+            if tamano > max_bytes:
+                raise _error_tamano(archivo, max_bytes)
+            hasher.update(bloque)
+            await run_in_threadpool(buffer.write, bloque)
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(os.replace, temporal, destino)
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(temporal.unlink, True)
+        raise
+
+    return ArchivoGuardado(ruta=destino, tamano=tamano, sha256=hasher.hexdigest())
+
+
+async def leer_subida(archivo: UploadFile, max_bytes: int) -> bytes:
+    """Lee un archivo que sí se necesita en memoria (p. ej. para Gemini), con límite de tamaño."""
+    _verificar_tamano_declarado(archivo, max_bytes)
+
+    bloques = []
+    tamano = 0
+    while True:
+        bloque = await archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        tamano += len(bloque)
+        if tamano > max_bytes:
+            raise _error_tamano(archivo, max_bytes)
+        bloques.append(bloque)
+    return b"".join(bloques)
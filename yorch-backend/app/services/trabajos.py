@@ -0,0 +1,335 @@
+"""
+Cola de trabajos en segundo plano, guardada en la tabla `trabajos`.
+
+El trabajo pesado (Gemini Vision para los sobres, transcripción de voz,
+versiones reducidas de escrituras) no tiene por qué retener la petición: la
+ruta guarda lo necesario, encola un trabajo y responde con su id. Los workers
+son tareas asyncio dentro del mismo proceso de uvicorn (sin broker externo)
+que toman trabajos de la tabla, los ejecutan con timeout y guardan el
+resultado. Un trabajo que falla se reintenta con backoff exponencial; al
+agotar los intentos queda FALLIDO (cola de descarte) hasta que se reintente a
+mano. Al terminar se avisa por webhook (si el trabajo lo pidió) y a quien esté
+esperando en GET /trabajos/{id}/eventos.
+
+Los trabajos se toman con un UPDATE condicionado (compare-and-set), así que
+varios procesos pueden compartir la tabla; si un proceso muere con un trabajo
+en curso, la reserva vence y otro worker lo retoma.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import Trabajo
+from app.models.trabajo import COMPLETADO, EN_PROCESO, FALLIDO, PENDIENTE
+from app.schemas.trabajo import MAX_LARGO_WEBHOOK
+from app.services.subidas import guardar_subida
+
+# Archivos de entrada de los trabajos (fuera de uploads/, que se sirve sin autenticación)
+TRABAJOS_DIR = Path(__file__).parent.parent.parent / "trabajos"
+TRABAJOS_DIR.mkdir(parents=True, exist_ok=True)
+
+# Parámetro con la ruta del archivo de entrada: se borra cuando el trabajo se completa
+PARAMETRO_ARCHIVO = "archivo"
+# Parámetro con el id del trabajo, que el worker agrega al llamar al manejador
+PARAMETRO_TRABAJO = "trabajo_id"
+# Margen de la reserva de un trabajo en curso por encima del timeout
+MARGEN_RESERVA_SEGUNDOS = 30
+TIMEOUT_WEBHOOK_SEGUNDOS = 10
+
+Manejador = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+MANEJADORES: Dict[str, Manejador] = {}
+
+
+class ErrorPermanente(Exception):
+    """Error que no se arregla reintentando (entrada inválida): el trabajo pasa directo a FALLIDO."""
+
+
+def manejador(tipo: str):
+    """Registra la función que ejecuta los trabajos de `tipo` (recibe los parámetros, devuelve el resultado)."""
+    def registrar(funcion: Manejador) -> Manejador:
+        MANEJADORES[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def trabajo_a_dict(trabajo: Trabajo) -> dict:
+    return {
+        "id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado,
+        "intentos": trabajo.intentos,
+        "max_intentos": trabajo.max_intentos,
+        "resultado": trabajo.resultado,
+        "error": trabajo.error,
+        "created_at": trabajo.created_at.isoformat() if trabajo.created_at else None,
+        "iniciado_at": trabajo.iniciado_at.isoformat() if trabajo.iniciado_at else None,
+        "terminado_at": trabajo.terminado_at.isoformat() if trabajo.terminado_at else None,
+    }
+
+
+def trabajo_encolado(trabajo: Trabajo) -> dict:
+    """Respuesta de una ruta que encoló el trabajo en vez de hacerlo."""
+    return {
+        "trabajo_id": trabajo.id,
+        "estado": trabajo.estado,
+        "url_estado": f"{settings.API_V1_PREFIX}/trabajos/{trabajo.id}",
+        "url_eventos": f"{settings.API_V1_PREFIX}/trabajos/{trabajo.id}/eventos",
+    }
+
+
+async def guardar_entrada(archivo: UploadFile, max_bytes: int, extension: str) -> str:
+    """Guarda el archivo subido para que lo procese un trabajo; devuelve su ruta."""
+    destino = TRABAJOS_DIR / f"{uuid.uuid4().hex}.{extension}"
+    await guardar_subida(archivo, destino, max_bytes)
+    return str(destino)
+
+
+async def encolar(
+    db: AsyncSession,
+    tipo: str,
+    parametros: Dict[str, Any],
+    webhook_url: Optional[str] = None,
+) -> Trabajo:
+    """Crea el trabajo (hace commit) y despierta a los workers."""
+    if tipo not in MANEJADORES:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    trabajo = Trabajo(
+        tipo=tipo,
+        estado=PENDIENTE,
+        parametros=parametros,
+        max_intentos=settings.TRABAJOS_MAX_INTENTOS,
+        disponible_desde=_ahora(),
+        webhook_url=webhook_url,
+    )
+    db.add(trabajo)
+    await db.commit()
+    cola_trabajos.despertar()
+    return trabajo
+
+
+async def reintentar(db: AsyncSession, trabajo: Trabajo) -> Trabajo:
+    """Devuelve a la cola un trabajo FALLIDO, con los intentos en cero."""
+    trabajo.estado = PENDIENTE
+    trabajo.intentos = 0
+    trabajo.error = None
+    trabajo.terminado_at = None
+    trabajo.disponible_desde = _ahora()
+    await db.commit()
+    cola_trabajos.despertar()
+    return trabajo
+
+
+async def guardar_avance(parametros: Dict[str, Any], **avance: Any) -> None:
+    """Anota en los parámetros del trabajo un paso ya hecho (con commit), para que un reintento no lo repita."""
+    parametros.update(avance)
+    async with AsyncSessionLocal() as db:
+        trabajo = await db.get(Trabajo, parametros[PARAMETRO_TRABAJO])
+        trabajo.parametros = {clave: valor for clave, valor in parametros.items() if clave != PARAMETRO_TRABAJO}
+        await db.commit()
+
+
+async def verificar_webhook(url: str) -> None:
+    """Rechaza (ValueError) un webhook que no sea http(s) o cuyo host resuelva a la red interna.
+
+    Localhost, redes privadas, link-local (metadatos de la nube) y demás
+    direcciones no públicas se rechazan para que un webhook no sirva para
+    alcanzar servicios internos (SSRF), salvo los hosts de
+    TRABAJOS_WEBHOOK_HOSTS_PERMITIDOS.
+    """
+    partes = urlsplit(url)
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        raise ValueError("El webhook debe ser una URL http(s)")
+    if len(url) > MAX_LARGO_WEBHOOK:
+        raise ValueError(f"El webhook admite hasta {MAX_LARGO_WEBHOOK} caracteres")
+    host = partes.hostname
+    if host in settings.webhook_hosts_permitidos:
+        return
+    try:
+        direcciones = await asyncio.get_running_loop().getaddrinfo(host, partes.port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"No se pudo resolver el host del webhook: {host}")
+    for *_, direccion in direcciones:
+        ip = ipaddress.ip_address(direccion[0].split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"El webhook no puede apuntar a una dirección interna ({host})")
+
+
+async def validar_webhook(url: Optional[Any]) -> Optional[str]:
+    """webhook_url recibido por una ruta, ya verificado (400 si apunta a la red interna)."""
+    if url is None:
+        return None
+    url = str(url)
+    try:
+        await verificar_webhook(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return url
+
+
+def _firmar(cuerpo: bytes) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+
+async def _enviar_webhook(url: str, datos: dict) -> None:
+    """Avisa que terminó un trabajo; un webhook caído no afecta al trabajo."""
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    try:
+        # Se verifica de nuevo: el host puede resolver a otra dirección que al encolar
+        await verificar_webhook(url)
+        async with httpx.AsyncClient(timeout=TIMEOUT_WEBHOOK_SEGUNDOS) as cliente:
+            respuesta = await cliente.post(url, content=cuerpo, headers={
+                "Content-Type": "application/json",
+                # HMAC-SHA256 del cuerpo con SECRET_KEY, para que el receptor verifique el origen
+                "X-Yorch-Firma": _firmar(cuerpo),
+            })
+            respuesta.raise_for_status()
+    except Exception as e:
+        print(f"[DEBUG] Webhook del trabajo {datos.get('id')} a {url} falló: {e}")
+
+
+class ColaTrabajos:
+    """Workers de la cola y avisos de cambio de estado dentro del proceso."""
+
+    def __init__(self):
+        self._workers: List[asyncio.Task] = []
+        self._hay_trabajo = asyncio.Event()
+        self._cambios: Dict[int, asyncio.Event] = {}
+        self._pendientes: set = set()  # Webhooks en curso (referencia para que no los recolecte el GC)
+
+    def iniciar(self, cantidad: int) -> None:
+        for numero in range(cantidad):
+            self._workers.append(asyncio.create_task(self._worker(numero)))
+
+    async def detener(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, *self._pendientes, return_exceptions=True)
+        self._workers.clear()
+
+    def despertar(self) -> None:
+        self._hay_trabajo.set()
+
+    def _avisar_cambio(self, trabajo_id: int) -> None:
+        evento = self._cambios.pop(trabajo_id, None)
+        if evento:
+            evento.set()
+
+    async def esperar_cambio(self, trabajo_id: int, timeout: float) -> None:
+        """Espera un cambio de estado del trabajo en este proceso, o hasta `timeout`."""
+        evento = self._cambios.setdefault(trabajo_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            # El trabajo puede estar corriendo en otro proceso: el llamador vuelve a leer la tabla
+            if self._cambios.get(trabajo_id) is evento:
+                del self._cambios[trabajo_id]
+
+    async def _tomar(self, db: AsyncSession) -> Optional[Trabajo]:
+        """Reserva el siguiente trabajo disponible, o None si no hay."""
+        ahora = _ahora()
+        disponible = (Trabajo.estado.in_((PENDIENTE, EN_PROCESO)), Trabajo.disponible_desde <= ahora)
+        trabajo_id = await db.scalar(
+            select(Trabajo.id).where(*disponible).order_by(Trabajo.disponible_desde, Trabajo.id).limit(1)
+        )
+        if trabajo_id is None:
+            return None
+        reserva = ahora + timedelta(seconds=settings.TRABAJOS_TIMEOUT_SEGUNDOS + MARGEN_RESERVA_SEGUNDOS)
+        tomado = await db.execute(
+            update(Trabajo)
+            .where(Trabajo.id == trabajo_id, *disponible)
+            .values(estado=EN_PROCESO, intentos=Trabajo.intentos + 1, iniciado_at=ahora, disponible_desde=reserva)
+        )
+        await db.commit()
+        if tomado.rowcount != 1:
+            return None  # Lo tomó otro worker
+        trabajo = await db.get(Trabajo, trabajo_id, populate_existing=True)
+        # Devolver la conexión al pool mientras corre el manejador (que abre su propia sesión)
+        await db.commit()
+        return trabajo
+
+    async def _worker(self, numero: int) -> None:
+        while True:
+            try:
+                self._hay_trabajo.clear()
+                async with AsyncSessionLocal() as db:
+                    trabajo = await self._tomar(db)
+                    if trabajo is not None:
+                        self._avisar_cambio(trabajo.id)
+                        await self._ejecutar(db, trabajo)
+                        continue
+                try:
+                    await asyncio.wait_for(self._hay_trabajo.wait(), settings.TRABAJOS_INTERVALO_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[DEBUG] Worker de trabajos {numero}: {e}")
+                await asyncio.sleep(settings.TRABAJOS_INTERVALO_SEGUNDOS)
+
+    async def _ejecutar(self, db: AsyncSession, trabajo: Trabajo) -> None:
+        try:
+            funcion = MANEJADORES.get(trabajo.tipo)
+            if funcion is None:
+                raise ErrorPermanente(f"Tipo de trabajo desconocido: {trabajo.tipo}")
+            if trabajo.intentos > trabajo.max_intentos:
+                # Se retomó tras vencer la reserva (el proceso anterior se detuvo)
+                raise ErrorPermanente("Se agotaron los intentos")
+            resultado = await asyncio.wait_for(funcion({**trabajo.parametros, PARAMETRO_TRABAJO: trabajo.id}), settings.TRABAJOS_TIMEOUT_SEGUNDOS)
+        except asyncio.CancelledError:
+            # Apagado del proceso: devolver el trabajo a la cola sin gastar el intento
+            await db.rollback()
+            await db.execute(
+                update(Trabajo).where(Trabajo.id == trabajo.id)
+                .values(estado=PENDIENTE, intentos=Trabajo.intentos - 1, disponible_desde=_ahora())
+            )
+            await db.commit()
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            ahora = _ahora()
+            if not isinstance(e, ErrorPermanente) and trabajo.intentos < trabajo.max_intentos:
+                espera = settings.TRABAJOS_BACKOFF_SEGUNDOS * 2 ** (trabajo.intentos - 1)
+                valores = dict(estado=PENDIENTE, error=error, disponible_desde=ahora + timedelta(seconds=espera))
+                print(f"[DEBUG] Trabajo {trabajo.id} ({trabajo.tipo}) falló, reintento en {espera:.0f}s: {error}")
+            else:
+                valores = dict(estado=FALLIDO, error=error, terminado_at=ahora)
+                print(f"[DEBUG] Trabajo {trabajo.id} ({trabajo.tipo}) falló definitivamente: {error}")
+        else:
+            valores = dict(estado=COMPLETADO, resultado=resultado, error=None, terminado_at=_ahora())
+
+        await db.execute(update(Trabajo).where(Trabajo.id == trabajo.id).values(**valores))
+        await db.commit()
+        trabajo = await db.get(Trabajo, trabajo.id, populate_existing=True)
+        self._avisar_cambio(trabajo.id)
+
+        if trabajo.estado == COMPLETADO and trabajo.parametros.get(PARAMETRO_ARCHIVO):
+            # Si falla definitivamente, la entrada se conserva para poder reintentarlo
+            await run_in_threadpool(Path(trabajo.parametros[PARAMETRO_ARCHIVO]).unlink, True)
+        if trabajo.webhook_url and trabajo.estado in (COMPLETADO, FALLIDO):
+            tarea = asyncio.create_task(_enviar_webhook(trabajo.webhook_url, trabajo_a_dict(trabajo)))
+            self._pendientes.add(tarea)
+            tarea.add_done_callback(self._pendientes.discard)
+
+
+cola_trabajos = ColaTrabajos()
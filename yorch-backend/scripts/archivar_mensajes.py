@@ -0,0 +1,49 @@
+"""
+Archiva el historial antiguo del chat.
+
+Mueve los mensajes con más de MENSAJES_RETENCION_DIAS días (o --dias) a la
+tabla mensajes_archivados, comprimidos por conversación. Pensado para correr
+periódicamente (cron), p. ej. una vez al día:
+
+    0 4 * * * cd /ruta/yorch-backend && python scripts/archivar_mensajes.py
+
+Uso (desde yorch-backend/):
+    python scripts/archivar_mensajes.py [--dias 90] [--simular]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main(args) -> int:
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.services.archivo_mensajes import archivar_mensajes, contar_archivables
+
+    dias = args.dias if args.dias is not None else settings.MENSAJES_RETENCION_DIAS
+    antes_de = datetime.now(timezone.utc) - timedelta(days=dias)
+
+    db = SessionLocal()
+    try:
+        if args.simular:
+            print(f"{contar_archivables(db, antes_de)} mensajes anteriores a {antes_de:%Y-%m-%d} por archivar")
+            return 0
+        archivados = archivar_mensajes(db, antes_de, args.tamano_bloque)
+    finally:
+        db.close()
+
+    for conversacion_id, cantidad in sorted(archivados.items()):
+        print(f"{conversacion_id}: {cantidad} mensajes archivados")
+    print(f"Total: {sum(archivados.values())} mensajes anteriores a {antes_de:%Y-%m-%d}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dias", type=int, help="Antigüedad mínima (por defecto MENSAJES_RETENCION_DIAS)")
+    parser.add_argument("--tamano-bloque", type=int, default=500, help="Mensajes por tanda")
+    parser.add_argument("--simular", action="store_true", help="Solo cuenta los mensajes que se archivarían")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""
+Benchmark de latencia del chat bajo carga concurrente, sin red.
+
+Levanta la app en memoria con el modelo falso (LLM_PROVEEDOR=falso) y una base
+SQLite temporal, dispara N mensajes de chat concurrentes y, en paralelo, pings
+a /health. Si el event loop se bloquea durante las llamadas al modelo, la
+latencia de /health se dispara junto con la del chat.
+
+Uso (desde yorch-backend/):
+    python scripts/benchmark_llm.py --peticiones 200 --concurrencia 50 --latencia-ms 800
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(int(round(p / 100 * (len(ordenados) - 1))), len(ordenados) - 1)
+    return ordenados[indice]
+
+
+def resumen(nombre, latencias):
+    print(
+        f"{nombre:<8} n={len(latencias):<5} "
+        f"p50={percentil(latencias, 50) * 1000:8.1f}ms "
+        f"p95={percentil(latencias, 95) * 1000:8.1f}ms "
+        f"p99={percentil(latencias, 99) * 1000:8.1f}ms "
+        f"media={statistics.mean(latencias) * 1000:8.1f}ms"
+    )
+
+
+async def main(args):
+    import httpx
+    from app.core.database import Base, engine
+    from app.core.security import create_access_token
+    from app.main import app
+
+    Base.metadata.create_all(bind=engine)
+    token = create_access_token({"sub": "benchmark"})
+    headers = {"Authorization": f"Bearer {token}"}
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    latencias_chat, latencias_health = [], []
+    terminado = asyncio.Event()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as cliente:
+
+        async def enviar(i):
+            async with semaforo:
+                inicio = time.perf_counter()
+                r = await cliente.post("/api/v1/chat/", json={"mensaje": "qué tengo pendiente"}, headers=headers)
+                r.raise_for_status()
+                latencias_chat.append(time.perf_counter() - inicio)
+
+        async def sondear_health():
+            while not terminado.is_set():
+                inicio = time.perf_counter()
+                await cliente.get("/health")
+                latencias_health.append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.05)
+
+        sonda = asyncio.create_task(sondear_health())
+        inicio_total = time.perf_counter()
+        await asyncio.gather(*(enviar(i) for i in range(args.peticiones)))
+        duracion = time.perf_counter() - inicio_total
+        terminado.set()
+        await sonda
+
+    print(f"{args.peticiones} mensajes, concurrencia {args.concurrencia}, "
+          f"latencia del modelo {args.latencia_ms}ms, {duracion:.2f}s ({args.peticiones / duracion:.1f} req/s)")
+    resumen("chat", latencias_chat)
+    resumen("health", latencias_health)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--latencia-ms", type=int, default=800)
+    args = parser.parse_args()
+
+    # Configurar antes de importar la app
+    db_temporal = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_temporal}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["LLM_PROVEEDOR"] = "falso"
+    os.environ["LLM_FALSO_LATENCIA_MS"] = str(args.latencia_ms)
+
+    asyncio.run(main(args))
@@ -0,0 +1,148 @@
+"""
+Benchmark de las consultas de movimientos pendientes frente al histórico.
+
+Crea una base con unos cientos de movimientos pendientes y va sembrando
+movimientos ya procesados por tandas (hasta 1M por defecto). En cada punto mide
+las consultas calientes: listar todos los pendientes, los pendientes de un
+cliente y marcar procesados los de un cliente (en una transacción que se
+revierte). Con el índice parcial los tiempos deben mantenerse planos aunque el
+histórico crezca; con --sin-indice se ve la diferencia.
+
+Uso (desde yorch-backend/):
+    python scripts/benchmark_pendientes.py --historial 1000000
+    python scripts/benchmark_pendientes.py --database-url postgresql://... --historial 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TANDA = 50_000
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+
+def sembrar(engine, tabla, cantidad, clientes, procesado, inicio):
+    """Inserta `cantidad` movimientos en tandas con executemany."""
+    base = datetime(2024, 1, 1)
+    for desde in range(0, cantidad, TANDA):
+        filas = [
+            {
+                "cliente_id": random.choice(clientes),
+                "tipo": random.choice(("PRESTAMO", "ABONO")),
+                "monto": Decimal(random.randint(1, 500) * 1000),
+                "procesado": procesado,
+                "created_at": base + timedelta(minutes=inicio + desde + i),
+                "procesado_at": base + timedelta(minutes=inicio + desde + i + 60) if procesado else None,
+            }
+            for i in range(min(TANDA, cantidad - desde))
+        ]
+        with engine.begin() as conn:
+            conn.execute(tabla.insert(), filas)
+
+
+def plan(engine, consulta):
+    from sqlalchemy import text
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    dialecto = postgresql.dialect() if engine.dialect.name == "postgresql" else sqlite.dialect()
+    sql = str(consulta.statement.compile(dialect=dialecto, compile_kwargs={"literal_binds": True}))
+    prefijo = "EXPLAIN" if engine.dialect.name == "postgresql" else "EXPLAIN QUERY PLAN"
+    with engine.connect() as conn:
+        filas = conn.execute(text(f"{prefijo} {sql}")).all()
+    return "\n".join("    " + str(fila[-1]) for fila in filas)
+
+
+def main(args):
+    from app.core.database import Base, SessionLocal, engine
+    from app.models import Cliente, MovimientoPendiente
+    from app.services.saldos import marcar_procesados
+
+    random.seed(7)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    tabla = MovimientoPendiente.__table__
+    if args.sin_indice:
+        for indice in list(tabla.indexes):
+            if indice.name != "ix_movimientos_pendientes_id":
+                indice.drop(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(Cliente.__table__.insert(), [
+            {"nombre": f"Cliente {i}", "nombre_normalizado": f"cliente {i}"}
+            for i in range(args.clientes)
+        ])
+    db = SessionLocal()
+    clientes = [c for (c,) in db.query(Cliente.id).all()]
+    cliente_muestra = clientes[len(clientes) // 2]
+    sembrar(engine, tabla, args.pendientes, clientes, False, 0)
+
+    def listar_pendientes():
+        return db.query(MovimientoPendiente).filter(
+            MovimientoPendiente.procesado == False
+        ).order_by(MovimientoPendiente.cliente_id, MovimientoPendiente.created_at).all()
+
+    def pendientes_cliente():
+        return db.query(MovimientoPendiente).filter(
+            MovimientoPendiente.cliente_id == cliente_muestra,
+            MovimientoPendiente.procesado == False
+        ).order_by(MovimientoPendiente.created_at).all()
+
+    def marcar_cliente():
+        marcar_procesados(db, MovimientoPendiente.cliente_id == cliente_muestra)
+        db.rollback()
+
+    print(f"{args.pendientes} pendientes, {args.clientes} clientes, "
+          f"{'sin' if args.sin_indice else 'con'} índice parcial, motor {engine.dialect.name}")
+    print(f"{'histórico':>10} {'listar (ms)':>12} {'cliente (ms)':>13} {'marcar (ms)':>12}")
+
+    puntos = [0] + [int(args.historial / 10 ** k) for k in range(args.pasos - 1, -1, -1)]
+    sembrados = 0
+    for punto in sorted(set(puntos)):
+        sembrar(engine, tabla, punto - sembrados, clientes, True, args.pendientes + sembrados)
+        sembrados = punto
+        db.expire_all()
+        listar = medir(lambda: (listar_pendientes(), db.expunge_all()), args.repeticiones)
+        cliente = medir(lambda: (pendientes_cliente(), db.expunge_all()), args.repeticiones)
+        marcar = medir(marcar_cliente, args.repeticiones)
+        print(f"{sembrados:>10} {listar:>12.2f} {cliente:>13.2f} {marcar:>12.2f}")
+
+    consulta = db.query(MovimientoPendiente).filter(
+        MovimientoPendiente.cliente_id == cliente_muestra,
+        MovimientoPendiente.procesado == False
+    ).order_by(MovimientoPendiente.created_at)
+    print("Plan de 'pendientes de un cliente':")
+    print(plan(engine, consulta))
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--historial", type=int, default=1_000_000, help="Movimientos procesados a sembrar")
+    parser.add_argument("--pasos", type=int, default=4, help="Puntos de medición (escala logarítmica)")
+    parser.add_argument("--pendientes", type=int, default=500)
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--sin-indice", action="store_true", help="Borra los índices secundarios para comparar")
+    parser.add_argument("--database-url", help="Base a usar (se borran sus tablas); por defecto SQLite temporal")
+    args = parser.parse_args()
+
+    # Configurar antes de importar la app
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    main(args)
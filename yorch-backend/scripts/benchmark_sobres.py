@@ -0,0 +1,135 @@
+"""
+Benchmark de la lectura del nombre en el sobre (POST /sobres/extraer-nombre), sin red.
+
+Genera una foto sintética del tamaño de una cámara de celular (12 MP, con
+orientación EXIF) y la envía N veces con y sin el preprocesado previo a
+Gemini Vision (SOBRE_OCR_PREPROCESAR). Mide los bytes que recibe el modelo y
+la latencia de extremo a extremo contra el modelo falso, al que se le suma
+una latencia por MB enviado (--ms-por-mb) para simular la subida a Gemini.
+
+Uso (desde yorch-backend/):
+    python scripts/benchmark_sobres.py --peticiones 40 --concurrencia 8 --ms-por-mb 150
+    python scripts/benchmark_sobres.py --recorte 0,0,1,0.5
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(int(round(p / 100 * (len(ordenados) - 1))), len(ordenados) - 1)
+    return ordenados[indice]
+
+
+def foto_de_prueba(ancho: int, alto: int) -> bytes:
+    """Foto con grano de cámara, un rótulo escrito y orientación EXIF 6 (celular vertical)."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    canales = [Image.effect_noise((ancho, alto), sigma).filter(ImageFilter.GaussianBlur(1)) for sigma in (30, 35, 40)]
+    imagen = Image.merge("RGB", canales)
+    dibujo = ImageDraw.Draw(imagen)
+    dibujo.rectangle((ancho // 8, alto // 8, ancho * 7 // 8, alto * 3 // 8), fill=(235, 225, 200))
+    dibujo.text((ancho // 6, alto // 5), "Arteaga Romero Jefersson", fill=(20, 20, 60), font_size=alto // 15)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=92, exif=exif)
+    return salida.getvalue()
+
+
+async def medir(cliente, headers, foto, args):
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    latencias = []
+
+    async def enviar():
+        async with semaforo:
+            inicio = time.perf_counter()
+            r = await cliente.post(
+                "/api/v1/sobres/extraer-nombre",
+                files={"file": ("sobre.jpg", foto, "image/jpeg")},
+                headers=headers,
+            )
+            r.raise_for_status()
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio_total = time.perf_counter()
+    await asyncio.gather(*(enviar() for _ in range(args.peticiones)))
+    return latencias, time.perf_counter() - inicio_total
+
+
+async def main(args):
+    import httpx
+    from app.core.config import settings
+    from app.core.database import Base, engine
+    from app.core.security import create_access_token
+    from app.main import app
+    from app.services.llm import obtener_cliente_llm
+
+    Base.metadata.create_all(bind=engine)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'benchmark'})}"}
+
+    # Registrar cuántos bytes recibe el modelo en cada llamada
+    modelo = obtener_cliente_llm().modelo
+    enviados = []
+    generar_original = modelo.generate_content_async
+
+    async def generar_midiendo(contenido, **opciones):
+        enviados.append(modelo.bytes_enviados(contenido))
+        return await generar_original(contenido, **opciones)
+
+    modelo.generate_content_async = generar_midiendo
+
+    foto = foto_de_prueba(args.ancho, args.alto)
+    print(f"Foto de prueba {args.ancho}x{args.alto}: {len(foto) / 1024 / 1024:.2f} MB, "
+          f"{args.peticiones} peticiones, concurrencia {args.concurrencia}, "
+          f"modelo falso {args.latencia_ms}ms + {args.ms_por_mb}ms/MB")
+
+    modos = [("original", False, ""), ("preprocesada", True, "")]
+    if args.recorte:
+        modos.append(("recortada", True, args.recorte))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as cliente:
+        for nombre, preprocesar, recorte in modos:
+            settings.SOBRE_OCR_PREPROCESAR = preprocesar
+            settings.SOBRE_OCR_RECORTE = recorte
+            enviados.clear()
+            latencias, duracion = await medir(cliente, headers, foto, args)
+            print(
+                f"{nombre:<13} enviado={statistics.mean(enviados) / 1024:9.1f} KB "
+                f"p50={percentil(latencias, 50) * 1000:8.1f}ms "
+                f"p95={percentil(latencias, 95) * 1000:8.1f}ms "
+                f"media={statistics.mean(latencias) * 1000:8.1f}ms "
+                f"({args.peticiones / duracion:.1f} req/s)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=40)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--latencia-ms", type=int, default=800)
+    parser.add_argument("--ms-por-mb", type=int, default=150, help="Latencia extra del modelo por MB enviado")
+    parser.add_argument("--ancho", type=int, default=4032)
+    parser.add_argument("--alto", type=int, default=3024)
+    parser.add_argument("--recorte", default="", help="Medir también con SOBRE_OCR_RECORTE (p. ej. 0,0,1,0.5)")
+    args = parser.parse_args()
+
+    # Configurar antes de importar la app
+    db_temporal = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_temporal}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["LLM_PROVEEDOR"] = "falso"
+    os.environ["LLM_FALSO_LATENCIA_MS"] = str(args.latencia_ms)
+    os.environ["LLM_FALSO_MS_POR_MB"] = str(args.ms_por_mb)
+    os.environ["TRABAJOS_WORKERS"] = "0"
+
+    asyncio.run(main(args))
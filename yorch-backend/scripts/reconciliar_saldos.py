@@ -0,0 +1,47 @@
+"""
+Reconciliación de saldos_clientes contra movimientos_pendientes.
+
+Recalcula los saldos de cada cliente desde los movimientos crudos y muestra
+las filas que no coinciden. Con --corregir las reescribe y hace commit. Pensado
+para correr periódicamente (cron) o después de una carga manual de datos.
+
+Uso (desde yorch-backend/):
+    python scripts/reconciliar_saldos.py [--corregir]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main(args) -> int:
+    from app.core.database import SessionLocal
+    from app.services.saldos import reconciliar_saldos
+
+    db = SessionLocal()
+    try:
+        diferencias = reconciliar_saldos(db, corregir=args.corregir)
+        for item in diferencias:
+            detalle = ", ".join(
+                f"{columna}: {valores['actual']} -> {valores['esperado']}"
+                for columna, valores in item["diferencias"].items()
+            )
+            print(f"Cliente {item['cliente_id']}: {detalle}")
+        if args.corregir:
+            db.commit()
+    finally:
+        db.close()
+
+    if not diferencias:
+        print("Saldos consistentes")
+        return 0
+    accion = "corregidos" if args.corregir else "con diferencias"
+    print(f"{len(diferencias)} clientes {accion}")
+    return 0 if args.corregir else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corregir", action="store_true", help="Reescribe los saldos que no coinciden")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+"""
+Reconciliación de uploads/sobres contra las imágenes que usan los clientes.
+
+Las peticiones no borran imágenes (una subida concurrente de la misma imagen
+podría estar por referenciarla). Este script muestra las que ya no usa ningún
+cliente, las variantes sin imagen y las imágenes en uso sin variantes. Con
+--corregir borra las primeras (solo las guardadas hace más de --gracia
+segundos) y genera las variantes que faltan. Pensado para correr
+periódicamente (cron).
+
+Uso (desde yorch-backend/):
+    python scripts/reconciliar_sobres.py [--corregir] [--gracia SEGUNDOS]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main(args) -> int:
+    from app.core.database import SessionLocal
+    from app.services.almacen_sobres import reconciliar_sobres
+
+    db = SessionLocal()
+    try:
+        resultado = reconciliar_sobres(db, gracia_segundos=args.gracia, corregir=args.corregir)
+    finally:
+        db.close()
+
+    for categoria, nombres in resultado.items():
+        for nombre in nombres:
+            print(f"{categoria}: {nombre}")
+
+    total = sum(len(nombres) for nombres in resultado.values())
+    if not total:
+        print("Sobres consistentes")
+        return 0
+    accion = "corregidos" if args.corregir else "con diferencias"
+    print(f"{total} archivos {accion}")
+    return 0 if args.corregir else 1
+
+
+if __name__ == "__main__":
+    from app.services.almacen_sobres import GRACIA_SEGUNDOS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corregir", action="store_true", help="Borra los archivos sin uso y genera las variantes faltantes")
+    parser.add_argument(
+        "--gracia", type=int, default=GRACIA_SEGUNDOS,
+        help=f"Segundos desde el último guardado antes de borrar una imagen sin uso (por defecto {GRACIA_SEGUNDOS})"
+    )
+    sys.exit(main(parser.parse_args()))
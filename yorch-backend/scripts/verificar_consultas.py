@@ -0,0 +1,80 @@
+"""
+Verifica que las rutas de lectura no hagan consultas N+1.
+
+Levanta la app con una base SQLite temporal y MAX_CONSULTAS_POR_PETICION
+activo, siembra clientes y movimientos, y recorre las rutas de lectura más el
+comando LISTAR_PENDIENTES del chat. Como el número de consultas no debe
+depender de cuántas filas hay, el límite es fijo: si alguna ruta lo supera la
+app responde 500 y el script termina con código 1.
+
+Uso (desde yorch-backend/):
+    python scripts/verificar_consultas.py [--limite 10] [--clientes 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main(args) -> int:
+    from decimal import Decimal
+    from fastapi.testclient import TestClient
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.security import create_access_token
+    from app.main import app
+    from app.models import Cliente, MovimientoPendiente
+    from app.services.saldos import registrar_movimiento
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for i in range(args.clientes):
+        registro = Cliente(nombre=f"Cliente Prueba {i}")
+        db.add(registro)
+        db.flush()
+        for tipo in ("PRESTAMO", "ABONO"):
+            movimiento = MovimientoPendiente(cliente_id=registro.id, tipo=tipo, monto=Decimal("1000"))
+            db.add(movimiento)
+            registrar_movimiento(db, movimiento)
+    db.commit()
+    db.close()
+
+    cliente = TestClient(app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'verificacion'})}"}
+
+    rutas = [
+        ("GET", "/api/v1/clientes/", None),
+        ("GET", "/api/v1/movimientos/", None),
+        ("GET", "/api/v1/movimientos/pendientes", None),
+        ("GET", "/api/v1/movimientos/saldos", None),
+        ("GET", "/api/v1/sobres/pendientes", None),
+        ("GET", "/api/v1/escrituras/", None),
+        ("POST", "/api/v1/chat/", {"mensaje": "qué tengo pendiente"}),
+    ]
+    fallos = 0
+    for metodo, ruta, cuerpo in rutas:
+        r = cliente.request(metodo, ruta, json=cuerpo, headers=headers)
+        consultas = r.headers.get("X-Consultas-SQL", "?")
+        estado = "OK" if r.status_code < 400 else "FALLA"
+        print(f"{estado:<6} {metodo:<5} {ruta:<35} {r.status_code} consultas={consultas}")
+        if r.status_code >= 400:
+            fallos += 1
+            print(f"       {r.json().get('detail')}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limite", type=int, default=10, help="Máximo de consultas por petición")
+    parser.add_argument("--clientes", type=int, default=50)
+    args = parser.parse_args()
+
+    # Configurar antes de importar la app
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'verificacion.db')}"
+    os.environ.setdefault("SECRET_KEY", "verificacion")
+    os.environ["LLM_PROVEEDOR"] = "falso"
+    os.environ["LLM_FALSO_LATENCIA_MS"] = "0"
+    os.environ["MAX_CONSULTAS_POR_PETICION"] = str(args.limite)
+
+    sys.exit(main(args))
@@ -0,0 +1,51 @@
+"""
+Verificación del manifiesto de escrituras (escritura_archivos) contra el disco.
+
+Compara cada escritura con su carpeta en uploads/escrituras/ y muestra los
+archivos que faltan en disco o en la tabla, los que cambiaron de tamaño (o de
+hash, con --hash), los temporales de subidas cortadas, las cantidad_archivos
+desactualizadas y las carpetas sin escritura. Con --corregir ajusta la tabla
+y hace commit (las carpetas huérfanas solo se reportan). Si al aplicar la
+migración de escritura_archivos faltaba alguna carpeta, --corregir registra
+esas escrituras.
+
+Uso (desde yorch-backend/):
+    python scripts/verificar_escrituras.py [--hash] [--corregir]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main(args) -> int:
+    from app.core.database import SessionLocal
+    from app.routers.escrituras import UPLOADS_DIR
+    from app.services.archivos_escritura import verificar_escrituras
+
+    db = SessionLocal()
+    try:
+        problemas = verificar_escrituras(db, UPLOADS_DIR, corregir=args.corregir, verificar_hash=args.hash)
+        for item in problemas:
+            origen = f"Escritura {item['escritura_id']}" if item["escritura_id"] else "Carpeta"
+            detalle = " ".join(str(v) for v in (item["archivo"], item["detalle"]) if v)
+            print(f"{origen} ({item['carpeta']}): {item['problema']} {detalle}".rstrip())
+        if args.corregir:
+            db.commit()
+    finally:
+        db.close()
+
+    if not problemas:
+        print("Escrituras consistentes")
+        return 0
+    accion = "corregidos" if args.corregir else "encontrados"
+    print(f"{len(problemas)} problemas {accion}")
+    return 0 if args.corregir else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hash", action="store_true", help="Compara también el sha256 (lee todos los archivos)")
+    parser.add_argument("--corregir", action="store_true", help="Ajusta la tabla a lo que hay en disco")
+    sys.exit(main(parser.parse_args()))
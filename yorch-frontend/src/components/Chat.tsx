@@ -24,6 +24,8 @@ export default function Chat() {
   const [loading, setLoading] = useState(false)
   const [selectedImage, setSelectedImage] = useState<string | null>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
+  // Conversación propia de esta pantalla: el agente solo ve su historial
+  const conversacionId = useRef(`${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`)
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
@@ -48,7 +50,7 @@ export default function Chat() {
     setLoading(true)
 
     try {
-      const response: ChatResponse = await enviarMensaje(input)
+      const response: ChatResponse = await enviarMensaje(input, conversacionId.current)
 
       const assistantMessage: Message = {
         id: Date.now() + 1,
@@ -100,10 +102,10 @@ export default function Chat() {
               {message.imagen_url && (
                 <div className="mt-2">
                   <img
-                    src={`${API_BASE_URL}${message.imagen_url}?t=${Date.now()}`}
+                    src={`${API_BASE_URL}${message.imagen_url}?variante=miniatura`}
                     alt="Sobre del cliente"
                     className="w-32 h-32 sm:w-40 sm:h-40 object-cover rounded cursor-pointer hover:opacity-80 hover:scale-105 transition-all border-2 border-gray-200"
-                    onClick={() => setSelectedImage(`${API_BASE_URL}${message.imagen_url}?t=${Date.now()}`)}
+                    onClick={() => setSelectedImage(`${API_BASE_URL}${message.imagen_url}`)}
                   />
                   <p className="text-xs text-gray-500 mt-1">Toca para ampliar</p>
                 </div>
@@ -159,13 +159,20 @@ export interface Escritura {
   notas?: string
   cantidad_archivos: number
   created_at: string
+  // Miniatura WebP del primer archivo (usar con API_BASE_URL)
+  portada_url?: string | null
 }
 
 export interface EscrituraDetalle extends Escritura {
   archivos: {
     nombre: string
     url: string
+    miniatura_url: string
+    vista_url: string
     tipo: 'pdf' | 'imagen'
+    mime: string
+    tamano: number
+    paginas: number | null
   }[]
 }
 
@@ -183,18 +190,20 @@ export interface CrearEscrituraResponse {
 
 // ==================== CHAT ====================
 
-export async function enviarMensaje(mensaje: string): Promise<ChatResponse> {
+// Cada pantalla de chat usa su propia conversación; sin id se usa la conversación 'general'
+export async function enviarMensaje(mensaje: string, conversacionId?: string): Promise<ChatResponse> {
   const response = await fetch(`${API_URL}/chat/`, {
     method: 'POST',
     headers: authHeaders('application/json'),
-    body: JSON.stringify({ mensaje }),
+    body: JSON.stringify(conversacionId ? { mensaje, conversacion_id: conversacionId } : { mensaje }),
   })
   return handleResponse<ChatResponse>(response)
 }
 
-export async function enviarMensajeVoz(audioBlob: Blob): Promise<VozResponse> {
+export async function enviarMensajeVoz(audioBlob: Blob, conversacionId?: string): Promise<VozResponse> {
   const formData = new FormData()
   formData.append('audio', audioBlob, 'audio.webm')
+  if (conversacionId) formData.append('conversacion_id', conversacionId)
 
   const response = await fetch(`${API_URL}/chat/voz`, {
     method: 'POST',
@@ -230,11 +239,27 @@ export async function marcarProcesado(movimientoId: number): Promise<void> {
 
 // ==================== CLIENTES ====================
 
+// Recorre un listado paginado por cursor (cabecera X-Next-Cursor) hasta el final
+async function obtenerTodasLasPaginas<T>(url: string): Promise<T[]> {
+  const elementos: T[] = []
+  let cursor: string | null = null
+  do {
+    const pagina = new URL(url)
+    pagina.searchParams.set('limit', '500')
+    if (cursor) {
+      pagina.searchParams.set('cursor', cursor)
+    }
+    const response = await fetch(pagina.toString(), {
+      headers: authHeaders(),
+    })
+    elementos.push(...(await handleResponse<T[]>(response)))
+    cursor = response.headers.get('X-Next-Cursor')
+  } while (cursor)
+  return elementos
+}
+
 export async function obtenerClientes(): Promise<Cliente[]> {
-  const response = await fetch(`${API_URL}/clientes/`, {
-    headers: authHeaders(),
-  })
-  return handleResponse<Cliente[]>(response)
+  return obtenerTodasLasPaginas<Cliente>(`${API_URL}/clientes/`)
 }
 
 export async function actualizarCliente(clienteId: number, datos: { nombre?: string }): Promise<Cliente> {
@@ -336,10 +361,7 @@ export async function crearEscritura(
 }
 
 export async function listarEscrituras(): Promise<Escritura[]> {
-  const response = await fetch(`${API_URL}/escrituras`, {
-    headers: authHeaders(),
-  })
-  return handleResponse<Escritura[]>(response)
+  return obtenerTodasLasPaginas<Escritura>(`${API_URL}/escrituras`)
 }
 
 export async function obtenerEscritura(id: number): Promise<EscrituraDetalle> {